@@ -0,0 +1,637 @@
+"""Benchmarks of dhs_scraper's performance-sensitive code paths
+
+Usage: python benchmarks.py <benchmark_name> [arguments]
+for example: python benchmarks.py parse dhs_all_articles_fr.jsonl 500
+(jsonl can be block-compressed: dhs_all_articles_fr.jsonl.zst)
+
+Benchmarks taking a jsonl need articles saved with their page_content (default of stream_to_jsonl()),
+they never access the network.
+python benchmarks.py check verifies that the optimized code paths give the same results as the legacy ones
+on the saved pages of fixtures/pages (or of a jsonl), exiting with status 1 otherwise.
+"""
+# %%
+
+import json
+from os import path
+import sys
+from time import perf_counter
+import tracemalloc
+
+from lxml import html
+from lxml.etree import iselement
+
+from dhs_scraper import DhsArticle, DhsTag
+from dhs_scraper.compressed_jsonl import iterate_jsonl_lines
+from dhs_scraper.css_selectors import enable_selectors_timing, print_selectors_statistics
+from dhs_scraper.utils import get_text_and_links, lxml_depth_first_iterator, is_text_or_link
+
+
+def measure(func, *args, **kwargs):
+    """Returns (func result, elapsed seconds, peak traced memory in bytes)
+
+    func is run twice: once timed, once with tracemalloc (which slows it down) for memory."""
+    start = perf_counter()
+    result = func(*args, **kwargs)
+    elapsed = perf_counter()-start
+    del result
+    tracemalloc.start()
+    result = func(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+
+# saved DHS pages named <language>_<id>_<version>.html
+FIXTURE_PAGES_FOLDER = path.join(path.dirname(path.abspath(__file__)), "fixtures", "pages")
+
+
+def load_fixture_pages():
+    """Returns a list of (language, id, version, page_content) of the pages of FIXTURE_PAGES_FOLDER"""
+    from glob import glob
+    saved_pages = []
+    for page_filepath in sorted(glob(path.join(FIXTURE_PAGES_FOLDER, "*.html"))):
+        language, id, version = path.basename(page_filepath)[:-len(".html")].split("_")
+        with open(page_filepath, encoding="utf-8") as page_file:
+            saved_pages.append((language, id, version, page_file.read()))
+    return saved_pages
+
+def load_saved_pages(jsonl_filepath, max_nb_articles=None):
+    """Returns a list of (language, id, version, page_content) from a jsonl of articles saved with their page_content"""
+    saved_pages = []
+    for line in iterate_jsonl_lines(jsonl_filepath):
+        json_dict = json.loads(line)
+        if json_dict.get("page_content"):
+            saved_pages.append((json_dict["language"], json_dict["id"], json_dict["version"], json_dict["page_content"]))
+            if max_nb_articles is not None and len(saved_pages)>=max_nb_articles:
+                break
+    if len(saved_pages)==0:
+        raise Exception(f"benchmarks.load_saved_pages(): no article with page_content in {jsonl_filepath}")
+    return saved_pages
+
+
+# %%
+
+class LegacyTextElementsDhsArticle(DhsArticle):
+    """DhsArticle with get_page_text_elements() as before the single-parse extraction:
+    destructive removal of .media-content and re-parse of the whole page on each call"""
+    def get_page_text_elements(self):
+        self.download_page()
+        for tre in self._pagetree.cssselect(".media-content"):
+            tre.getparent().remove(tre)
+        elements = self._pagetree.cssselect(".hls-article-text-unit p, h1, h2, .hls-article-text-unit h3, .hls-article-text-unit h4")
+        self._pagetree = html.fromstring(self.page_content)
+        return elements
+
+def parse_saved_pages_offline(saved_pages, article_class=DhsArticle):
+    """Runs all the parse_XX methods of parse_article() but parse_metagrid(), which needs the network"""
+    articles = []
+    for language, id, version, page_content in saved_pages:
+        article = article_class(language, id, version)
+        article.page_content = page_content
+        article.parse_title()
+        article.parse_authors_translators()
+        article.parse_text_blocks()
+        article.parse_text()
+        article.parse_text_links()
+        article.parse_sources()
+        article.parse_notice_links()
+        article.parse_bref()
+        article.parse_tags()
+        articles.append(article)
+    return articles
+
+def benchmark_parse(jsonl_filepath, max_nb_articles=None):
+    """Compares parse time, allocations and nb of html parses between legacy and single-parse text extraction"""
+    saved_pages = load_saved_pages(jsonl_filepath, int(max_nb_articles) if max_nb_articles else None)
+    original_fromstring = html.fromstring
+    for name, article_class in [("legacy re-parse", LegacyTextElementsDhsArticle), ("single parse", DhsArticle)]:
+        nb_fromstring_calls = [0]
+        def counting_fromstring(*args, **kwargs):
+            nb_fromstring_calls[0] += 1
+            return original_fromstring(*args, **kwargs)
+        html.fromstring = counting_fromstring
+        try:
+            articles, elapsed, peak = measure(parse_saved_pages_offline, saved_pages, article_class)
+        finally:
+            html.fromstring = original_fromstring
+        print(f"{name}: {len(articles)} articles in {elapsed:.3f}s ({len(articles)/elapsed:.1f} articles/s), "+
+            f"{nb_fromstring_calls[0]/(2*len(articles)):.1f} html parses/article, peak memory {peak/1e6:.1f}MB")
+
+def benchmark_selectors(jsonl_filepath, max_nb_articles=None):
+    """Prints the cumulative time and matches of each css selector when parsing saved pages"""
+    saved_pages = load_saved_pages(jsonl_filepath, int(max_nb_articles) if max_nb_articles else None)
+    enable_selectors_timing()
+    start = perf_counter()
+    parse_saved_pages_offline(saved_pages)
+    print(f"parsed {len(saved_pages)} articles in {perf_counter()-start:.3f}s, time spent per selector:")
+    print_selectors_statistics()
+    enable_selectors_timing(False)
+
+def legacy_text_and_links(text_element):
+    """text and links offsets as computed before get_text_and_links(): recursive XPath walk and 3 text_content() per link"""
+    index_accumulator = 0
+    links = []
+    for node in lxml_depth_first_iterator(text_element, is_text_or_link):
+        if iselement(node):
+            links.append((index_accumulator, index_accumulator+len(node.text_content()), node.text_content(), node.get("href")))
+            index_accumulator += len(node.text_content())
+        else:
+            index_accumulator += len(node)
+    return text_element.text_content(), links
+
+def single_pass_text_and_links(text_element):
+    text, links = get_text_and_links(text_element)
+    return text, [(start, end, text[start:end], link_element.get("href")) for start, end, link_element in links]
+
+def benchmark_text_walk(jsonl_filepath=None, max_nb_articles=None):
+    """Checks that the single-pass walker gives the same text and links as the legacy one and compares their speed,
+    on the fixture pages if no jsonl is given"""
+    saved_pages = load_saved_pages(jsonl_filepath, int(max_nb_articles) if max_nb_articles else None) if jsonl_filepath else load_fixture_pages()
+    text_elements = []
+    for language, id, version, page_content in saved_pages:
+        article = DhsArticle(language, id, version)
+        article.page_content = page_content
+        text_elements += article.get_page_text_elements()
+    results = {}
+    for name, walk in [("legacy recursive walk", legacy_text_and_links), ("single pass walk", single_pass_text_and_links)]:
+        start = perf_counter()
+        results[name] = [walk(te) for te in text_elements]
+        elapsed = perf_counter()-start
+        print(f"{name}: {len(text_elements)} text elements in {elapsed:.3f}s ({len(saved_pages)/elapsed:.1f} articles/s)")
+    legacy_results, single_pass_results = results.values()
+    nb_differences = sum(1 for l, s in zip(legacy_results, single_pass_results) if l!=s)
+    print(f"{nb_differences} text elements with different results")
+
+
+# %%
+
+def benchmark_index(jsonl_filepath, nb_articles_to_load=500):
+    """Compares loading nb_articles_to_load random articles by id with a full scan and through the JsonlIndex"""
+    import random
+    from dhs_scraper.jsonl_index import JsonlIndex
+    start = perf_counter()
+    index = JsonlIndex(jsonl_filepath)
+    print(f"index of {len(index)} lines loaded/built in {perf_counter()-start:.3f}s")
+    ids_to_keep = set(random.sample(list(set(index.ids)), min(int(nb_articles_to_load), len(set(index.ids)))))
+    for name, use_index in [("full scan", False), ("index", True)]:
+        start = perf_counter()
+        articles = list(DhsArticle.load_articles_from_jsonl(jsonl_filepath, ids_to_keep=ids_to_keep, use_index=use_index))
+        print(f"{name}: loaded {len(articles)} articles in {perf_counter()-start:.3f}s")
+
+
+# %%
+
+def benchmark_json(jsonl_filepath, max_nb_articles=None):
+    """Compares DhsArticle.to_json() and load from json lines with each json backend"""
+    from dhs_scraper import json_codec
+    indices_to_keep = set(range(int(max_nb_articles))) if max_nb_articles else set()
+    articles = list(DhsArticle.load_articles_from_jsonl(jsonl_filepath, indices_to_keep=indices_to_keep))
+    initial_backend = json_codec.get_json_backend()
+    for backend in json_codec.JSON_BACKENDS:
+        try:
+            json_codec.set_json_backend(backend)
+        except Exception as e:
+            print(f"{backend}: skipped, {e}")
+            continue
+        start = perf_counter()
+        lines = [article.to_json(ensure_ascii=False) for article in articles]
+        encode_elapsed = perf_counter()-start
+        start = perf_counter()
+        for line in lines:
+            DhsArticle.from_json(json_codec.loads(line))
+        decode_elapsed = perf_counter()-start
+        print(f"{backend}: encode {len(articles)/encode_elapsed:.1f} articles/s, decode {len(articles)/decode_elapsed:.1f} articles/s, "+
+            f"{sum(len(l) for l in lines)/1e6:.1f}MB of json")
+    json_codec.set_json_backend(initial_backend)
+
+def benchmark_lazy(jsonl_filepath):
+    """Compares eager and lazy loading of a jsonl, keeping all the articles and selecting those with a given tag"""
+    def load_all(lazy):
+        return list(DhsArticle.load_articles_from_jsonl(jsonl_filepath, lazy=lazy))
+    def load_articles_with_first_tag(lazy):
+        articles = DhsArticle.load_articles_from_jsonl(jsonl_filepath, lazy=lazy)
+        articles_with_tags = [a for a in articles if len(getattr(a, "tags", []))>0]
+        first_tag = articles_with_tags[0].tags[0] if len(articles_with_tags)>0 else None
+        return [a for a in articles_with_tags if first_tag in a.tags]
+    for name, lazy in [("eager", False), ("lazy", True)]:
+        for task_name, task in [("all articles", load_all), ("articles having the first tag", load_articles_with_first_tag)]:
+            articles, elapsed, peak = measure(task, lazy)
+            print(f"{name} {task_name}: {len(articles)} articles in {elapsed:.3f}s ({len(articles)/elapsed:.1f} articles/s), peak memory {peak/1e6:.1f}MB")
+
+def benchmark_memory(jsonl_filepath):
+    """Compares the memory retained by all the articles of a jsonl loaded eagerly, eagerly then compacted, and lazily"""
+    def retained_memory(load):
+        tracemalloc.start()
+        articles = load()
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return articles, current
+    for name, load in [
+        ("eager", lambda: list(DhsArticle.load_articles_from_jsonl(jsonl_filepath))),
+        ("eager compacted", lambda: [a.compact() for a in DhsArticle.load_articles_from_jsonl(jsonl_filepath)]),
+        ("lazy", lambda: list(DhsArticle.load_articles_from_jsonl(jsonl_filepath, lazy=True))),
+    ]:
+        articles, current = retained_memory(load)
+        print(f"{name}: {len(articles)} articles retain {current/1e6:.1f}MB ({current/max(len(articles), 1)/1e3:.1f}kB/article)")
+    tags = [t for a in articles for t in getattr(a, "tags", [])]
+    print(f"{len(tags)} tag references to {len(set(id(t) for t in tags))} DhsTag instances")
+
+def legacy_get_articles_per_tag(articles):
+    """DhsTag.get_articles_per_tag() before the single pass: scans all the articles for each tag"""
+    utags = set(t for a in articles for t in a.tags)
+    articles_tags = [(a,set(a.tags)) for a in articles]
+    return [(t, [a for a, atags in articles_tags if t in atags]) for t in utags]
+
+def benchmark_tags(jsonl_filepath):
+    """Compares grouping the articles of a jsonl per tag with the legacy quadratic scan, the single pass and a TagIndex,
+    and times building their tag tree"""
+    from dhs_scraper import TagIndex, tag_tree
+    articles = [a for a in DhsArticle.load_articles_from_jsonl(jsonl_filepath) if "tags" in a.__dict__]
+    results = {}
+    for name, get_articles_per_tag in [
+        ("legacy", legacy_get_articles_per_tag),
+        ("single pass", DhsTag.get_articles_per_tag),
+        ("TagIndex", lambda articles: TagIndex(articles).get_articles_per_tag()),
+    ]:
+        start = perf_counter()
+        articles_per_tag = get_articles_per_tag(articles)
+        elapsed = perf_counter()-start
+        results[name] = {t.tag: [a.id for a in tag_articles] for t, tag_articles in articles_per_tag}
+        print(f"{name}: {len(articles_per_tag)} tags of {len(articles)} articles in {elapsed:.3f}s")
+    print("same articles per tag: "+str(all(r==results["legacy"] for r in results.values())))
+    tag_occurrences = [t for a in articles for t in a.tags]
+    start = perf_counter()
+    tag_tree_root = tag_tree.build_tag_tree(tag_occurrences)
+    build_elapsed = perf_counter()-start
+    start = perf_counter()
+    tag_tree.add_articles_to_tag_tree(tag_tree_root, articles)
+    print(f"tag tree of {len(tag_tree_root.nodes_by_path)} nodes built from {len(tag_occurrences)} tag occurrences in {build_elapsed:.3f}s, "+
+        f"articles added in {perf_counter()-start:.3f}s")
+
+def get_synthetic_tags(nb_children_per_level=(20, 30, 6)):
+    """Returns DhsTag of a synthetic tag tree with nb_children_per_level[i] children per node at level i"""
+    from dhs_scraper import DhsTag
+    tags = []
+    paths = [([], [])]
+    for nb_children in nb_children_per_level:
+        paths = [(levels+[f"L{len(levels)}-{i}"], facets+[f"{i:06d}"]) for levels, facets in paths for i in range(nb_children)]
+        tags.extend(DhsTag(" / ".join(levels), "/fr/search/category?f_hls.lexicofacet_string=1."+".".join(facets)+".") for levels, facets in paths)
+    return tags
+
+def get_synthetic_articles(tags, nb_articles, max_nb_tags_per_article=4, seed=0):
+    """Returns nb_articles DhsArticle with 1 to max_nb_tags_per_article random tags"""
+    import random
+    random.seed(seed)
+    articles = []
+    for i in range(nb_articles):
+        article = DhsArticle("fr", f"{i:06d}")
+        article.tags = random.sample(tags, random.randint(1, max_nb_tags_per_article))
+        articles.append(article)
+    return articles
+
+def benchmark_statistics(nb_articles=30000):
+    """Compares tag tree per-category statistics computed with sets of articles and with CategoryStatistics,
+    on a synthetic tree of 4k nodes and articles in random categories"""
+    import random
+    from dhs_scraper import DHS_ARTICLE_CATEGORIES, CategoryStatistics, TagIndex, tag_tree
+    tags = get_synthetic_tags()
+    articles = get_synthetic_articles(tags, int(nb_articles))
+    article_ids_by_category = {c: set() for c in DHS_ARTICLE_CATEGORIES}
+    for a in articles:
+        article_ids_by_category[random.choice(DHS_ARTICLE_CATEGORIES)].add(a.id)
+    tag_index = TagIndex(articles)
+    def get_tag_tree():
+        tag_tree_root = tag_tree.build_tag_tree(tags)
+        tag_tree.add_articles_to_tag_tree(tag_tree_root, tag_index=tag_index)
+        return tag_tree_root
+    def sets_statistics(tag_tree_root):
+        tag_tree.compute_nodes_statistics(tag_tree_root,
+            tag_tree.stats_articles_by_category_proportions_curry(article_ids_by_category, DHS_ARTICLE_CATEGORIES),
+            tag_tree.stats_aggregator_articles_by_category_proportions
+        )
+        return tag_tree_root
+    def arrays_statistics(tag_tree_root):
+        CategoryStatistics(tag_tree_root, article_ids_by_category, DHS_ARTICLE_CATEGORIES).set_nodes_statistics()
+        return tag_tree_root
+    results = {}
+    for name, statistics in [("sets", sets_statistics), ("CategoryStatistics", arrays_statistics)]:
+        # the tree is built beforehand: only the statistics are measured
+        tag_tree_root, elapsed, peak = measure(statistics, get_tag_tree())
+        results[name] = [
+            {c: len(v) if name=="sets" else v for c, v in node[key].items()}
+            for node in tag_tree.iterate_nodes(tag_tree_root) for key in ["statistics", "total_statistics"]
+        ]
+        print(f"{name}: statistics of {len(tag_index.tags)+1} nodes and {len(articles)} articles in {elapsed:.3f}s, peak memory {peak/1e6:.1f}MB")
+    print(f"same counts of all nodes: {results['sets']==results['CategoryStatistics']}")
+
+def legacy_traverse_depth_first(node, recursive_function):
+    """tag_tree.traverse_depth_first() before the iterative traversal"""
+    children_result = [legacy_traverse_depth_first(n, recursive_function) for n in node["children"]] if "children" in node else []
+    return recursive_function(node, children_result)
+
+def legacy_modify_node_property(tag_tree_root, property, modifier_func):
+    """tag_tree.modify_node_property() before the snapshot: the revert function traverses the tree again and list.pop(0)s"""
+    original_articles_sequential = []
+    def apply_to_node(node, cr_unused):
+        original_articles_sequential.append(node[property])
+        node[property] = modifier_func(node[property])
+    legacy_traverse_depth_first(tag_tree_root, apply_to_node)
+    def revert_node(node, cr_unused):
+        node[property] = original_articles_sequential.pop(0)
+    def revert():
+        legacy_traverse_depth_first(tag_tree_root, revert_node)
+    return revert
+
+def benchmark_traversal(nb_children_per_level="40,50,60"):
+    """Compares the legacy recursive and the iterative tag tree traversals on a synthetic tree (default 122k nodes)"""
+    from dhs_scraper import tag_tree
+    tags = get_synthetic_tags([int(n) for n in nb_children_per_level.split(",")])
+    tag_tree_root = tag_tree.build_tag_tree(tags)
+    tag_tree.traverse_depth_first(tag_tree_root, lambda node, cr: node.__setitem__("articles", []))
+    nb_nodes = len(tags)+1
+    print(f"synthetic tag tree of {nb_nodes} nodes")
+    count_nodes = lambda node, children_counts: 1+sum(children_counts)
+    for name, traverse in [("legacy", legacy_traverse_depth_first), ("iterative", tag_tree.traverse_depth_first)]:
+        start = perf_counter()
+        nb_counted_nodes = traverse(tag_tree_root, count_nodes)
+        print(f"{name} traverse_depth_first: {nb_counted_nodes} nodes in {perf_counter()-start:.3f}s")
+    for name, modify_node_property in [("legacy", legacy_modify_node_property), ("snapshot", tag_tree.modify_node_property)]:
+        start = perf_counter()
+        revert = modify_node_property(tag_tree_root, "articles", len)
+        modify_elapsed = perf_counter()-start
+        start = perf_counter()
+        revert()
+        print(f"{name} modify_node_property: modify in {modify_elapsed:.3f}s, revert in {perf_counter()-start:.3f}s, "+
+            f"reverted: {all(n['articles']==[] for n in tag_tree.iterate_nodes(tag_tree_root))}")
+    last_tag = tags[len(tags)//2]
+    for name, find in [
+        ("full traversal", lambda: [n for n in tag_tree.iterate_nodes(tag_tree_root) if n["full_name"]==last_tag.tag][0]),
+        ("early exit", lambda: tag_tree.find_node(tag_tree_root, lambda n: n["full_name"]==last_tag.tag)),
+    ]:
+        start = perf_counter()
+        node = find()
+        print(f"{name} search of the node of tag {last_tag.tag}: {perf_counter()-start:.3f}s")
+
+def benchmark_wikidata(wikidata_links_file, nb_lookups=10000):
+    """Compares the start-up and lookup time of wikidata links read from the csv and from its compiled sqlite index"""
+    import random
+    from dhs_scraper import wikidata
+    start = perf_counter()
+    wiki_links_by_dhsid = wikidata.load_wikidata_links(wikidata_links_file)
+    print(f"csv loaded in {perf_counter()-start:.3f}s")
+    dhsids = random.choices(list(wiki_links_by_dhsid.keys()), k=int(nb_lookups))
+    start = perf_counter()
+    csv_main_links = [wikidata.get_main_link(wikidata.get_wikidata_links_from_dhs_id(dhsid, wikidata_links_file), "fr") for dhsid in dhsids]
+    print(f"csv: {len(dhsids)} main links in {perf_counter()-start:.3f}s")
+    start = perf_counter()
+    wikidata.compile_wikidata_links(wikidata_links_file)
+    print(f"compiled in {perf_counter()-start:.3f}s (done once)")
+    start = perf_counter()
+    wikidata_links_index = wikidata.get_wikidata_links_index(wikidata_links_file)
+    print(f"index opened in {perf_counter()-start:.4f}s")
+    start = perf_counter()
+    index_main_links = [wikidata_links_index.get_main_link(dhsid, "fr") for dhsid in dhsids]
+    print(f"index: {len(dhsids)} main links in {perf_counter()-start:.3f}s, same main links: {index_main_links==csv_main_links}")
+
+def benchmark_enrichment(jsonl_filepath, wikidata_links_file):
+    """Compares enriching text_links with wikidata article per article and with the batched add_wikidata_wikipedia_to_articles()"""
+    from dhs_scraper import wikidata
+    def article_per_article():
+        articles = [a for a in DhsArticle.load_articles_from_jsonl(jsonl_filepath) if "text_links" in a.__dict__]
+        for a in articles:
+            wikidata.add_wikidata_wikipedia_to_text_links(a, wikidata_links_file)
+        return articles
+    def batched():
+        return list(wikidata.add_wikidata_wikipedia_to_articles(DhsArticle.load_articles_from_jsonl(jsonl_filepath), wikidata_links_file))
+    wikidata.load_wikidata_links(wikidata_links_file)
+    for name, enrich in [("article per article", article_per_article), ("batched", batched)]:
+        start = perf_counter()
+        articles = enrich()
+        nb_links = sum(len(block_links) for a in articles if "text_links" in a.__dict__ for block_links in a.text_links)
+        print(f"{name}: {len(articles)} articles, {nb_links} text links enriched in {perf_counter()-start:.3f}s (including loading)")
+
+def legacy_identifying_initial(article):
+    """DhsArticle.parse_identifying_initial() before the batch detection: a pandas Series and value_counts() per article"""
+    import re
+    from pandas import Series
+    from dhs_scraper.DhsArticle import article_text_initial_regex
+    text_initials = Series(article_text_initial_regex.findall(article.text), dtype="U").value_counts()
+    title_number_regex = re.compile(r"[A-Z]+\.")
+    title_words = article.title.split(" ")
+    filtered_title_words = [w for w in title_words if not title_number_regex.match(w)]
+    title_initials = [s[0] for s in filtered_title_words if s[0].isupper()]
+    if len(text_initials)==0:
+        return None
+    elif len(text_initials)==1:
+        return text_initials.index[0] if text_initials.index[0] in title_initials else None
+    most_present_in_title = text_initials.index[0]
+    is_most_present_in_title = most_present_in_title in title_initials
+    second_most_present_in_title = text_initials.index[1]
+    is_second_most_present_in_title = second_most_present_in_title in title_initials
+    if is_most_present_in_title and (not is_second_most_present_in_title):
+        return most_present_in_title
+    elif (not is_most_present_in_title) and is_second_most_present_in_title:
+        return second_most_present_in_title
+    elif (not is_most_present_in_title) and (not is_second_most_present_in_title):
+        return None
+    initial = None
+    for i in title_initials:
+        if i==most_present_in_title:
+            initial = most_present_in_title
+        if i==second_most_present_in_title:
+            initial = second_most_present_in_title
+    return initial
+
+def benchmark_initials(jsonl_filepath):
+    """Compares identifying initials detection with pandas per article and with DhsArticle.parse_identifying_initials()"""
+    articles = [a for a in DhsArticle.load_articles_from_jsonl(jsonl_filepath) if "title" in a.__dict__ and a.text is not None]
+    results = {}
+    for name, get_initials in [
+        ("pandas per article", lambda: [legacy_identifying_initial(a) for a in articles]),
+        ("batch", lambda: DhsArticle.parse_identifying_initials(articles)),
+    ]:
+        start = perf_counter()
+        results[name] = get_initials()
+        elapsed = perf_counter()-start
+        print(f"{name}: {len(articles)} articles in {elapsed:.3f}s ({len(articles)/elapsed:.1f} articles/s)")
+    legacy_initials, batch_initials = results.values()
+    nb_differences = sum(1 for l, b in zip(legacy_initials, batch_initials) if l!=b)
+    print(f"{nb_differences} articles with different initials, {sum(1 for i in batch_initials if i is not None)} articles with an initial")
+
+
+# %%
+
+def benchmark_reparse(jsonl_filepath, nb_workers=None):
+    """Compares re-parsing the articles of a jsonl from their page_content in one process and with reparse_jsonl()
+    in 1 and nb_workers (default os.cpu_count()) processes, printing the throughput of each worker
+
+    Checks the round trip: re-parsed articles keep the properties that parsing doesn't produce (page_validators etc...)"""
+    import os
+    from os import path
+    import tempfile
+    from dhs_scraper import json_codec
+    from dhs_scraper.reparse import get_unparsed_properties, reparse_json_line, reparse_jsonl
+    from dhs_scraper.compressed_jsonl import iterate_jsonl_lines
+    nb_workers = int(nb_workers) if nb_workers else os.cpu_count()
+    start = perf_counter()
+    nb_articles = sum(1 for line in iterate_jsonl_lines(jsonl_filepath) if not line.isspace() and reparse_json_line(line)[2])
+    elapsed = perf_counter()-start
+    print(f"single process, no pool: {nb_articles} articles in {elapsed:.2f}s ({nb_articles/elapsed:.1f} articles/s)")
+    with tempfile.TemporaryDirectory() as output_folder:
+        for n in sorted(set([1, nb_workers])):
+            print(f"reparse_jsonl() with {n} worker processes:")
+            reparse_jsonl(jsonl_filepath, path.join(output_folder, f"reparsed_{n}.jsonl"), nb_workers=n)
+        input_lines = (line for line in iterate_jsonl_lines(jsonl_filepath) if not line.isspace())
+        output_lines = iterate_jsonl_lines(path.join(output_folder, f"reparsed_{nb_workers}.jsonl"))
+        nb_lost = 0
+        for input_line, output_line in zip(input_lines, output_lines):
+            output_dict = json_codec.loads(output_line)
+            if any(k not in output_dict or output_dict[k]!=v for k, v in get_unparsed_properties(json_codec.loads(input_line)).items()):
+                nb_lost += 1
+        print(f"round trip: {nb_lost} re-parsed articles lost properties that parsing doesn't produce")
+
+
+# heavy dependencies a jsonl-only workload shouldn't import, see dhs_scraper/__init__.py LAZY_EXPORTS
+IMPORT_HEAVY_MODULES = ["lxml", "requests", "numpy", "pandas", "pyarrow", "asyncio", "multiprocessing"]
+
+IMPORT_BENCHMARK_CODE = """
+import json, sys
+from time import perf_counter
+start = perf_counter()
+import dhs_scraper
+import_seconds = perf_counter()-start
+nb_articles = 0
+if sys.argv[1]:
+    nb_articles = sum(1 for a in dhs_scraper.DhsArticle.load_articles_from_jsonl(sys.argv[1]))
+print(json.dumps({
+    "import_seconds": import_seconds,
+    "total_seconds": perf_counter()-start,
+    "nb_articles": nb_articles,
+    "heavy_modules": [m for m in sys.argv[2].split(",") if m in sys.modules],
+}))
+"""
+
+def benchmark_import(jsonl_filepath=None, nb_runs=5):
+    """Times import dhs_scraper (then loading jsonl_filepath if given) in fresh interpreters,
+    and lists the heavy dependencies they imported: none should be for a jsonl-only workload"""
+    import subprocess
+    from os import path
+    runs = []
+    for _ in range(int(nb_runs)):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_BENCHMARK_CODE, jsonl_filepath or "", ",".join(IMPORT_HEAVY_MODULES)],
+            capture_output=True, text=True, check=True, cwd=path.dirname(path.abspath(__file__))
+        ).stdout
+        runs.append(json.loads(output.splitlines()[-1]))
+    import_seconds = sorted(r["import_seconds"] for r in runs)
+    print(f"import dhs_scraper: best {import_seconds[0]*1000:.1f}ms, median {import_seconds[len(runs)//2]*1000:.1f}ms over {len(runs)} runs")
+    if jsonl_filepath:
+        total_seconds = sorted(r["total_seconds"] for r in runs)
+        print(f"import and load {runs[0]['nb_articles']} articles: best {total_seconds[0]:.3f}s, median {total_seconds[len(runs)//2]:.3f}s")
+    heavy_modules = sorted(set(m for r in runs for m in r["heavy_modules"]))
+    print(f"heavy modules imported: {', '.join(heavy_modules) if len(heavy_modules)>0 else 'none'}")
+
+
+# %%
+
+def benchmark_compression(jsonl_filepath, output_folder="."):
+    """Compares size, write and read throughput of the jsonl as plain text, gzip and zstd block-compressed jsonl"""
+    import os
+    from dhs_scraper import stream_to_jsonl
+    from dhs_scraper.compressed_jsonl import zstandard
+    articles = list(DhsArticle.load_articles_from_jsonl(jsonl_filepath))
+    extensions = [".jsonl", ".jsonl.gz"]+([".jsonl.zst"] if zstandard is not None else [])
+    for extension in extensions:
+        output_filepath = os.path.join(output_folder, "benchmark_compression"+extension)
+        if os.path.exists(output_filepath):
+            os.remove(output_filepath)
+        start = perf_counter()
+        stream_to_jsonl(output_filepath, articles)
+        write_elapsed = perf_counter()-start
+        size = os.path.getsize(output_filepath)
+        start = perf_counter()
+        nb_read_articles = sum(1 for _ in DhsArticle.load_articles_from_jsonl(output_filepath))
+        read_elapsed = perf_counter()-start
+        os.remove(output_filepath)
+        print(f"{extension}: {size/1e6:.1f}MB, write {len(articles)/write_elapsed:.1f} articles/s ({size/1e6/write_elapsed:.1f}MB/s on disk), "+
+            f"read {nb_read_articles/read_elapsed:.1f} articles/s ({size/1e6/read_elapsed:.1f}MB/s from disk)")
+
+def benchmark_parquet(jsonl_filepath, parquet_filepath=None):
+    """Compares loading id, title, tags and birth_date of all articles from the jsonl and from its parquet conversion"""
+    from os import path
+    from dhs_scraper.columnar import jsonl_to_parquet, load_articles_from_parquet
+    parquet_filepath = parquet_filepath if parquet_filepath else jsonl_filepath.replace(".jsonl", "")+".parquet"
+    start = perf_counter()
+    jsonl_to_parquet(jsonl_filepath, parquet_filepath)
+    print(f"converted to parquet in {perf_counter()-start:.3f}s, {path.getsize(jsonl_filepath)/1e6:.1f}MB jsonl -> {path.getsize(parquet_filepath)/1e6:.1f}MB parquet")
+    columns = ["title", "tags", "birth_date"]
+    for name, load in [
+        ("jsonl", lambda: list(DhsArticle.load_articles_from_jsonl(jsonl_filepath))),
+        ("parquet all columns", lambda: list(load_articles_from_parquet(parquet_filepath))),
+        (f"parquet columns {columns}", lambda: list(load_articles_from_parquet(parquet_filepath, columns=columns))),
+    ]:
+        articles, elapsed, peak = measure(load)
+        print(f"{name}: {len(articles)} articles in {elapsed:.3f}s ({len(articles)/elapsed:.1f} articles/s), peak memory {peak/1e6:.1f}MB")
+
+
+# %%
+
+# %%
+
+def check_equivalences(jsonl_filepath=None):
+    """Checks on saved pages (by default the fixture pages) that the single pass text walk gives the same text and links
+    as the lxml_depth_first_iterator() walk, and the batch identifying initials the same as the legacy heuristic
+
+    Exits with status 1 if any result differs."""
+    saved_pages = load_saved_pages(jsonl_filepath) if jsonl_filepath else load_fixture_pages()
+    articles = parse_saved_pages_offline(saved_pages)
+    nb_differences = 0
+    nb_text_elements = 0
+    for article in articles:
+        for text_element in article.get_page_text_elements():
+            nb_text_elements += 1
+            legacy_result = legacy_text_and_links(text_element)
+            single_pass_result = single_pass_text_and_links(text_element)
+            if legacy_result!=single_pass_result:
+                nb_differences += 1
+                print(f"text walk differs in article {article.id}: {legacy_result} != {single_pass_result}")
+    print(f"text walk: {nb_text_elements} text elements of {len(articles)} articles checked")
+    legacy_initials = [legacy_identifying_initial(a) for a in articles]
+    batch_initials = DhsArticle.parse_identifying_initials(articles)
+    for article, legacy_initial, batch_initial in zip(articles, legacy_initials, batch_initials):
+        if legacy_initial!=batch_initial:
+            nb_differences += 1
+            print(f"identifying initial differs for article {article.id}: {legacy_initial} != {batch_initial}")
+    print(f"identifying initials: {len(articles)} articles checked, {sum(1 for i in batch_initials if i is not None)} with an initial")
+    print(f"{nb_differences} differences")
+    if nb_differences>0:
+        sys.exit(1)
+
+
+BENCHMARKS = {
+    "parse": benchmark_parse,
+    "selectors": benchmark_selectors,
+    "text_walk": benchmark_text_walk,
+    "index": benchmark_index,
+    "json": benchmark_json,
+    "lazy": benchmark_lazy,
+    "memory": benchmark_memory,
+    "tags": benchmark_tags,
+    "statistics": benchmark_statistics,
+    "traversal": benchmark_traversal,
+    "wikidata": benchmark_wikidata,
+    "enrichment": benchmark_enrichment,
+    "initials": benchmark_initials,
+    "reparse": benchmark_reparse,
+    "import": benchmark_import,
+    "compression": benchmark_compression,
+    "parquet": benchmark_parquet,
+    "check": check_equivalences,
+}
+
+if __name__=="__main__":
+    if len(sys.argv)<2 or sys.argv[1] not in BENCHMARKS:
+        print(__doc__)
+        print("available benchmarks: "+", ".join(BENCHMARKS.keys()))
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](*sys.argv[2:])
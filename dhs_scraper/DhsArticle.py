@@ -1,3 +1,6 @@
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from copy import deepcopy
 from functools import reduce
 import json
 from os import truncate, path
@@ -6,33 +9,38 @@ from sys import stderr
 from traceback import print_exc
 from time import sleep
 
-from lxml import html
-from lxml.etree import iselement
-from pandas import Series
-import requests as r
-
+from . import fetching, json_codec
+from .compressed_jsonl import iterate_jsonl_lines
+from .css_selectors import select
 from .DhsTag import DhsTag
-from .utils import lxml_depth_first_iterator, is_text_or_link, get_attributes_string
+from .jsonl_index import JsonlIndex
+from .metagrid import METAGRID_BASE_URL, get_metagrid_links
+from .page_cache import get_page_cache
+from .utils import get_text_and_links, get_attributes_string, intern_str, map_concurrently
 from .wikidata import SPARQL_DOWNLOAD_DISCLAIMER, add_wikidata_wikipedia_to_text_links, get_wikidata_links_from_dhs_id, get_wikidata_main_link_from_dhs_id
 
 DHS_SCRAPER_VERSION = "0.2.0"
 
 BULK_DOWNLOAD_COOL_DOWN = 0.5 # seconds
 DHS_ARTICLE_TEXT_REPR_NB_CHAR = 100 # nb char of text displayed in DhsArticle representation
-METAGRID_BASE_URL = "https://api.metagrid.ch/widget/dhs/person/<article_id>.json?lang=<language>&include=true"
 
 TOTAL_NB_DHS_ARTICLES = 36355 # in FR dhs as of 01.11.2021
 
 DHS_ARTICLE_CATEGORIES = ['themes', 'people', 'families', 'spatial']
 
+ALPHABET = "ABCDEFGHIJKLMNOPQRSTUVWXYZ" # alphabetic search partitions of the DHS
+
+TEXT_BLOCK_SEPARATOR = "\n\n" # between text blocks in DhsArticle.text
+
 # %%
 
 # regex to extract dhs article id, version and language
 article_language_id_version_regex = re.compile(r"/(\w+)?/?articles/(.+?)/(\d{4}-\d{2}-\d{2})?")
 search_url_text_arg_regex = re.compile(r"\Wtext=(.+?)&")
 search_url_alphabet_letter_arg_regex = re.compile(r"\Wf_hls.letter_string=(.+?)&")
-article_jsonl_id_regex = re.compile(r'^.+?"id": "(\d+)"')
+article_jsonl_id_regex = re.compile(r'^.+?"id": ?"(\d+)"')
 article_text_initial_regex = re.compile(r" ([A-Z])\.\W")
+title_number_regex = re.compile(r"[A-Z]+\.")
 biographical_date_bref_row_titles = ["Dates biographiques", "Lebensdaten", "Dati biografici"]
 bref_section_titles = ["En bref","Kurzinformationen","Scheda informativa"]
 
@@ -47,9 +55,45 @@ def download_drop_page(func):
         return result
     return inner
 
+def get_title_initials(title):
+    """Returns the initials of the words of title, in order
+
+    Avoids words which are only upper case (mostly title's roman numerals such as I. IV., etc...)"""
+    return [w[0] for w in title.split(" ") if not title_number_regex.match(w) and w[0].isupper()]
+
+def get_identifying_initial(text, title):
+    """Returns the identifying initial of an article's text and title, see DhsArticle.parse_identifying_initial()
+
+    The 2 most present initials of text are ranked by count then first occurrence in text."""
+    text_initials = [i for i, count in Counter(article_text_initial_regex.findall(text)).most_common(2)]
+    if len(text_initials)==0:
+        return None
+    title_initials = get_title_initials(title)
+    if len(text_initials)==1:
+        return text_initials[0] if text_initials[0] in title_initials else None
+    most_present_in_title, second_most_present_in_title = text_initials
+    is_most_present_in_title = most_present_in_title in title_initials
+    is_second_most_present_in_title = second_most_present_in_title in title_initials
+    if is_most_present_in_title and (not is_second_most_present_in_title):
+        return most_present_in_title
+    elif (not is_most_present_in_title) and is_second_most_present_in_title:
+        return second_most_present_in_title
+    elif (not is_most_present_in_title) and (not is_second_most_present_in_title):
+        return None
+    # both in title: pick the one that is last in title
+    initial = None
+    for i in title_initials:
+        if i==most_present_in_title:
+            initial = most_present_in_title
+        if i==second_most_present_in_title:
+            initial = second_most_present_in_title
+    return initial
+
 # %%
 
 class DhsArticle:
+    # identifying properties in fixed slots, parsed properties in __dict__
+    __slots__ = ("search_result_name", "language", "id", "version", "__dict__", "__weakref__")
     def __init__(self, language=None, id=None, version=None, search_result_name=None, url=None):
         """Creates a DhsArticle, must at least have either the id or url argument set
         
@@ -79,17 +123,59 @@ class DhsArticle:
         if (self._text is None) and (("text_blocks" in self.__dict__) or self.page_content is not None):
             self.parse_text()
         return self._text
-    def download_page(self):
-        if not self.page_content:
+    def load_page_from_cache(self):
+        """Sets self.page_content from the page cache (see page_cache.set_page_cache()), returns whether it was found
+
+        Raises an Exception if the page cache is offline and doesn't contain the page."""
+        page_cache = get_page_cache()
+        if page_cache is None:
+            return False
+        page_content = page_cache.get("page", self.language, self.id, self.version)
+        if page_content is None:
+            if page_cache.offline:
+                raise Exception(f"DhsArticle.load_page_from_cache(): page cache is offline and has no page for article {(self.language, self.id, self.version)}")
+            return False
+        self.page_content = page_content
+        return True
+    def set_page_from_response(self, page):
+        """Sets self.page_content from a requests.Response of self.url, stores it in the page cache if any
+
+        The validators of the response (ETag, Last-Modified), if the server sends any, are kept in self.page_validators
+        for conditional requests of later incremental updates (see incremental.py)."""
+        self.page_content = page.content.decode()
+        validators = fetching.get_validators(page)
+        if len(validators)>0:
+            self.page_validators = validators
+        page_cache = get_page_cache()
+        if page_cache is not None and page.status_code==200:
+            page_cache.put("page", self.language, self.id, self.version, self.page_content)
+    def download_page(self, rate_limiter=None):
+        """Sets self.page_content (from the page cache or downloaded under rate_limiter, default fetching.RATE_LIMITER) and self._pagetree"""
+        if not self.page_content and not self.load_page_from_cache():
             print("DHSA DOWNLOADING PAGE")
-            page = r.get(self.url)
-            self.page_content = page.content.decode()
+            self.set_page_from_response(fetching.get(self.url, rate_limiter))
         if "_pagetree" not in self.__dict__:
+            from lxml import html
             self._pagetree = html.fromstring(self.page_content)
         return self.page_content
     def drop_page(self):
         self.page_content = None
         del self._pagetree
+        if "_text_elements" in self.__dict__:
+            del self._text_elements
+    def compact(self):
+        """Reduces the memory used by the article without losing information, returns self
+
+        Drops the page tree, and self._text if it is the join of self.text_blocks (recomputed when accessing self.text).
+        Articles already share their DhsTag and common strings (language, version)."""
+        if "_pagetree" in self.__dict__:
+            del self._pagetree
+        if "_text_elements" in self.__dict__:
+            del self._text_elements
+        if self._text is not None and "text_blocks" in self.__dict__ and \
+            self._text==TEXT_BLOCK_SEPARATOR.join(t[1] for t in self.text_blocks):
+            self._text = None
+        return self
 
     def is_person(self):
         if "bref" in self.__dict__:
@@ -105,31 +191,67 @@ class DhsArticle:
         """Parses title of the article as seen on article page. Adds self.title, and for people, self.given_name and self.family_name
         
         Do not confuse self.title with self.search_result_name (name found in search result lists, should be removed?)"""
-        title_element = self._pagetree.cssselect(".hls-article-title")[0]
+        title_element = select("title", self._pagetree)[0]
         self.title = " ".join([c.text_content().strip() for c in title_element.getchildren()[0].getchildren()])
-        given_name = title_element.cssselect("span[itemprop=givenName]")
+        given_name = select("title_given_name", title_element)
         if len(given_name)>0:
             self.given_name = given_name[0].text_content().strip()
-        family_name = title_element.cssselect("span[itemprop=familyName]")
+        family_name = select("title_family_name", title_element)
         if len(family_name)>0:
             self.family_name = family_name[0].text_content().strip()
         return self.title
     @download_drop_page
     def parse_authors_translators(self):
         """dirty parsing of author/translator in self.authors_translators"""
-        self.authors_translators = [au.text_content().strip() for au in self._pagetree.cssselect(".hls-article-text-author")]
+        self.authors_translators = [au.text_content().strip() for au in select("authors_translators", self._pagetree)]
         return self.authors_translators
     @download_drop_page
     def get_page_text_elements(self):
-        # remove .media-content elements as they contain non-text <p> tags
-        to_remove_elements = self._pagetree.cssselect(".media-content")
-        for tre in to_remove_elements:
-            tre.getparent().remove(tre)
-        # text elements are p, h1-4
-        elements = self._pagetree.cssselect(".hls-article-text-unit p, h1, h2, .hls-article-text-unit h3, .hls-article-text-unit h4")
-        # reparse _pagetree as we removed some elements from it.
-        self._pagetree = html.fromstring(self.page_content)
-        return elements
+        """Returns the text elements (p, h1-4) of the page, computed once per page tree
+
+        .media-content elements are left out as they contain non-text <p> tags. self._pagetree is not modified:
+        text elements containing .media-content elements are replaced by a copy from which they are removed."""
+        if "_text_elements" not in self.__dict__:
+            media_elements = set(select("media_content", self._pagetree))
+            contain_media_elements = set(a for m in media_elements for a in m.iterancestors())
+            # text elements are p, h1-4
+            elements = select("text_elements", self._pagetree)
+            self._text_elements = []
+            for element in elements:
+                if any(a in media_elements for a in element.iterancestors()):
+                    continue
+                if element in contain_media_elements:
+                    element = deepcopy(element)
+                    for media_element in select("media_content", element):
+                        # removes the tail too, as text_content() did on the former destructive version
+                        media_element.getparent().remove(media_element)
+                self._text_elements.append(element)
+        return self._text_elements
+    def parse_text_blocks_and_links(self):
+        """Parses self.text_blocks and self.text_links (if not already present) in a single pass over the text elements"""
+        texts_and_links = [(te.tag, *get_text_and_links(te)) for te in self.get_page_text_elements()]
+        if "text_blocks" not in self.__dict__:
+            self.text_blocks = [(tag, text) for tag, text, links in texts_and_links]
+            # usually, title doesn't contain spaces correctly for people, correct this
+            self.text_blocks[0] = (
+                self.text_blocks[0][0],
+                re.sub(r"(\w+)([A-Z])", r"\g<1> \g<2>", self.text_blocks[0][1])
+            )
+        if "text_links" not in self.__dict__:
+            self.text_links = []
+            for tag, text, links in texts_and_links:
+                links_in_text = []
+                for start, end, link_element in links:
+                    href = link_element.get("href")
+                    lng, dhsid, v = DhsArticle.get_language_id_version_from_url(href) if href else (None,None,None)
+                    links_in_text.append({
+                        "start": start,
+                        "end": end,
+                        "mention": text[start:end],
+                        "href": href,
+                        "dhsid": dhsid
+                    })
+                self.text_links.append(links_in_text)
     def parse_text_blocks(self):
         """Parse the text blocks of an article in self.text_blocks
         
@@ -138,18 +260,9 @@ class DhsArticle:
         1) text block text
         """
         if "text_blocks" not in self.__dict__:
-            text_elements = self.get_page_text_elements()
-            self.text_blocks = [
-                (te.tag, te.text_content())
-                for te in text_elements
-            ]
-            # usually, title doesn't contain spaces correctly for people, correct this
-            self.text_blocks[0] = (
-                self.text_blocks[0][0],
-                re.sub(r"(\w+)([A-Z])", r"\g<1> \g<2>", self.text_blocks[0][1])
-            )
+            self.parse_text_blocks_and_links()
         return self.text_blocks
-    def parse_text(self, text_block_separator="\n\n"):
+    def parse_text(self, text_block_separator=TEXT_BLOCK_SEPARATOR):
         """parses text of the article and adds it in self.text
         Usually doesn't get data table, only their title"""
         text_blocks = self.parse_text_blocks()
@@ -169,27 +282,7 @@ class DhsArticle:
         - dhsid
         """
         if "text_links" not in self.__dict__:
-            text_elements = self.get_page_text_elements()
-            texts_and_links_by_text_element = [[tl for tl in lxml_depth_first_iterator(te, is_text_or_link)] for te in text_elements]
-            self.text_links = []
-            for texts_and_links in texts_and_links_by_text_element:
-                index_accumulator = 0
-                links_in_text = []
-                for node in texts_and_links:
-                    if iselement(node):
-                        href = node.get("href")
-                        lng, dhsid, v = DhsArticle.get_language_id_version_from_url(href) if href else (None,None,None)
-                        links_in_text.append({
-                            "start": index_accumulator,
-                            "end": index_accumulator+len(node.text_content()),
-                            "mention": node.text_content(),
-                            "href": href,
-                            "dhsid": dhsid
-                        })
-                        index_accumulator += len(node.text_content())
-                    else:
-                        index_accumulator += len(node)
-                self.text_links.append(links_in_text)
+            self.parse_text_blocks_and_links()
         return self.text_links
     @download_drop_page
     def parse_sources(self):
@@ -206,10 +299,10 @@ class DhsArticle:
         """
         def parse_source(source_element):
             text = source_element.text_content().strip()
-            authors = [au.text_content().strip() for au in source_element.cssselect(".au")]
-            tpub = [t.text_content().strip() for t in source_element.cssselect(".tpub")]
-            journal = [j.text_content().strip() for j in source_element.cssselect("em")]
-            link =  [a.get("href") for a in source_element.cssselect("a")]
+            authors = [au.text_content().strip() for au in select("source_author", source_element)]
+            tpub = [t.text_content().strip() for t in select("source_tpub", source_element)]
+            journal = [j.text_content().strip() for j in select("source_journal", source_element)]
+            link =  [a.get("href") for a in select("source_link", source_element)]
             source = {"text": text}
             if len(authors)>0:
                 source["author"] = authors
@@ -229,7 +322,7 @@ class DhsArticle:
                     print(f"DhsArticle.parse_sources(): more than one link for a source dhs-id:{self.id}, source: {text}")
             return source
         def get_section_title(section_element):
-            section_title = section_element.cssselect(".panel-title")
+            section_title = select("sources_section_title", section_element)
             if len(section_title)>0:
                 return section_title[0].text_content().strip()
             else:
@@ -237,8 +330,8 @@ class DhsArticle:
         self.sources = {
             get_section_title(section_element): [
                 parse_source(source_element)
-                for source_element in section_element.cssselect("li")]
-            for section_element in self._pagetree.cssselect("#_hls_references .panel")
+                for source_element in select("sources_section_source", section_element)]
+            for section_element in select("sources_sections", self._pagetree)
         }
         return self.sources
     @download_drop_page
@@ -249,30 +342,26 @@ class DhsArticle:
             {
                 "title":el.text_content(),
                 "url":el.get("href")
-            } for el in self._pagetree.cssselect(".hls-service-box-left a")
+            } for el in select("notice_links", self._pagetree)
         ]
         return self.notice_links
     @download_drop_page
-    def parse_metagrid(self):
+    def parse_metagrid(self, fetch=True):
         """Adds self.metagrid_id and metagrid_links properties
         
         self.metagrid_id is a str
         self.metagrid_links is of the form returned by the metagrid api, see example: https://api.metagrid.ch/widget/dhs/person/3848.json?lang=de&include=true
+        fetch: if False, only parses self.metagrid_id, metagrid_links being left to metagrid.add_metagrid_links(),
+        which fetches those of many articles concurrently. Returns self.metagrid_links, None if not fetched.
         """
         # metagrid links
         #<div id="hls-service-box-metagrid" articleId="17791" style="display: none;" class="hls-service-box-subtitle">
-        metagrid_div = self._pagetree.cssselect("#hls-service-box-metagrid")
+        metagrid_div = select("metagrid", self._pagetree)
         if len(metagrid_div)>0:
-            attr = {k:v for k,v in metagrid_div[0].items()}
             self.metagrid_id = metagrid_div[0].get("articleid")
-            language = self.language if self.language else "de"
-            metagrid_url = METAGRID_BASE_URL.replace("<article_id>", self.metagrid_id).replace("<language>", language)
-            metagrid_resp = r.get(metagrid_url)
-            if metagrid_resp.status_code==200:
-                self.metagrid_links = metagrid_resp.json()
-            else:
-                print(f"DhsArticle.parse_metagrid() failure to get metagrid links for dhs article {self.id} with metagrid url: {metagrid_url}")
-                self.metagrid_links = []
+            if not fetch:
+                return None
+            self.metagrid_links = get_metagrid_links(self)
         else:
             self.metagrid_id = None
             self.metagrid_links = []
@@ -291,24 +380,24 @@ class DhsArticle:
         self.bref=[]
         def parse_bref_row(bref_row):
             bref_row_dict = {}
-            bref_row_dict["title"] = bref_row.cssselect(".hls-service-box-table-title")[0].text_content().strip()
-            bref_row_dict["text"] = bref_row.cssselect(".hls-service-box-table-text")[0].text_content().strip()
-            link = bref_row.cssselect(".hls-service-box-table-text a")
+            bref_row_dict["title"] = select("bref_row_title", bref_row)[0].text_content().strip()
+            bref_row_dict["text"] = select("bref_row_text", bref_row)[0].text_content().strip()
+            link = select("bref_row_link", bref_row)
             if len(link)>0:
                 bref_row_dict["link"] = [l.get("href") for l in link]
             if bref_row_dict["title"] in biographical_date_bref_row_titles:
-                birth_span = bref_row.cssselect(".hls-service-box-table-text span[itemProp=birthDate]")
+                birth_span = select("bref_row_birth_date", bref_row)
                 if len(birth_span)>0:
                     bref_row_dict["birth_date"] = birth_span[0].text_content().strip()
-                death_span = bref_row.cssselect(".hls-service-box-table-text span[itemProp=deathDate]")
+                death_span = select("bref_row_death_date", bref_row)
                 if len(death_span)>0:
                     bref_row_dict["death_date"] = death_span[0].text_content().strip()
             return bref_row_dict
-        bref_box = self._pagetree.cssselect(".hls-service-box-right .hls-service-box-element:first-child")
+        bref_box = select("bref_box", self._pagetree)
         if len(bref_box)>0:
-            bref_title = bref_box[0].cssselect(".hls-service-box-title")
+            bref_title = select("service_box_title", bref_box[0])
             if len(bref_title)>0 and bref_title[0].text_content().strip() in bref_section_titles:
-                self.bref = [parse_bref_row(b) for b in bref_box[0].cssselect("tr")]
+                self.bref = [parse_bref_row(b) for b in select("bref_row", bref_box[0])]
             for bref_row_dict in self.bref:
                 if bref_row_dict["title"] in biographical_date_bref_row_titles:
                     if "birth_date" in bref_row_dict:
@@ -319,13 +408,13 @@ class DhsArticle:
     @download_drop_page
     def parse_tags(self):
         """Parses tags in a list of dict with "tag" and "url" keys"""
-        tags_box = self._pagetree.cssselect(".hls-service-box-right .hls-service-box-element:last-child")
+        tags_box = select("tags_box", self._pagetree)
         if len(tags_box)>0:
-            tags_title = tags_box[0].cssselect(".hls-service-box-title")
+            tags_title = select("service_box_title", tags_box[0])
             if len(tags_title)>0 and tags_title[0].text_content().strip() in ["Indexation thématique","Systematik","Classificazione"]:
                 self.tags = [
-                    DhsTag(el.text_content(), el.get("href"))
-                    for el in tags_box[0].cssselect("a")
+                    DhsTag.intern(el.text_content(), el.get("href"))
+                    for el in select("tags_box_tag", tags_box[0])
                 ]
             else:
                 self.tags=[]
@@ -333,19 +422,40 @@ class DhsArticle:
             self.tags=[]
         return self.tags
     @download_drop_page
-    def parse_article(self):
-        """Calls all the parse_XX functions"""
+    def parse_article(self, metagrid=True):
+        """Calls all the parse_XX functions
+
+        metagrid: True to fetch the metagrid links during parsing (a request to the metagrid api per article),
+        "defer" to only parse the metagrid id (see metagrid.add_metagrid_links() to fetch links of many articles concurrently),
+        False to skip metagrid altogether"""
         self.parse_title()
         self.parse_authors_translators()
         self.parse_text_blocks()
         self.parse_text()
         self.parse_text_links()
         self.parse_sources()
-        self.parse_metagrid()
+        if metagrid:
+            self.parse_metagrid(fetch=(metagrid!="defer"))
         self.parse_notice_links()
         self.parse_bref()
         self.parse_tags()
 
+    def try_parse_article(self, journal=None, metagrid=True, rate_limiter=None):
+        """Calls parse_article(metagrid), printing the error to stderr instead of raising it in case of failure
+
+        If journal (a CrawlJournal) is given, failures are recorded in it.
+        rate_limiter: the page is downloaded under this RateLimiter, by default the global fetching.RATE_LIMITER
+        Returns self, used by bulk scraping functions."""
+        try:
+            self.download_page(rate_limiter)
+            self.parse_article(metagrid)
+        except Exception as e:
+            print(f"ERROR PARSING ARTICLE WITH DHS-ID: {self.id}", file=stderr)
+            print_exc(file=stderr)
+            if journal is not None:
+                journal.mark_failed(self)
+        return self
+
     def parse_identifying_initial(self):
         """Parses the letter being the identifying initial of the article using regex heuristics
         
@@ -368,46 +478,24 @@ class DhsArticle:
             self.parse_text()
         if "title" not in self.__dict__:
             self.parse_title()
-        text_initials = Series(article_text_initial_regex.findall(self.text), dtype="U").value_counts()
- 
-        # title initials: avoid words which are only upper case (mostly title's roman numerals such as I. IV., etc...)
-        title_number_regex = re.compile(r"[A-Z]+\.")
-        title_words = self.title.split(" ")
-        filtered_title_words = [w for w in title_words if not title_number_regex.match(w)]
-        title_initials = [s[0] for s in filtered_title_words if s[0].isupper()]
-
-        if len(text_initials)==0:
-            self._initial = None
-        elif len(text_initials)==1:
-            if text_initials.index[0] in title_initials:
-                self._initial = text_initials.index[0]
-            else:
-                self._initial = None
-        elif len(text_initials)>1:
-            most_present_in_title = text_initials.index[0]
-            is_most_present_in_title = most_present_in_title in title_initials
-            second_most_present_in_title = text_initials.index[1]
-            is_second_most_present_in_title = second_most_present_in_title in title_initials
-            if is_most_present_in_title and (not is_second_most_present_in_title):
-                self._initial = most_present_in_title
-            elif (not is_most_present_in_title) and is_second_most_present_in_title:
-                self._initial = second_most_present_in_title
-            elif (not is_most_present_in_title) and (not is_second_most_present_in_title):
-                self._initial = None
-            elif is_most_present_in_title and is_second_most_present_in_title:
-                # pick one that is last in title
-                self._initial = None
-                for i in title_initials:
-                    if i==most_present_in_title:
-                        self._initial = most_present_in_title
-                    if i==second_most_present_in_title:
-                        self._initial = second_most_present_in_title
-            else:
-                raise Exception(f"DhsArticle.parse_identifying_initial(): UNCOVERED EDGE CASE FOR MORE THAN ONE INITIAL IN TEXT, article:\n{self.title}\n{self.url}\n{self.language}\n{self.id}\n{self.version}")
-        else:
-            raise Exception(f"DhsArticle.parse_identifying_initial(): UNCOVERED EDGE CASE, article:\n{self.title}\n{self.url}\n{self.language}\n{self.id}\n{self.version}")
+        self._initial = get_identifying_initial(self.text, self.title)
         return self._initial
 
+    @staticmethod
+    def parse_identifying_initials(dhs_articles):
+        """Parses the identifying initial of all dhs_articles in one pass, returns the list of their initials
+
+        Same results as parse_identifying_initial() article per article, a.initial being set for each article."""
+        initials = []
+        for a in dhs_articles:
+            if a._text is None:
+                a.parse_text()
+            if "title" not in a.__dict__:
+                a.parse_title()
+            a._initial = get_identifying_initial(a.text, a.title)
+            initials.append(a._initial)
+        return initials
+
     @property
     def initial(self):
         if "_initial" not in self.__dict__:
@@ -442,7 +530,7 @@ class DhsArticle:
     def __repr__(self):
         return self.__str__()
     def __eq__(self, other):
-        if type(other) is type(self):
+        if isinstance(other, DhsArticle):
             return (self.language, self.id, self.version)==(other.language, other.id, other.version)
         return False
     def __hash__(self):
@@ -455,10 +543,20 @@ class DhsArticle:
         return DhsArticle(new_language, self.id, self.version)
 
     def to_json(self, as_dict=False, drop_page_content=False, *args, **kwargs):
-        """Returns a json string serialization of this DhsArticle"""
-        json_dict = self.__dict__.copy()
+        """Returns a json string serialization of this DhsArticle
+
+        Serialized with the json_codec backend, kwargs are the ones of json.dumps()"""
+        json_dict = {
+            "search_result_name": self.search_result_name,
+            "language": self.language,
+            "id": self.id,
+            "version": self.version
+        }
+        json_dict.update(self.__dict__)
         if "_pagetree" in json_dict:
             del json_dict["_pagetree"]
+        if "_text_elements" in json_dict:
+            del json_dict["_text_elements"]
         if (drop_page_content and "page_content" in json_dict) or \
             ("page_content" in json_dict and json_dict["page_content"] is None):
             del json_dict["page_content"]
@@ -468,27 +566,32 @@ class DhsArticle:
                 del json_dict["_text"]
             if ("text_blocks" in json_dict) and ("page_content" in json_dict):
                 del json_dict["text_blocks"]
+        if json_dict.get("_text", "") is None and "text_blocks" in json_dict:
+            # text dropped by compact()
+            json_dict["_text"] = TEXT_BLOCK_SEPARATOR.join(t[1] for t in self.text_blocks)
         json_dict["url"] = self.url
         if "tags" in json_dict: 
             json_dict["tags"] = [t.to_json(as_dict=True) for t in self.tags]
         if as_dict:
             return json_dict
-        jsonstr =  json.dumps(json_dict, *args, **kwargs)
+        jsonstr =  json_codec.dumps(json_dict, *args, **kwargs)
         return jsonstr
     @staticmethod
     def from_json(json_dict):
         """Parses a DhsArticle from a dict obtained from json.loads()"""
         search_result_name_json_prop = "name" if "name" in json_dict else "search_result_name"
         text_json_prop = "text" if "text" in json_dict else "_text"
-        article = DhsArticle(json_dict["language"], json_dict["id"], json_dict["version"], json_dict[search_result_name_json_prop])
+        article = DhsArticle(
+            intern_str(json_dict["language"]), json_dict["id"], intern_str(json_dict["version"]), json_dict[search_result_name_json_prop]
+        )
         if "tags" in json_dict:
             article.tags = [DhsTag.from_json(jt) for jt in json_dict["tags"]]
         if text_json_prop in json_dict:
             article._text = json_dict[text_json_prop]
         done_props = {"language", "id", "version", search_result_name_json_prop, "url", "tags", text_json_prop}
-        for k,v in json_dict.items():
-            if k not in done_props:
-                article.__dict__[k] = v
+        article.__dict__.update((k,v) for k,v in json_dict.items() if k not in done_props)
+        if "scraper_version" in json_dict:
+            article.scraper_version = intern_str(json_dict["scraper_version"])
         return article
 
     @staticmethod
@@ -513,14 +616,48 @@ class DhsArticle:
             return (None, None, None)
 
 
+    @staticmethod
+    def get_nb_search_pages(search_page_tree):
+        """returns the number of search pages given the lxml tree of the first page of search results"""
+        pagination_last = select("search_pagination_last", search_page_tree)
+        return int(pagination_last[0].text_content()) if len(pagination_last)>0 else 1
+
+    @staticmethod
+    def get_search_page_articles(search_page_tree):
+        """returns the list of DhsArticle listed in the lxml tree of a search results page"""
+        articles = []
+        for c in select("search_result", search_page_tree):
+            # search-result__title
+            ctitle = select("search_result_title", c)
+            cname = ctitle[0].text_content().strip()
+            page_url = c.get("href")
+            articles.append(DhsArticle(url="https://hls-dhs-dss.ch"+page_url, search_result_name = cname))
+        return articles
+
     @staticmethod
     def scrape_articles_from_search_url(search_url, rows_per_page=20, max_nb_articles=None,
-                    parse_articles=False, force_language = None, skip_duplicates=True, already_visited_ids=None):
+                    parse_articles=False, force_language = None, skip_duplicates=True, already_visited_ids=None,
+                    nb_workers=1, max_requests_per_second=None, keep_order=True, nb_prefetched_search_pages=0,
+                    first_search_page=0, journal=None, journal_partition=None, metagrid=True, corpus_versions=None, rate_limiter=None):
         """returns a list of DHS articles' names & URLs from a DHS search url
 
         rows_per_page is the value of the "rows" argument in the search_url, by default 20, better to set it to a 100
         parse_articles decides whether to load the page's content or not
         force_language must either be falsy or one of "fr", "de", "it"
+        nb_workers: if >1 and parse_articles, articles are downloaded and parsed concurrently by nb_workers threads
+        sharing a pool of kept-alive connections, without the BULK_DOWNLOAD_COOL_DOWN between articles
+        max_requests_per_second: if not None, cap on requests per second of this scrape (its own RateLimiter), otherwise the
+        global fetching.RATE_LIMITER (fetching.DEFAULT_MAX_REQUESTS_PER_SECOND, see fetching.set_max_requests_per_second()) is used
+        rate_limiter: a fetching.RateLimiter for the requests of this scrape, for example shared with other scrapes,
+        overrides max_requests_per_second
+        keep_order: with nb_workers>1, whether articles are yielded in search results order or as soon as they are parsed
+        nb_prefetched_search_pages: if >0, the next nb_prefetched_search_pages search pages are downloaded concurrently
+        (within the max_requests_per_second cap and without BULK_DOWNLOAD_COOL_DOWN) while the current page's articles are yielded
+        first_search_page: number of the search page to start from, to resume an interrupted crawl
+        journal: a CrawlJournal recording the crawl's progress under partition journal_partition (by default search_url), see crawl_journal.py
+        metagrid: metagrid argument of parse_article(), "defer" to leave metagrid links to metagrid.add_metagrid_links()
+        corpus_versions: a CorpusVersions (see incremental.py) for an incremental update: only articles new or changed
+        with respect to its corpus are yielded, to be streamed to a delta jsonl merged with incremental.merge_delta()
 
         search_url is an url corresponding to a search in the DHS search interface
         search_url should end with "&firstIndex=" to browse through the search results
@@ -531,6 +668,12 @@ class DhsArticle:
         """
         if not already_visited_ids:
             already_visited_ids=set()
+        if journal_partition is None:
+            journal_partition = search_url
+        if rate_limiter is None:
+            rate_limiter = fetching.get_rate_limiter(max_requests_per_second)
+        # a kept-alive connection for each worker, prefetcher and the search pages loop
+        fetching.get_session(nb_workers+nb_prefetched_search_pages+1)
 
         # extacting info on url for logging
         search_text_match = search_url_text_arg_regex.search(search_url)
@@ -538,49 +681,75 @@ class DhsArticle:
         az_letter_match = search_url_alphabet_letter_arg_regex.search(search_url)
         az_letter = ("alphabet letter: "+az_letter_match.group(1)+" ") if az_letter_match else ""
 
-        # getting first page for nb of pages
-        articles_page_url = search_url+"0"
-        articles_page = r.get(articles_page_url)
-        tree = html.fromstring(articles_page.content)
-        pagination_last = tree.cssselect(".pagination a:last-child")
-        nb_search_pages = int(pagination_last[0].text_content()) if len(pagination_last)>0 else 1
-        
-        # iterating over pages
-        for search_page_number in range(0,nb_search_pages):
-            print(f"Loading search page nb {search_page_number} for "+search_text+az_letter)
-            if search_page_number!=0:
-                # get the new page
-                articles_page_url = search_url+str(search_page_number*rows_per_page)
-                sleep(BULK_DOWNLOAD_COOL_DOWN)
-                articles_page = r.get(articles_page_url)
-                tree = html.fromstring(articles_page.content)
-            if max_nb_articles is not None and search_page_number*rows_per_page>=max_nb_articles:
-                break
-            search_results = tree.cssselect(".search-result a")
-            for i,c in enumerate(search_results):
+        def get_search_page_tree(search_page_number):
+            from lxml import html
+            articles_page = fetching.get(search_url+str(search_page_number*rows_per_page), rate_limiter)
+            return html.fromstring(articles_page.content)
+
+        def iterate_search_results():
+            # getting first page for nb of pages
+            tree = get_search_page_tree(first_search_page)
+            # the journal records the real nb of pages, the truncation to max_nb_articles only bounds this crawl
+            total_nb_search_pages = DhsArticle.get_nb_search_pages(tree)
+            nb_search_pages = total_nb_search_pages
+            if max_nb_articles is not None:
+                # no need to request pages beyond max_nb_articles
+                nb_search_pages = min(nb_search_pages, -(-max_nb_articles//rows_per_page))
+            prefetcher = ThreadPoolExecutor(nb_prefetched_search_pages) if nb_prefetched_search_pages>0 else None
+            prefetched_pages = dict()
+            
+            try:
+                # iterating over pages
+                for search_page_number in range(first_search_page,nb_search_pages):
+                    print(f"Loading search page nb {search_page_number} for "+search_text+az_letter)
+                    if prefetcher is not None:
+                        # keep the next nb_prefetched_search_pages pages downloading
+                        for n in range(search_page_number+1, min(search_page_number+1+nb_prefetched_search_pages, nb_search_pages)):
+                            if n not in prefetched_pages:
+                                prefetched_pages[n] = prefetcher.submit(get_search_page_tree, n)
+                        if search_page_number!=first_search_page:
+                            tree = prefetched_pages.pop(search_page_number).result()
+                    elif search_page_number!=first_search_page:
+                        # get the new page
+                        sleep(BULK_DOWNLOAD_COOL_DOWN)
+                        tree = get_search_page_tree(search_page_number)
+                    yield from iterate_search_page(tree, search_page_number)
+                    # a page cut by max_nb_articles isn't complete: a later crawl resumes at it
+                    page_is_complete = max_nb_articles is None or (search_page_number+1)*rows_per_page<=max_nb_articles
+                    if journal is not None and page_is_complete:
+                        journal.close_page(journal_partition, search_page_number, total_nb_search_pages)
+            finally:
+                if prefetcher is not None:
+                    for future in prefetched_pages.values():
+                        future.cancel()
+                    prefetcher.shutdown(wait=False)
+
+        def iterate_search_page(tree, search_page_number):
+            for i, article in enumerate(DhsArticle.get_search_page_articles(tree)):
                 article_index = search_page_number*rows_per_page+i
                 if max_nb_articles is not None and article_index>=max_nb_articles:
                     break
-                ctitle = c.cssselect(".search-result__title")
-                cname = ctitle[0].text_content().strip()
-                # search-result__title
-                page_url = c.get("href")
-                article = DhsArticle(url="https://hls-dhs-dss.ch"+page_url, search_result_name = cname)
                 if (not skip_duplicates) or article.id not in already_visited_ids:
                     if force_language:
                         article.language = force_language
-                    if parse_articles:
-                        sleep(BULK_DOWNLOAD_COOL_DOWN)
-                        try:
-                            article.parse_article()
-                        except Exception as e:
-                            print(f"ERROR PARSING ARTICLE WITH DHS-ID: {article.id}", file=stderr)
-                            print_exc(file=stderr)
                     already_visited_ids.add(article.id)
+                    if corpus_versions is not None and not corpus_versions.is_new_or_changed(article):
+                        continue
+                    if journal is not None:
+                        journal.add_page_article(journal_partition, search_page_number, article.id)
                     yield article
                 else:
                     print(f"DhsArticle.scrape_articles_from_search_url() skipping duplicate {article.id}, name: {article.search_result_name}")
 
+        if parse_articles and nb_workers>1:
+            yield from map_concurrently(lambda a: a.try_parse_article(journal, metagrid, rate_limiter), iterate_search_results(), nb_workers, keep_order)
+        else:
+            for article in iterate_search_results():
+                if parse_articles:
+                    sleep(BULK_DOWNLOAD_COOL_DOWN)
+                    article.try_parse_article(journal, metagrid, rate_limiter)
+                yield article
+
     @staticmethod
     def search_for_articles(keywords, language="fr", **kwargs):
         if not isinstance(keywords, str):
@@ -589,64 +758,251 @@ class DhsArticle:
         return DhsArticle.scrape_articles_from_search_url(search_url, rows_per_page=100, **kwargs)
 
     @staticmethod
-    def scrape_all_articles(language="fr", max_nb_articles_per_letter=None, already_visited_ids=None, **kwargs):
-        """Scrapes all articles from DHS"""
+    def get_alphabet_search_url(language, letter):
+        """returns the search url (ending with "&firstIndex=") listing all articles starting with given letter"""
+        return f"https://hls-dhs-dss.ch/{language}/search/alphabetic?text=*&sort=hls.title_sortString&sortOrder=asc&collapsed=true&r=1&rows=100&f_hls.letter_string={letter}&firstIndex="
+
+    @staticmethod
+    def scrape_all_articles(language="fr", max_nb_articles_per_letter=None, already_visited_ids=None, journal=None, **kwargs):
+        """Scrapes all articles from DHS, letter after letter
+
+        journal: a CrawlJournal (see crawl_journal.py), to be also given to stream_to_jsonl(). With a journal, an interrupted
+        crawl restarts at the page following the last completed one of each letter and skips the articles already done.
+
+        See async_crawler.crawl_all_articles() for a concurrent version crawling all letters at once."""
         if not already_visited_ids:
             already_visited_ids=set()
-        alphabet_url_basis = f"https://hls-dhs-dss.ch/{language}/search/alphabetic?text=*&sort=hls.title_sortString&sortOrder=asc&collapsed=true&r=1&rows=100&f_hls.letter_string="
-        firstindex_arg_basis = "&firstIndex="
-        for letter in "ABCDEFGHIJKLMNOPQRSTUVWXYZ": # ABCDEFGHIJKLMNOPQRSTUVWXYZ
+        if journal is not None:
+            already_visited_ids.update(journal.done_ids)
+        for letter in ALPHABET:
+            first_search_page = 0
+            if journal is not None:
+                first_search_page = journal.get_resume_page(f"{language}/{letter}")
+                if first_search_page is None:
+                    print("Skipping already completed letter: "+letter)
+                    continue
             print("Downloading articles starting with letter: "+letter)
-            url = alphabet_url_basis+letter+firstindex_arg_basis
+            url = DhsArticle.get_alphabet_search_url(language, letter)
             for a in DhsArticle.scrape_articles_from_search_url(
                         url, 
                         rows_per_page=100,
                         max_nb_articles= max_nb_articles_per_letter,
                         already_visited_ids = already_visited_ids,
+                        first_search_page = first_search_page,
+                        journal = journal,
+                        journal_partition = f"{language}/{letter}",
                         **kwargs):
                     yield a
 
+    @staticmethod
+    def retry_failed_articles(journal):
+        """Parses again the articles whose parsing failed according to journal, yields those now successfully parsed
+
+        The yielded articles are new versions of articles already present (unparsed) in the crawl's output."""
+        for id, url in list(journal.failed.items()):
+            article = DhsArticle(url=url)
+            try:
+                article.parse_article()
+            except Exception as e:
+                print(f"ERROR PARSING ARTICLE WITH DHS-ID: {article.id}", file=stderr)
+                print_exc(file=stderr)
+                continue
+            journal.mark_retried([id])
+            yield article
+
     @staticmethod
     def get_articles_ids(jsonl_filepath):
         """Returns an iterable containing the ids of all the articles present in the given jsonl
         
         Useful to relaunch a scrape after an interruption."""
         if path.isfile(jsonl_filepath):
-            with open(jsonl_filepath, "r") as jsonl_file:
-                for line in jsonl_file:
-                    if len(line)>0:
-                        yield article_jsonl_id_regex.search(line).group(1)
+            for line in iterate_jsonl_lines(jsonl_filepath):
+                if len(line)>0:
+                    yield article_jsonl_id_regex.search(line).group(1)
         else:
             print(f"DhsArticle.get_articles_ids(): no file found at path '{jsonl_filepath}'. returning empty generator")
             return
 
     @staticmethod
-    def load_articles_from_jsonl(jsonl_filepath, ids_to_keep=set(), indices_to_keep=set(), ids_to_drop=set()):
-        """Loads articles from a .jsonl file with one json DhsArticle per line
+    def load_articles_from_jsonl(jsonl_filepath, ids_to_keep=set(), indices_to_keep=set(), ids_to_drop=set(), use_index=None, lazy=False):
+        """Loads articles from a .jsonl file with one json DhsArticle per line, block-compressed if ending with .zst or .gz
         
         ids_to_keep: list (or preferably a set) of dhs articles' ids to load, avoids to parse unwanted articles
         indices_to_keep: set of indices to load, useful for random sampling, overrides ids_to_keep
+        use_index: whether to read only the lines to keep through the jsonl's JsonlIndex (see jsonl_index.py) when
+        ids_to_keep or indices_to_keep is given. Building the index requires one scan of the jsonl.
+        By default, the index is used if it already exists.
+        lazy: if True, yields LazyDhsArticle, which decode their properties other than language, id, version and
+        search_result_name only when accessed. Much faster and lighter to go through a jsonl for a few properties or articles.
         """
         def load_article(line, i = 0):
             try:
-                return DhsArticle.from_json(json.loads(line.strip()))
+                if lazy:
+                    return LazyDhsArticle(line.strip().encode())
+                return DhsArticle.from_json(json_codec.loads(line.strip()))
             except Exception as e:
                 print(f"Exception loading DhsArticle from {i}th line:\n{line}")
                 import time
                 time.sleep(1)
                 raise e
-        with open(jsonl_filepath, "r") as jsonl_file:
-            for i,line in enumerate(jsonl_file):
-                if len(line)>0:
-                    parse_line = True
-                    if len(ids_to_keep)>0 or len(ids_to_drop)>0:
-                        article_id = article_jsonl_id_regex.search(line).group(1)
-                        if len(ids_to_drop)>0:
-                            parse_line = article_id not in ids_to_drop
-                        if len(ids_to_keep)>0:
-                            parse_line = article_id in ids_to_keep
-                    if len(indices_to_keep)>0:
-                        parse_line = i in indices_to_keep
-                    if parse_line:
-                        yield load_article(line,i)
+        if use_index is None:
+            use_index = JsonlIndex.exists(jsonl_filepath)
+        if use_index and (len(indices_to_keep)>0 or len(ids_to_keep)>0):
+            index = JsonlIndex(jsonl_filepath)
+            if len(indices_to_keep)>0:
+                line_numbers = indices_to_keep
+            else:
+                line_numbers = [ln for id in ids_to_keep for ln in index.get_line_numbers(id)]
+            for i, line in index.iterate_lines(line_numbers):
+                yield load_article(line, i)
+            return
+        for i,line in enumerate(iterate_jsonl_lines(jsonl_filepath)):
+            if len(line)>0:
+                parse_line = True
+                if len(ids_to_keep)>0 or len(ids_to_drop)>0:
+                    article_id = article_jsonl_id_regex.search(line).group(1)
+                    if len(ids_to_drop)>0:
+                        parse_line = article_id not in ids_to_drop
+                    if len(ids_to_keep)>0:
+                        parse_line = article_id in ids_to_keep
+                if len(indices_to_keep)>0:
+                    parse_line = i in indices_to_keep
+                if parse_line:
+                    yield load_article(line,i)
+
+    @staticmethod
+    def get_article_by_id(jsonl_filepath, id):
+        """Returns the DhsArticle with given id from a .jsonl file, None if absent
+
+        Reads only the article's line through the jsonl's JsonlIndex, built if it doesn't exist yet.
+        If the jsonl contains more than one article with this id, returns the last one written."""
+        index = JsonlIndex(jsonl_filepath)
+        line_numbers = index.get_line_numbers(id)
+        if len(line_numbers)==0:
+            return None
+        for i, line in index.iterate_lines(line_numbers[-1:]):
+            return DhsArticle.from_json(json_codec.loads(line))
 # %%
+
+# properties of a LazyDhsArticle decoded on first access
+LAZY_ARTICLE_PROPERTIES = {"page_content", "_text", "text_blocks", "text_links", "sources", "metagrid_links", "tags", "bref", "notice_links", "wiki_links"}
+# json keys of the identifying properties, first ones of DhsArticle.to_json()
+lazy_article_identifiers_regex = re.compile(
+    rb'^\{"(?:search_result_name|name)": ?(null|"[^"\\]*(?:\\.[^"\\]*)*"), ?"language": ?(null|"[^"\\]*"), ?"id": ?("[^"\\]*"), ?"version": ?(null|"[^"\\]*")'
+)
+
+class LazyPropertiesDict(dict):
+    """__dict__ of a LazyDhsArticle, keeps its json line and counts its not yet decoded properties as present"""
+    __slots__ = ("json_line", "lazy_properties", "json_keys")
+    def __init__(self, json_line):
+        self.json_line = json_line
+        self.lazy_properties = None # set of not yet decoded properties, None until the json line is decoded once
+        self.json_keys = {} # property -> json key, when different
+    def __contains__(self, property):
+        if dict.__contains__(self, property):
+            return True
+        if self.json_line is None:
+            return False
+        if self.lazy_properties is None:
+            self.decode()
+            return dict.__contains__(self, property) or property in self.lazy_properties
+        return property in self.lazy_properties
+    def decode(self, properties=()):
+        """Decodes the json line, sets the not yet set cheap properties and the given lazy ones, returns the json dict
+
+        The identifying properties (DhsArticle slots) are left to the LazyDhsArticle"""
+        json_dict = json_codec.loads(self.json_line)
+        if self.lazy_properties is None:
+            if "text" in json_dict:
+                self.json_keys["_text"] = "text"
+            self.lazy_properties = set()
+            for json_key, value in json_dict.items():
+                property = "_text" if json_key=="text" else json_key
+                if json_key in ["url", "name"] or property in DhsArticle.__slots__ or dict.__contains__(self, property):
+                    continue
+                if property in LAZY_ARTICLE_PROPERTIES:
+                    self.lazy_properties.add(property)
+                else:
+                    self[property] = value
+            # defaults of DhsArticle.__init__()
+            for property, default in [("page_content", None), ("_text", None), ("scraper_version", DHS_SCRAPER_VERSION)]:
+                if property not in self.lazy_properties and not dict.__contains__(self, property):
+                    self[property] = default
+            self["scraper_version"] = intern_str(self["scraper_version"])
+        for property in properties:
+            if property in self.lazy_properties:
+                self.lazy_properties.discard(property)
+                if not dict.__contains__(self, property):
+                    value = json_dict[self.json_keys.get(property, property)]
+                    self[property] = [DhsTag.from_json(jt) for jt in value] if property=="tags" else value
+        if len(self.lazy_properties)==0:
+            self.json_line = None
+        return json_dict
+    def decode_all(self):
+        if self.json_line is not None:
+            self.decode(list(self.lazy_properties) if self.lazy_properties is not None else LAZY_ARTICLE_PROPERTIES)
+
+class LazyDhsArticle(DhsArticle):
+    """DhsArticle loaded from a json line (bytes) as written by DhsArticle.to_json(), decoding it on demand
+
+    language, id, version and search_result_name are decoded at creation, the other properties
+    when first accessed: the json line is decoded at that point, the heavy properties (LAZY_ARTICLE_PROPERTIES:
+    page_content, text, text_links, tags, etc...) being kept in the json line until accessed.
+    The json line is dropped once all properties are decoded.
+    Useful to go through a large jsonl and only fully decode some articles, see DhsArticle.load_articles_from_jsonl(lazy=True)
+    """
+    def __init__(self, json_line):
+        properties = LazyPropertiesDict(json_line)
+        self.__dict__ = properties
+        identifiers = lazy_article_identifiers_regex.match(json_line)
+        if identifiers is not None:
+            search_result_name, language, id, version = (json_codec.loads(i) for i in identifiers.groups())
+        else:
+            json_dict = properties.decode()
+            if "id" not in json_dict:
+                raise Exception(f"LazyDhsArticle.__init__(): no article id in json line: {json_line[:200]}")
+            search_result_name = json_dict.get("name", json_dict.get("search_result_name"))
+            language, id, version = json_dict.get("language"), json_dict["id"], json_dict.get("version")
+        self.search_result_name = search_result_name
+        self.language = intern_str(language)
+        self.id = id
+        self.version = intern_str(version)
+    def __getattr__(self, name):
+        properties = self.__dict__
+        if not name.startswith("__") and isinstance(properties, LazyPropertiesDict) and name in properties:
+            if not dict.__contains__(properties, name):
+                properties.decode([name])
+            return properties[name]
+        raise AttributeError(f"'LazyDhsArticle' object has no attribute '{name}'")
+    def __delattr__(self, name):
+        properties = self.__dict__
+        if isinstance(properties, LazyPropertiesDict) and name in properties and not dict.__contains__(properties, name):
+            properties.lazy_properties.discard(name)
+            return
+        super().__delattr__(name)
+    def __str__(self):
+        properties = self.__dict__
+        text_status = "text not decoded" if not dict.__contains__(properties, "_text") else ("text loaded" if self._text else "no text")
+        return f'LazyDhsArticle({self.language}, {self.id}, {self.search_result_name}, {text_status})'
+    def __reduce__(self):
+        properties = self.__dict__
+        identifiers = (self.search_result_name, self.language, self.id, self.version)
+        return (restore_lazy_article, (identifiers, properties.json_line, dict(properties), properties.lazy_properties, properties.json_keys))
+
+    def decode_all(self):
+        """Decodes all the not yet decoded properties"""
+        self.__dict__.decode_all()
+        return self
+    def to_json(self, *args, **kwargs):
+        self.decode_all()
+        return super().to_json(*args, **kwargs)
+
+def restore_lazy_article(identifiers, json_line, properties, lazy_properties, json_keys):
+    """Recreates a pickled/copied LazyDhsArticle"""
+    article = LazyDhsArticle.__new__(LazyDhsArticle)
+    article.search_result_name, article.language, article.id, article.version = identifiers
+    article.__dict__ = LazyPropertiesDict(json_line)
+    article.__dict__.update(properties)
+    article.__dict__.lazy_properties = lazy_properties
+    article.__dict__.json_keys = json_keys
+    return article
@@ -1,18 +1,29 @@
 import json
+from sys import intern
 
 
+# (tag, url) -> DhsTag, see DhsTag.intern()
+INTERNED_DHS_TAGS = dict()
+
 
 class DhsTag:
     """Defines a DHS tag with properties "tag" and "url"
     
     Implements equality and hash based on "tag" property, not url.
+    A few hundred distinct tags are shared by all DHS articles: parsed and loaded articles share
+    one DhsTag instance per distinct tag (see DhsTag.intern()), which must therefore not be modified.
     """
+    __slots__ = ("tag", "url", "facet", "_levels", "_facet_levels", "__weakref__")
     def __init__(self, tag, url=None):
         self.tag = tag
         self.url =  url
         self.facet = url.split("=")[1] if url is not None else None
+        self._levels = None # cached get_levels()
+        self._facet_levels = None # cached get_facet_levels()
     def get_levels(self):
-        return [l.strip() for l in self.tag.split("/")]
+        if self._levels is None:
+            self._levels = [l.strip() for l in self.tag.split("/")]
+        return self._levels
     def get_level(self, level, default_to_last=False):
         levels = self.get_levels()
         if level<len(levels):
@@ -23,8 +34,10 @@ class DhsTag:
     def get_facet_levels(self):
         """Hack: some tags have 1 more component in their facet than levels?
         Hacked to dump the first component if to many facet components"""
-        original_facet = [f for f in self.facet.split(".") if f!=""]
-        return original_facet[(len(original_facet)-len(self.get_levels())):]
+        if self._facet_levels is None:
+            original_facet = [f for f in self.facet.split(".") if f!=""]
+            self._facet_levels = original_facet[(len(original_facet)-len(self.get_levels())):]
+        return self._facet_levels
     def get_facet_level(self, level, default_to_last=False):
         facet_levels = self.get_facet_levels()
         if level<len(facet_levels):
@@ -49,19 +62,32 @@ class DhsTag:
     def __repr__(self):
         return self.__str__()
     def to_json(self, as_dict=False):
+        json_dict = {"tag": self.tag, "url": self.url, "facet": self.facet}
         if as_dict:
-            return self.__dict__.copy()
+            return json_dict
         else:
-            return json.dumps(self.__dict__)        
+            return json.dumps(json_dict)
 
     @staticmethod
+    def intern(tag, url=None):
+        """Returns the shared DhsTag instance of (tag, url), created at first call"""
+        dhs_tag = INTERNED_DHS_TAGS.get((tag, url))
+        if dhs_tag is None:
+            dhs_tag = INTERNED_DHS_TAGS.setdefault((tag, url), DhsTag(intern(tag), url))
+        return dhs_tag
+    @staticmethod
     def from_json(json_dict):
-        return DhsTag(json_dict["tag"], json_dict["url"])
+        return DhsTag.intern(json_dict["tag"], json_dict["url"])
     @staticmethod
     def get_articles_per_tag(articles):
-        utags = set(t for a in articles for t in a.tags)
-        articles_tags = [(a,set(a.tags)) for a in articles]
-        return [(t, [a for a, atags in articles_tags if t in atags]) for t in utags]
+        """Returns a list of (DhsTag, list of the articles having the tag), in one pass over the articles
+
+        See also TagIndex for repeated and hierarchical queries"""
+        articles_per_tag = dict()
+        for a in articles:
+            for t in set(a.tags):
+                articles_per_tag.setdefault(t, []).append(a)
+        return list(articles_per_tag.items())
 
 
 
@@ -69,30 +95,63 @@ class DhsTag:
 
 # =========================== TAG TREE ===========================
 
+def get_post_order_nodes(tag_tree_root):
+    """Returns the list of the nodes of the tag tree in post-order (children before their parent, in order)"""
+    # pre-order visiting the last child first: its reverse is the post-order, children in order
+    nodes = []
+    stack = [tag_tree_root]
+    while len(stack)>0:
+        node = stack.pop()
+        nodes.append(node)
+        if "children" in node:
+            stack.extend(node["children"])
+    nodes.reverse()
+    return nodes
+
+
+class TagTreeNode(dict):
+    """Node of a tag tree: a dict with keys name, full_name, parent, facet and children, indexing its children by name
+
+    children_by_name: name -> child node, kept up-to-date by tag_tree.get_tag_tree_nodes(..., "create")
+    nodes_by_path: on the root only, tag path ("level1 / level2") -> node
+    Serializes (json, pandas, etc...) as the plain nested dict. Nodes added to node["children"] by hand are only
+    found after tag_tree.index_tag_tree()."""
+    __slots__ = ("children_by_name", "nodes_by_path")
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.children_by_name = {c["name"]: c for c in self.get("children", [])}
+        self.nodes_by_path = None
+
+
 class tag_tree:
 
     @staticmethod
     def create_empty_node(name, parent=None, facet=None, full_name=None):
-        return {
+        return TagTreeNode({
             "name": name,
             "full_name": full_name,
             "parent": parent,
             "facet": facet,
             "children": []
-        }
+        })
+
+    @staticmethod
+    def get_child_node(node, name):
+        children_by_name = getattr(node, "children_by_name", None)
+        if children_by_name is not None:
+            return children_by_name.get(name, None)
+        for c in node["children"]:
+            if c["name"]==name:
+                return c
+        return None
 
     @staticmethod
     def get_tag_tree_nodes(tag_tree_root, dhs_tag, missing_behaviour=None):
         levels = dhs_tag.get_levels()
-        facet_levels = dhs_tag.get_facet_levels()
         current_node = tag_tree_root
         tag_tree_nodes = [None]*len(levels)
         for i,l in enumerate(levels):
-            child_node = None
-            for c in current_node["children"]:
-                if c["name"]==l:
-                    child_node=c
-                    break
+            child_node = tag_tree.get_child_node(current_node, l)
             if child_node is None:
                 if missing_behaviour is None:
                     return tag_tree_nodes
@@ -100,8 +159,13 @@ class tag_tree:
                     full_name=None
                     if (i+1)==len(levels):
                         full_name=dhs_tag.tag
+                    facet_levels = dhs_tag.get_facet_levels()
                     child_node = tag_tree.create_empty_node(l, current_node["name"], ".".join(facet_levels[0:(i+1)]), full_name)
                     current_node["children"].append(child_node)
+                    if isinstance(current_node, TagTreeNode):
+                        current_node.children_by_name[l] = child_node
+                    if getattr(tag_tree_root, "nodes_by_path", None) is not None:
+                        tag_tree_root.nodes_by_path[" / ".join(levels[0:(i+1)])] = child_node
                 if missing_behaviour == "error":
                     raise Exception("get_tag_tree_node() non-existent tag tree node for level "+l+" of tag "+dhs_tag) 
             tag_tree_nodes[i]=child_node
@@ -109,25 +173,85 @@ class tag_tree:
         return tag_tree_nodes
     @staticmethod
     def get_tag_tree_node(tag_tree_root, dhs_tag, missing_behaviour=None):
+        nodes_by_path = getattr(tag_tree_root, "nodes_by_path", None)
+        if nodes_by_path is not None:
+            tag_node = nodes_by_path.get(" / ".join(dhs_tag.get_levels()), None)
+            if tag_node is not None:
+                return tag_node
         tag_tree_nodes = tag_tree.get_tag_tree_nodes(tag_tree_root, dhs_tag, missing_behaviour)
         return tag_tree_nodes[-1]
     @staticmethod
     def build_tag_tree(tags):
+        """Builds the tag tree of tags (iterable of DhsTag, possibly repeated), each distinct tag being inserted once"""
         root_node = tag_tree.create_empty_node("root")
-        for t in tags:
+        root_node.nodes_by_path = dict()
+        for t in dict.fromkeys(tags):
             tag_tree.get_tag_tree_node(root_node, t, "create")
         return root_node
+    @staticmethod
+    def index_tag_tree(tag_tree_root):
+        """Returns the tag tree with TagTreeNode nodes indexing their children, from a tree of plain dicts (e.g. loaded from json)"""
+        def to_tag_tree_node(node, children):
+            node = TagTreeNode(node)
+            node["children"] = children
+            node.children_by_name = {c["name"]: c for c in children}
+            return node
+        root_node = tag_tree.traverse_depth_first(tag_tree_root, to_tag_tree_node)
+        root_node.nodes_by_path = dict()
+        stack = [(c, c["name"]) for c in root_node["children"]]
+        while len(stack)>0:
+            node, path = stack.pop()
+            root_node.nodes_by_path[path] = node
+            stack.extend((c, path+" / "+c["name"]) for c in node["children"])
+        return root_node
+
+    @staticmethod
+    def iterate_nodes(tag_tree_root, order="pre"):
+        """yields the nodes of the tag tree depth first, parents before their children (order="pre") or after (order="post")
+
+        Iterative, stop iterating (break, next(), any(), etc...) to end the traversal early."""
+        if order=="pre":
+            stack = [tag_tree_root]
+            while len(stack)>0:
+                node = stack.pop()
+                yield node
+                if "children" in node:
+                    stack.extend(reversed(node["children"]))
+        elif order=="post":
+            # (node, whether its children are already on the stack)
+            stack = [(tag_tree_root, False)]
+            while len(stack)>0:
+                node, children_stacked = stack.pop()
+                if children_stacked or "children" not in node:
+                    yield node
+                else:
+                    stack.append((node, True))
+                    stack.extend((c, False) for c in reversed(node["children"]))
+        else:
+            raise Exception(f"tag_tree.iterate_nodes() unknown order {order}, must be \"pre\" or \"post\"")
+    @staticmethod
+    def find_node(tag_tree_root, predicate):
+        """Returns the first node (pre-order) for which predicate(node) is True, None if none, stopping at the first match"""
+        return next((node for node in tag_tree.iterate_nodes(tag_tree_root) if predicate(node)), None)
 
     @staticmethod
     def traverse_depth_first(node, recursive_function, **recursive_function_kwargs):
         """Applies recursive_function on all nodes of the tag_tree depth first
         
         recursive_function should take two arguments: the current node, and a list
-        containing the result of recursive_function on the nodes' children (an empty list if node has no children)."""
-        children_result = [
-            tag_tree.traverse_depth_first(n, recursive_function, **recursive_function_kwargs) for n in node["children"]
-        ] if "children" in node else []
-        return recursive_function(node, children_result, **recursive_function_kwargs)
+        containing the result of recursive_function on the nodes' children (an empty list if node has no children).
+        Iterative: no recursion limit on the tree depth."""
+        # results of the traversed nodes whose parent isn't traversed yet, a node's children results being the last ones
+        results = []
+        for current_node in get_post_order_nodes(node):
+            nb_children = len(current_node["children"]) if "children" in current_node else 0
+            if nb_children>0:
+                children_result = results[-nb_children:]
+                del results[-nb_children:]
+            else:
+                children_result = []
+            results.append(recursive_function(current_node, children_result, **recursive_function_kwargs))
+        return results[0]
 
 
     @staticmethod
@@ -176,14 +300,17 @@ class tag_tree:
 
     
     @staticmethod
-    def add_articles_to_tag_tree(tag_tree_root, articles=None, articles_per_tag=None):
+    def add_articles_to_tag_tree(tag_tree_root, articles=None, articles_per_tag=None, tag_index=None):
         """Adds an "articles" entry to each node of the tag tree, containing the list of DhsArticle having the tag
         
         Note that articles will only be added to the final node corresponding to the tag.
         For example, Laax has the tag "Entités politiques / Commune", it will only be added to the "Commune" tag tree node.""
+        Articles per tag are taken from articles_per_tag, else from tag_index (a TagIndex), else computed from articles.
         """
-        if articles is None and articles_per_tag is None:
-            raise Exception("tag_tree.add_articles_to_tag_tree() one of articles or articles_per_tag must be non-None.")
+        if articles is None and articles_per_tag is None and tag_index is None:
+            raise Exception("tag_tree.add_articles_to_tag_tree() one of articles, articles_per_tag or tag_index must be non-None.")
+        if articles_per_tag is None and tag_index is not None:
+            articles_per_tag = tag_index.get_articles_per_tag()
         if articles_per_tag is None:
             articles_per_tag = DhsTag.get_articles_per_tag(articles)
         def add_empty_articles_list(node, cr):
@@ -195,20 +322,26 @@ class tag_tree:
                 raise Exception("tag_tree.add_articles_to_tag_tree() non-existent tag tree node for tag: "+t.__str__()) 
             tag_node["articles"]=[a for a in articles]
 
+    @staticmethod
+    def snapshot_node_property(tag_tree_root, property):
+        """Returns a restore function that, if called, sets back each node[property] to its current value
+
+        The snapshot keeps the list of nodes and the list of their values: restoring doesn't traverse the tree again,
+        nodes added since aren't affected."""
+        nodes = get_post_order_nodes(tag_tree_root)
+        values = [node[property] for node in nodes]
+        def restore():
+            for node, value in zip(nodes, values):
+                node[property] = value
+        return restore
+    @staticmethod
     def modify_node_property(tag_tree_root, property, modifier_func):
         """Replaces each node[property] by modifier_func(node[property])
 
         Modifies the tag_tree_root in place, returns a revert function that, if called, reverts the
         tag_tree to its original state with each node[property] containing the original content of node[property]
-        The revert function assumes the tree structure didn't change (no node added or removed).
         """
-        original_articles_sequential = []
-        def apply_to_node(node, cr_unused):
-            original_articles_sequential.append(node[property])
+        revert = tag_tree.snapshot_node_property(tag_tree_root, property)
+        for node in get_post_order_nodes(tag_tree_root):
             node[property] = modifier_func(node[property])
-        tag_tree.traverse_depth_first(tag_tree_root, apply_to_node)
-        def revert_node(node, cr_unused):
-            node[property] = original_articles_sequential.pop(0)
-        def revert():
-            tag_tree.traverse_depth_first(tag_tree_root, revert_node)
         return revert
\ No newline at end of file
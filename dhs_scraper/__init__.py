@@ -1,4 +1,34 @@
-from .DhsArticle import DhsArticle, TOTAL_NB_DHS_ARTICLES, DHS_ARTICLE_CATEGORIES
+from importlib import import_module
+
+from .DhsArticle import DhsArticle, LazyDhsArticle, TOTAL_NB_DHS_ARTICLES, DHS_ARTICLE_CATEGORIES
 from .utils import stream_to_jsonl, lxml_depth_first_iterator
-from .DhsTag import DhsTag, tag_tree
+from .DhsTag import DhsTag, TagTreeNode, tag_tree
+from .tag_index import TagIndex
+from .fetching import set_max_requests_per_second
+from .css_selectors import enable_selectors_timing, get_selectors_statistics, print_selectors_statistics
+from .crawl_journal import CrawlJournal
+from .jsonl_index import JsonlIndex
+from .columnar import stream_to_parquet, jsonl_to_parquet, load_articles_from_parquet, load_parquet_table
+from .page_cache import PageCache, set_page_cache
+from .metagrid import add_metagrid_links, set_metagrid_max_requests_per_second
+from .reparse import reparse_jsonl
+from .incremental import CorpusVersions, merge_delta
 from .wikidata import *
+
+# exports whose module imports a heavy dependency (numpy, asyncio), imported on first access:
+# importing dhs_scraper stays fast for jobs which only read jsonl (see benchmarks.py import)
+LAZY_EXPORTS = {
+    "CategoryStatistics": "tag_statistics",
+    "crawl_all_articles": "async_crawler",
+    "crawl_all_articles_sync": "async_crawler",
+}
+
+def __getattr__(name):
+    if name in LAZY_EXPORTS:
+        value = getattr(import_module("."+LAZY_EXPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    return sorted(set(globals()) | set(LAZY_EXPORTS))
@@ -0,0 +1,187 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Full
+from sys import stderr
+from threading import Thread, Event
+from traceback import print_exc
+
+from . import fetching
+from .DhsArticle import DhsArticle, ALPHABET
+
+
+class AsyncDhsClient:
+    """Async HTTP client shared by all the tasks of a crawl
+
+    Requests are sent through fetching's shared keep-alive session by a pool of nb_connections threads,
+    after taking a token from rate_limiter (by default the global fetching.RATE_LIMITER, which is
+    also used by the blocking downloads done during DhsArticle.parse_article())."""
+    def __init__(self, nb_connections=fetching.DEFAULT_POOL_SIZE, rate_limiter=None):
+        self.rate_limiter = rate_limiter if rate_limiter is not None else fetching.RATE_LIMITER
+        self.executor = ThreadPoolExecutor(nb_connections)
+        self.session = fetching.get_session(nb_connections)
+    async def get(self, url):
+        delay = self.rate_limiter.reserve()
+        if delay>0:
+            await asyncio.sleep(delay)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self.session.get, url)
+    async def get_tree(self, url):
+        from lxml import html
+        response = await self.get(url)
+        return html.fromstring(response.content)
+    async def run_blocking(self, func, *args):
+        """runs a blocking function in the client's thread pool"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+_CRAWL_DONE = object()
+
+async def crawl_all_articles(language="fr", letters=ALPHABET, max_nb_articles_per_letter=None, parse_articles=False,
+                    force_language=None, skip_duplicates=True, already_visited_ids=None,
+                    nb_connections=fetching.DEFAULT_POOL_SIZE, max_requests_per_second=None, queue_size=100, metagrid=True,
+                    corpus_versions=None, rate_limiter=None):
+    """Async generator of all the DhsArticle of the DHS, crawling all alphabet letters concurrently
+
+    Each letter is an independent producer paging through its search results, at most nb_connections
+    requests are in flight at once and all of them go through one shared client and its token bucket.
+    Articles are yielded as soon as they are ready, not in alphabetical order.
+
+    max_requests_per_second: if not None, cap on requests per second of this crawl (its own RateLimiter), otherwise the
+    global fetching.RATE_LIMITER (fetching.DEFAULT_MAX_REQUESTS_PER_SECOND, see fetching.set_max_requests_per_second()) is used
+    rate_limiter: a fetching.RateLimiter for the requests of this crawl, overrides max_requests_per_second
+    queue_size: max nb of ready articles waiting for the consumer before producers pause
+    metagrid: metagrid argument of DhsArticle.parse_article(), "defer" to leave metagrid links to metagrid.add_metagrid_links()
+    corpus_versions: a CorpusVersions (see incremental.py), only articles new or changed with respect to its corpus are yielded
+    other arguments: see DhsArticle.scrape_all_articles() and DhsArticle.scrape_articles_from_search_url()
+    """
+    if already_visited_ids is None:
+        already_visited_ids = set()
+    if rate_limiter is None:
+        rate_limiter = fetching.get_rate_limiter(max_requests_per_second)
+    client = AsyncDhsClient(nb_connections, rate_limiter)
+    queue = asyncio.Queue(queue_size)
+    articles_semaphore = asyncio.Semaphore(nb_connections)
+    rows_per_page = 100
+    parse_tasks = set()
+
+    async def parse_and_queue(article):
+        try:
+            if not article.page_content and not article.load_page_from_cache():
+                article.set_page_from_response(await client.get(article.url))
+            await client.run_blocking(DhsArticle.try_parse_article, article, None, metagrid, rate_limiter)
+        except Exception as e:
+            # same behaviour as DhsArticle.try_parse_article(): report and yield the unparsed article
+            print(f"ERROR DOWNLOADING ARTICLE WITH DHS-ID: {article.id}", file=stderr)
+            print_exc(file=stderr)
+        finally:
+            articles_semaphore.release()
+        await queue.put(article)
+
+    async def produce(letter):
+        search_url = DhsArticle.get_alphabet_search_url(language, letter)
+        letter_parse_tasks = []
+        tree = await client.get_tree(search_url+"0")
+        nb_search_pages = DhsArticle.get_nb_search_pages(tree)
+        for search_page_number in range(0, nb_search_pages):
+            if max_nb_articles_per_letter is not None and search_page_number*rows_per_page>=max_nb_articles_per_letter:
+                break
+            print(f"Loading search page nb {search_page_number} for alphabet letter: {letter}")
+            if search_page_number!=0:
+                tree = await client.get_tree(search_url+str(search_page_number*rows_per_page))
+            for i, article in enumerate(DhsArticle.get_search_page_articles(tree)):
+                if max_nb_articles_per_letter is not None and search_page_number*rows_per_page+i>=max_nb_articles_per_letter:
+                    break
+                # no await between check and add: dedup is atomic inside the event loop
+                if skip_duplicates and article.id in already_visited_ids:
+                    print(f"crawl_all_articles() skipping duplicate {article.id}, name: {article.search_result_name}")
+                    continue
+                already_visited_ids.add(article.id)
+                if force_language:
+                    article.language = force_language
+                if corpus_versions is not None and not await client.run_blocking(corpus_versions.is_new_or_changed, article):
+                    continue
+                if parse_articles:
+                    await articles_semaphore.acquire()
+                    task = asyncio.create_task(parse_and_queue(article))
+                    parse_tasks.add(task)
+                    task.add_done_callback(parse_tasks.discard)
+                    letter_parse_tasks.append(task)
+                else:
+                    await queue.put(article)
+        await asyncio.gather(*letter_parse_tasks)
+
+    letter_tasks = []
+    async def produce_all():
+        letter_tasks.extend(asyncio.create_task(produce(letter)) for letter in letters)
+        try:
+            await asyncio.gather(*letter_tasks)
+        finally:
+            # a letter failed (or the crawl is stopped): the other letters don't go on
+            for task in letter_tasks:
+                task.cancel()
+            await queue.put(_CRAWL_DONE)
+
+    producers = asyncio.create_task(produce_all())
+    try:
+        while True:
+            article = await queue.get()
+            if article is _CRAWL_DONE:
+                break
+            yield article
+        # raises the producers' exception if any
+        await producers
+    finally:
+        # the consumer may stop early: stop all producers and pending downloads before closing the client
+        pending_tasks = [producers, *letter_tasks, *parse_tasks]
+        for task in pending_tasks:
+            task.cancel()
+        await asyncio.gather(*pending_tasks, return_exceptions=True)
+        client.close()
+
+
+def crawl_all_articles_sync(**crawl_all_articles_kwargs):
+    """Blocking generator wrapping crawl_all_articles()
+
+    Runs the crawl's event loop in a background thread, thus also usable where an event loop
+    is already running (notebooks). Takes the same arguments as crawl_all_articles()."""
+    articles = Queue(crawl_all_articles_kwargs.get("queue_size", 100))
+    stop = Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                articles.put(item, timeout=0.1)
+                return
+            except Full:
+                pass
+
+    async def consume():
+        crawl = crawl_all_articles(**crawl_all_articles_kwargs)
+        try:
+            async for article in crawl:
+                # blocks while the consumer is slow: in a thread, not to stall the crawl's event loop
+                await asyncio.get_running_loop().run_in_executor(None, put, article)
+                if stop.is_set():
+                    break
+        finally:
+            await crawl.aclose()
+
+    def run():
+        try:
+            asyncio.run(consume())
+            put(_CRAWL_DONE)
+        except BaseException as e:
+            put(e)
+
+    Thread(target=run, daemon=True).start()
+    try:
+        while True:
+            item = articles.get()
+            if item is _CRAWL_DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
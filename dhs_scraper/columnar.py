@@ -0,0 +1,215 @@
+"""Columnar (parquet) storage of DhsArticle corpora
+
+A parquet file stores each DhsArticle property in its own column, tags, text_links, sources, bref, etc... being
+nested columns. Loading only some columns (for example id, title, tags and birth_date) doesn't read
+nor decode the other ones, notably page_content and the text.
+
+Requires the optional pyarrow dependency (pip install pyarrow).
+"""
+from . import json_codec
+from .DhsArticle import DhsArticle
+
+
+PARQUET_ROW_GROUP_SIZE = 1000 # nb of articles per parquet row group, unit of predicate pushdown
+
+# columns always loaded, needed to create a DhsArticle
+IDENTIFYING_COLUMNS = ["language", "id", "version", "search_result_name"]
+
+# fields of nested dicts which are absent from the dict when not set (as opposed to set to None)
+OPTIONAL_FIELDS = {
+    "sources": {"author", "tpub", "journal", "link"},
+    "bref": {"link", "birth_date", "death_date"},
+}
+
+
+def import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise Exception("dhs_scraper.columnar: parquet storage requires the pyarrow package (pip install pyarrow)")
+    return pyarrow
+
+def get_articles_schema():
+    """Returns the pyarrow schema of a parquet of DhsArticle"""
+    pa = import_pyarrow()
+    strings = pa.list_(pa.string())
+    return pa.schema([
+        ("language", pa.string()),
+        ("id", pa.string()),
+        ("version", pa.string()),
+        ("search_result_name", pa.string()),
+        ("scraper_version", pa.string()),
+        ("title", pa.string()),
+        ("given_name", pa.string()),
+        ("family_name", pa.string()),
+        ("authors_translators", strings),
+        ("birth_date", pa.string()),
+        ("death_date", pa.string()),
+        ("tags", pa.list_(pa.struct([("tag", pa.string()), ("url", pa.string())]))),
+        ("bref", pa.list_(pa.struct([
+            ("title", pa.string()),
+            ("text", pa.string()),
+            ("link", strings),
+            ("birth_date", pa.string()),
+            ("death_date", pa.string()),
+        ]))),
+        ("sources", pa.list_(pa.struct([
+            ("section", pa.string()),
+            ("sources", pa.list_(pa.struct([
+                ("text", pa.string()),
+                ("author", strings),
+                ("tpub", strings),
+                ("journal", strings),
+                ("link", strings),
+            ]))),
+        ]))),
+        ("notice_links", pa.list_(pa.struct([("title", pa.string()), ("url", pa.string())]))),
+        ("metagrid_id", pa.string()),
+        ("metagrid_links", pa.string()), # json, its structure is the metagrid api's
+        ("wikidata_url", pa.string()),
+        ("wikipedia_page_title", pa.string()),
+        ("wiki_links", pa.string()), # json
+        ("text_blocks", pa.list_(pa.struct([("tag", pa.string()), ("text", pa.string())]))),
+        ("text_links", pa.list_(pa.list_(pa.struct([
+            ("start", pa.int64()),
+            ("end", pa.int64()),
+            ("mention", pa.string()),
+            ("href", pa.string()),
+            ("dhsid", pa.string()),
+            ("wikidata_url", pa.string()),
+            ("wikipedia_page_title", pa.string()),
+            ("wiki_links", pa.string()), # json
+        ])))),
+        ("text", pa.large_string()),
+        ("page_content", pa.large_string()),
+        ("other_properties", pa.string()), # json dict of the properties without a column
+    ])
+
+
+def article_to_row(article, drop_page_content=False):
+    """Returns the dict of column values of a DhsArticle, unset properties being None"""
+    json_dict = article.to_json(as_dict=True, drop_page_content=True)
+    json_dict.pop("url", None)
+    row = {}
+    for property in ["language", "id", "version", "search_result_name", "scraper_version", "title", "given_name",
+        "family_name", "authors_translators", "birth_date", "death_date", "tags", "bref", "notice_links", "metagrid_id",
+        "wikidata_url", "wikipedia_page_title"]:
+        row[property] = json_dict.pop(property, None)
+    for property in ["metagrid_links", "wiki_links"]:
+        row[property] = json_codec.dumps(json_dict.pop(property), ensure_ascii=False) if property in json_dict else None
+    sources = json_dict.pop("sources", None)
+    row["sources"] = [{"section": section, "sources": s} for section, s in sources.items()] if sources is not None else None
+    text_blocks = json_dict.pop("text_blocks", None)
+    row["text_blocks"] = [{"tag": tag, "text": text} for tag, text in text_blocks] if text_blocks is not None else None
+    text_links = json_dict.pop("text_links", None)
+    if text_links is not None:
+        text_links = [
+            [dict(l, wiki_links=json_codec.dumps(l["wiki_links"], ensure_ascii=False)) if "wiki_links" in l else l for l in block_links]
+            for block_links in text_links
+        ]
+    row["text_links"] = text_links
+    row["text"] = json_dict.pop("_text", None)
+    row["page_content"] = None if drop_page_content else article.page_content
+    row["other_properties"] = json_codec.dumps(json_dict, ensure_ascii=False) if len(json_dict)>0 else None
+    return row
+
+def row_to_json_dict(row):
+    """Returns the json dict of a DhsArticle from a dict of column values, as given to DhsArticle.from_json()"""
+    def drop_unset_fields(d, column):
+        return {k: v for k, v in d.items() if v is not None or k not in OPTIONAL_FIELDS[column]}
+    json_dict = {"search_result_name": row.get("search_result_name")}
+    for column, value in row.items():
+        if value is None or column in ["search_result_name", "other_properties"]:
+            continue
+        if column in ["metagrid_links", "wiki_links"]:
+            value = json_codec.loads(value)
+        elif column=="sources":
+            value = {s["section"]: [drop_unset_fields(source, column) for source in s["sources"]] for s in value}
+        elif column=="bref":
+            value = [drop_unset_fields(b, column) for b in value]
+        elif column=="text_blocks":
+            value = [[tb["tag"], tb["text"]] for tb in value]
+        elif column=="text_links":
+            for block_links in value:
+                for l in block_links:
+                    # wiki links fields are all set by wikidata.add_wikidata_wikipedia_to_text_links(), or none
+                    if l["wiki_links"] is None:
+                        del l["wikidata_url"], l["wikipedia_page_title"], l["wiki_links"]
+                    else:
+                        l["wiki_links"] = json_codec.loads(l["wiki_links"])
+        elif column=="text":
+            column = "_text"
+        json_dict[column] = value
+    if row.get("other_properties") is not None:
+        json_dict.update(json_codec.loads(row["other_properties"]))
+    return json_dict
+
+
+def stream_to_parquet(parquet_filepath, articles, row_group_size=PARQUET_ROW_GROUP_SIZE, drop_page_content=False, compression="zstd"):
+    """Saves DhsArticle to a parquet file from an iterable/generator, row_group_size articles at a time
+
+    Overwrites parquet_filepath. Articles are buffered row_group_size at a time: each row group records the min/max
+    of its columns, which load_articles_from_parquet() uses to skip row groups without wanted ids/languages/versions.
+    Returns the nb of articles written."""
+    pa = import_pyarrow()
+    schema = get_articles_schema()
+    nb_articles = 0
+    with pa.parquet.ParquetWriter(parquet_filepath, schema, compression=compression) as writer:
+        rows = []
+        for article in articles:
+            rows.append(article_to_row(article, drop_page_content))
+            if len(rows)==row_group_size:
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema), row_group_size=row_group_size)
+                nb_articles += len(rows)
+                rows = []
+        if len(rows)>0 or nb_articles==0:
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema), row_group_size=row_group_size)
+            nb_articles += len(rows)
+    return nb_articles
+
+def jsonl_to_parquet(jsonl_filepath, parquet_filepath, **kwargs):
+    """Converts a jsonl of DhsArticle to parquet, kwargs are the ones of stream_to_parquet()"""
+    return stream_to_parquet(parquet_filepath, DhsArticle.load_articles_from_jsonl(jsonl_filepath), **kwargs)
+
+
+def get_articles_filter(ids=None, languages=None, versions=None):
+    """Returns the pyarrow.dataset filter expression keeping articles with id in ids, language in languages, etc...
+
+    None arguments don't filter, returns None if all are None"""
+    pa = import_pyarrow()
+    article_filter = None
+    for column, values in [("id", ids), ("language", languages), ("version", versions)]:
+        if values is not None:
+            column_filter = pa.dataset.field(column).isin(list(values))
+            article_filter = column_filter if article_filter is None else (article_filter & column_filter)
+    return article_filter
+
+def load_parquet_table(parquet_filepath, columns=None, ids=None, languages=None, versions=None):
+    """Returns the pyarrow.Table of the articles of a parquet with only the given columns (default all)
+
+    Reads only the given columns, and only the row groups that can contain articles with id in ids, language
+    in languages and version in versions (None arguments don't filter). Useful to work with pandas: .to_pandas()"""
+    pa = import_pyarrow()
+    dataset = pa.dataset.dataset(parquet_filepath, format="parquet")
+    return dataset.to_table(columns=columns, filter=get_articles_filter(ids, languages, versions))
+
+def load_articles_from_parquet(parquet_filepath, columns=None, ids=None, languages=None, versions=None):
+    """Loads DhsArticle from a parquet file written by stream_to_parquet()
+
+    columns: properties to load (default all), language, id, version and search_result_name are always loaded.
+    The text is loaded with column "text", the articles only having the loaded properties
+    ids, languages, versions: if given, load only articles with id in ids, language in languages and version in versions.
+    Filters are pushed down to the parquet reader, row groups without matching articles aren't read.
+    """
+    pa = import_pyarrow()
+    if columns is not None:
+        columns = IDENTIFYING_COLUMNS+[c for c in columns if c not in IDENTIFYING_COLUMNS]
+        unknown_columns = [c for c in columns if c not in get_articles_schema().names]
+        if len(unknown_columns)>0:
+            raise Exception(f"dhs_scraper.columnar.load_articles_from_parquet(): unknown columns {unknown_columns}, available columns: {get_articles_schema().names}")
+    dataset = pa.dataset.dataset(parquet_filepath, format="parquet")
+    for batch in dataset.to_batches(columns=columns, filter=get_articles_filter(ids, languages, versions)):
+        for row in batch.to_pylist():
+            yield DhsArticle.from_json(row_to_json_dict(row))
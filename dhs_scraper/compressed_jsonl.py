@@ -0,0 +1,85 @@
+"""Block-compressed jsonl files
+
+A jsonl whose file name ends with .zst (zstandard, requires the zstandard package) or .gz (gzip) is compressed
+by blocks: each buffer of lines written by stream_to_jsonl() is an independent zstd frame or gzip member.
+The blocks concatenation is a regular .zst/.gz file (readable with zstdcat/zcat), new blocks can be appended to it,
+and a JsonlIndex can locate a line by the offset of its block and decompress only this block.
+"""
+import gzip
+from io import StringIO
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+COMPRESSION_EXTENSIONS = {".zst": "zstd", ".zstd": "zstd", ".gz": "gzip"}
+COMPRESSION_LEVELS = {"zstd": 3, "gzip": 6}
+READ_CHUNK_SIZE = 1<<20 # bytes
+
+
+def get_compression(jsonl_filepath):
+    """Returns the compression of a jsonl from its file extension: "zstd", "gzip" or None (plain text)"""
+    for extension, compression in COMPRESSION_EXTENSIONS.items():
+        if jsonl_filepath.endswith(extension):
+            if compression=="zstd" and zstandard is None:
+                raise Exception(f"dhs_scraper.compressed_jsonl.get_compression(): zstd compressed jsonl '{jsonl_filepath}' "+
+                    "requires the zstandard package (pip install zstandard), use a .gz extension for gzip compression")
+            return compression
+    return None
+
+def compress_block(data, compression, level=None):
+    """Returns bytes data compressed as an independent zstd frame or gzip member"""
+    level = level if level is not None else COMPRESSION_LEVELS[compression]
+    if compression=="zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return gzip.compress(data, level, mtime=0)
+
+def decompress_block(block, compression):
+    if compression=="zstd":
+        return zstandard.ZstdDecompressor().decompress(block)
+    return gzip.decompress(block)
+
+def get_block_decompressor(compression):
+    """Returns a decompressor stopping at the end of the first block, with eof and unused_data attributes"""
+    if compression=="zstd":
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(wbits=16+zlib.MAX_WBITS)
+
+def iterate_blocks(compressed_file, compression, offset=0):
+    """yields (block offset, block compressed length, decompressed block) for each complete block of compressed_file from offset
+
+    A truncated last block (being written) isn't yielded."""
+    compressed_file.seek(offset)
+    block_offset = offset
+    nb_fed_bytes = 0
+    decompressed_parts = []
+    decompressor = get_block_decompressor(compression)
+    data = compressed_file.read(READ_CHUNK_SIZE)
+    while len(data)>0:
+        decompressed_parts.append(decompressor.decompress(data))
+        nb_fed_bytes += len(data)
+        if decompressor.eof:
+            block_length = nb_fed_bytes-len(decompressor.unused_data)
+            yield block_offset, block_length, b"".join(decompressed_parts)
+            data = decompressor.unused_data if len(decompressor.unused_data)>0 else compressed_file.read(READ_CHUNK_SIZE)
+            block_offset += block_length
+            nb_fed_bytes = 0
+            decompressed_parts = []
+            decompressor = get_block_decompressor(compression)
+        else:
+            data = compressed_file.read(READ_CHUNK_SIZE)
+
+def iterate_jsonl_lines(jsonl_filepath):
+    """yields the str lines (with their newline) of a jsonl, compressed or not"""
+    compression = get_compression(jsonl_filepath)
+    if compression is None:
+        with open(jsonl_filepath, "r") as jsonl_file:
+            yield from jsonl_file
+        return
+    with open(jsonl_filepath, "rb") as jsonl_file:
+        for _, _, block in iterate_blocks(jsonl_file, compression):
+            # newline="\n": json lines written with ensure_ascii=False can contain unicode line separators such as \u2028
+            yield from StringIO(block.decode(), newline="\n")
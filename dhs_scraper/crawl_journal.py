@@ -0,0 +1,139 @@
+import json
+import os
+from os import path
+from threading import Lock
+
+
+JOURNAL_COMPACTION_NB_LINES = 1000 # journals with more lines are compacted when opened
+
+
+class CrawlJournal:
+    """Append-only journal of a crawl's progress, kept next to the crawl's output jsonl
+
+    Records:
+    - done_ids: ids of the articles written to the output
+    - the last completed search page of each partition (search url, alphabet letter for scrape_all_articles())
+    - failed: ids (-> url) of the articles whose parsing failed, to retry them with DhsArticle.retry_failed_articles()
+
+    A search page is completed once all its articles have been marked done, which stream_to_jsonl() does
+    after writing them: pass the same journal to the scraping function and to stream_to_jsonl().
+    Restarting a crawl with the journal resumes each partition at the page following its last completed one.
+    """
+    def __init__(self, journal_filepath):
+        self.journal_filepath = journal_filepath
+        self.done_ids = set()
+        self.failed = dict()
+        self.last_completed_pages = dict() # partition -> (last completed page number, nb pages of partition)
+        self._pages_pending_ids = dict() # (partition, page number) -> set of ids not yet done
+        self._closed_pages = dict() # (partition, page number) -> nb pages of partition
+        self._lock = Lock()
+        nb_lines = self._load()
+        if nb_lines>JOURNAL_COMPACTION_NB_LINES:
+            self.compact()
+        self._journal_file = open(self.journal_filepath, "a")
+
+    @staticmethod
+    def for_jsonl(jsonl_filepath):
+        """Returns the CrawlJournal of a crawl streamed to jsonl_filepath"""
+        return CrawlJournal(jsonl_filepath+".journal")
+
+    def _load(self):
+        nb_lines = 0
+        if not path.isfile(self.journal_filepath):
+            return nb_lines
+        with open(self.journal_filepath, "r") as journal_file:
+            for line in journal_file:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # last line truncated by a crash
+                    continue
+                nb_lines += 1
+                self._apply(record)
+        return nb_lines
+
+    def _apply(self, record):
+        if "done" in record:
+            self.done_ids.update(record["done"])
+        if "failed" in record:
+            self.failed.update(record["failed"])
+        if "retried" in record:
+            for id in record["retried"]:
+                self.failed.pop(id, None)
+        if "page" in record:
+            self.last_completed_pages[record["partition"]] = (record["page"], record["nb_pages"])
+
+    def _write(self, record):
+        self._journal_file.write(json.dumps(record, ensure_ascii=False)+"\n")
+        self._journal_file.flush()
+
+    def get_resume_page(self, partition):
+        """Returns the search page number at which to resume partition, None if partition is complete"""
+        if partition not in self.last_completed_pages:
+            return 0
+        last_page, nb_pages = self.last_completed_pages[partition]
+        if last_page+1>=nb_pages:
+            return None
+        return last_page+1
+
+    def add_page_article(self, partition, page_number, article_id):
+        """Records that article_id listed on page_number of partition must be done for the page to complete"""
+        with self._lock:
+            self._pages_pending_ids.setdefault((partition, page_number), set()).add(article_id)
+
+    def close_page(self, partition, page_number, nb_pages):
+        """Records that all articles of page_number have been added, the page completes once they are all done"""
+        with self._lock:
+            self._closed_pages[(partition, page_number)] = nb_pages
+            self._pages_pending_ids.setdefault((partition, page_number), set())
+            self._commit_completed_pages()
+
+    def mark_done(self, article_ids):
+        with self._lock:
+            article_ids = list(article_ids)
+            self.done_ids.update(article_ids)
+            self._write({"done": article_ids})
+            for pending_ids in self._pages_pending_ids.values():
+                pending_ids.difference_update(article_ids)
+            self._commit_completed_pages()
+
+    def mark_failed(self, article):
+        with self._lock:
+            self.failed[article.id] = article.url
+            self._write({"failed": {article.id: article.url}})
+
+    def mark_retried(self, article_ids):
+        with self._lock:
+            article_ids = list(article_ids)
+            for id in article_ids:
+                self.failed.pop(id, None)
+            self._write({"retried": article_ids})
+
+    def _commit_completed_pages(self):
+        """Writes completed pages, in page order for each partition"""
+        for partition in set(p for p, _ in self._closed_pages.keys()):
+            next_page = self.last_completed_pages[partition][0]+1 if partition in self.last_completed_pages else 0
+            while (partition, next_page) in self._closed_pages and len(self._pages_pending_ids[(partition, next_page)])==0:
+                nb_pages = self._closed_pages.pop((partition, next_page))
+                del self._pages_pending_ids[(partition, next_page)]
+                self.last_completed_pages[partition] = (next_page, nb_pages)
+                self._write({"partition": partition, "page": next_page, "nb_pages": nb_pages})
+                next_page += 1
+
+    def compact(self):
+        """Rewrites the journal file with one line per kind of record"""
+        with self._lock:
+            compact_filepath = self.journal_filepath+".compact"
+            with open(compact_filepath, "w") as compact_file:
+                compact_file.write(json.dumps({"done": sorted(self.done_ids)})+"\n")
+                compact_file.write(json.dumps({"failed": self.failed}, ensure_ascii=False)+"\n")
+                for partition, (page, nb_pages) in self.last_completed_pages.items():
+                    compact_file.write(json.dumps({"partition": partition, "page": page, "nb_pages": nb_pages}, ensure_ascii=False)+"\n")
+            if "_journal_file" in self.__dict__:
+                self._journal_file.close()
+            os.replace(compact_filepath, self.journal_filepath)
+            if "_journal_file" in self.__dict__:
+                self._journal_file = open(self.journal_filepath, "a")
+
+    def close(self):
+        self._journal_file.close()
@@ -0,0 +1,88 @@
+from threading import Lock
+from time import perf_counter
+
+
+# css selectors used to parse DHS pages, each compiled once to XPath on its first use
+# translator="html" gives the same semantics as lxml.html's HtmlElement.cssselect()
+SELECTORS_CSS = {
+    # article page
+    "title": ".hls-article-title",
+    "title_given_name": "span[itemprop=givenName]",
+    "title_family_name": "span[itemprop=familyName]",
+    "authors_translators": ".hls-article-text-author",
+    "media_content": ".media-content",
+    "text_elements": ".hls-article-text-unit p, h1, h2, .hls-article-text-unit h3, .hls-article-text-unit h4",
+    "sources_sections": "#_hls_references .panel",
+    "sources_section_title": ".panel-title",
+    "sources_section_source": "li",
+    "source_author": ".au",
+    "source_tpub": ".tpub",
+    "source_journal": "em",
+    "source_link": "a",
+    "notice_links": ".hls-service-box-left a",
+    "metagrid": "#hls-service-box-metagrid",
+    "service_box_title": ".hls-service-box-title",
+    "bref_box": ".hls-service-box-right .hls-service-box-element:first-child",
+    "bref_row": "tr",
+    "bref_row_title": ".hls-service-box-table-title",
+    "bref_row_text": ".hls-service-box-table-text",
+    "bref_row_link": ".hls-service-box-table-text a",
+    "bref_row_birth_date": ".hls-service-box-table-text span[itemProp=birthDate]",
+    "bref_row_death_date": ".hls-service-box-table-text span[itemProp=deathDate]",
+    "tags_box": ".hls-service-box-right .hls-service-box-element:last-child",
+    "tags_box_tag": "a",
+    # search results page
+    "search_pagination_last": ".pagination a:last-child",
+    "search_result": ".search-result a",
+    "search_result_title": ".search-result__title",
+}
+
+SELECTORS = dict() # name -> compiled CSSSelector, see get_selector()
+
+# name -> [nb calls, nb matched elements, cumulative seconds], None when timing is disabled
+SELECTORS_STATISTICS = None
+_statistics_lock = Lock()
+
+
+def get_selector(name):
+    """Returns the CSSSelector of SELECTORS_CSS[name], compiling it (and importing lxml.cssselect) on first use"""
+    selector = SELECTORS.get(name)
+    if selector is None:
+        from lxml.cssselect import CSSSelector
+        selector = SELECTORS[name] = CSSSelector(SELECTORS_CSS[name], translator="html")
+    return selector
+
+def select(name, element):
+    """Returns the list of elements matching selector name in element's subtree"""
+    if SELECTORS_STATISTICS is None:
+        return get_selector(name)(element)
+    selector = get_selector(name)
+    start = perf_counter()
+    result = selector(element)
+    elapsed = perf_counter()-start
+    with _statistics_lock:
+        statistics = SELECTORS_STATISTICS.setdefault(name, [0, 0, 0.0])
+        statistics[0] += 1
+        statistics[1] += len(result)
+        statistics[2] += elapsed
+    return result
+
+def enable_selectors_timing(enable=True):
+    """Starts (or stops if enable is False) recording the time and matches of each selector, resets the statistics"""
+    global SELECTORS_STATISTICS
+    SELECTORS_STATISTICS = dict() if enable else None
+
+def get_selectors_statistics():
+    """Returns a list of dict with keys selector, css, nb_calls, nb_matches, seconds, sorted by decreasing time"""
+    if SELECTORS_STATISTICS is None:
+        return []
+    with _statistics_lock:
+        statistics = [
+            {"selector": name, "css": SELECTORS_CSS[name], "nb_calls": s[0], "nb_matches": s[1], "seconds": s[2]}
+            for name, s in SELECTORS_STATISTICS.items()
+        ]
+    return sorted(statistics, key=lambda s: s["seconds"], reverse=True)
+
+def print_selectors_statistics():
+    for s in get_selectors_statistics():
+        print(f"{s['selector']:<25} {s['seconds']:>9.4f}s {s['nb_calls']:>9} calls {s['nb_matches']:>10} matches   {s['css']}")
@@ -0,0 +1,97 @@
+from threading import Lock
+from time import monotonic, sleep
+
+
+DEFAULT_POOL_SIZE = 16 # max nb of kept-alive connections per host
+DEFAULT_MAX_REQUESTS_PER_SECOND = 2 # default cap on requests to the DHS, the former 0.5s cool-down between articles
+
+# response header of a validator -> request header of the conditional request using it
+VALIDATOR_HEADERS = {"ETag": "If-None-Match", "Last-Modified": "If-Modified-Since"}
+
+
+class RateLimiter:
+    """Thread-safe token bucket capping requests to max_requests_per_second
+
+    burst is the number of requests that can be sent at once after an idle period.
+    A max_requests_per_second of None means no limit."""
+    def __init__(self, max_requests_per_second=None, burst=1):
+        self.max_requests_per_second = max_requests_per_second
+        self.burst = burst
+        self._tokens = burst
+        self._last_refill = monotonic()
+        self._lock = Lock()
+    def reserve(self):
+        """Takes one token from the bucket and returns the delay (in seconds) to wait before using it"""
+        if not self.max_requests_per_second:
+            return 0
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.burst, self._tokens + (now-self._last_refill)*self.max_requests_per_second)
+            self._last_refill = now
+            self._tokens -= 1
+            if self._tokens>=0:
+                return 0
+            return -self._tokens/self.max_requests_per_second
+    def wait(self):
+        """Blocks until a request can be sent"""
+        delay = self.reserve()
+        if delay>0:
+            sleep(delay)
+
+
+# global cap shared by all downloads not given their own rate limiter
+RATE_LIMITER = RateLimiter(DEFAULT_MAX_REQUESTS_PER_SECOND)
+_session = None
+_session_pool_size = 0
+_session_lock = Lock()
+
+def get_session(pool_size=None):
+    """Returns the requests.Session shared by all dhs_scraper downloads, creating it if needed
+
+    The session keeps connections alive in a pool of at least DEFAULT_POOL_SIZE connections per host. Threads sharing
+    the session give their number as pool_size: a larger pool than the current one replaces the session's adapters.
+    requests is imported here, on the first download, not when importing dhs_scraper."""
+    global _session, _session_pool_size
+    pool_size = max(pool_size or 0, DEFAULT_POOL_SIZE)
+    if _session is None or pool_size>_session_pool_size:
+        with _session_lock:
+            if _session is None:
+                import requests as r
+                _session = r.Session()
+            if pool_size>_session_pool_size:
+                from requests.adapters import HTTPAdapter
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+                former_adapters = {id(a): a for a in _session.adapters.values()}
+                # replaced in place rather than with mount(), which reorders the adapters iterated by concurrent requests
+                for prefix in list(_session.adapters.keys()):
+                    _session.adapters[prefix] = adapter
+                # connections in use are closed when released to a closed pool
+                for former_adapter in former_adapters.values():
+                    former_adapter.close()
+                _session_pool_size = pool_size
+    return _session
+
+def get_rate_limiter(max_requests_per_second=None):
+    """Returns a new RateLimiter capped to max_requests_per_second, the global RATE_LIMITER if None"""
+    return RateLimiter(max_requests_per_second) if max_requests_per_second is not None else RATE_LIMITER
+
+def set_max_requests_per_second(max_requests_per_second, burst=1):
+    """Sets the global cap on requests per second shared by all dhs_scraper downloads, None for no cap"""
+    RATE_LIMITER.max_requests_per_second = max_requests_per_second
+    RATE_LIMITER.burst = burst
+
+def get_validators(response):
+    """Returns the dict of the validators (ETag, Last-Modified) sent with response, empty if the server sends none"""
+    return {h: response.headers[h] for h in VALIDATOR_HEADERS if h in response.headers}
+
+def get_conditional(url, validators, rate_limiter=None, **kwargs):
+    """GET url only if modified since the response having validators (see get_validators()),
+    the response's status code is 304 if not modified"""
+    headers = dict(kwargs.pop("headers", None) or {})
+    headers.update((VALIDATOR_HEADERS[h], v) for h, v in validators.items())
+    return get(url, rate_limiter, headers=headers, **kwargs)
+
+def get(url, rate_limiter=None, **kwargs):
+    """GET url through the shared session, waiting on rate_limiter (global RATE_LIMITER by default)"""
+    (rate_limiter if rate_limiter is not None else RATE_LIMITER).wait()
+    return get_session().get(url, **kwargs)
@@ -0,0 +1,135 @@
+"""Incremental update of a corpus of DhsArticle: only new or changed articles are downloaded
+
+Search results list articles with their version (in their url): CorpusVersions holds the version of each article
+of an existing corpus jsonl, and DhsArticle.scrape_articles_from_search_url(corpus_versions=...) (as well as
+scrape_all_articles() and async_crawler.crawl_all_articles()) skips the listed articles whose version is already
+in the corpus. An article listed without version is checked with a conditional request (If-None-Match,
+If-Modified-Since) when its corpus version kept the validators sent by the server (DhsArticle.page_validators).
+The new and changed articles are streamed to a delta jsonl, merged into the corpus with merge_delta().
+"""
+from collections import Counter
+import os
+from os import path
+from threading import Lock
+
+from . import fetching, json_codec
+from .compressed_jsonl import iterate_jsonl_lines
+from .DhsArticle import DhsArticle, article_jsonl_id_regex
+from .jsonl_index import JsonlIndex
+from .utils import JsonLine, stream_to_jsonl
+
+
+class CorpusVersions:
+    """Versions of the articles of a corpus jsonl, to decide which listed articles must be downloaded
+
+    self.versions maps each article id to its version in the corpus (the last one if the id has several lines).
+    self.statistics counts the listed articles by status: "new", "changed", "unchanged", and "unknown" for
+    articles listed without version that couldn't be checked (downloaded anyway).
+    The JsonlIndex of the corpus, to read the page_validators of articles listed without version, is loaded once
+    on first need.
+    """
+    def __init__(self, jsonl_filepath):
+        self.jsonl_filepath = jsonl_filepath
+        self.versions = dict()
+        if path.isfile(jsonl_filepath):
+            # lazy articles: only the identifiers of each line are read
+            for article in DhsArticle.load_articles_from_jsonl(jsonl_filepath, lazy=True):
+                self.versions[article.id] = article.version
+        self.statistics = Counter()
+        self._lock = Lock()
+        self._index = None
+
+    def __len__(self):
+        return len(self.versions)
+
+    def get_status(self, article):
+        """Returns "new", "changed" or "unchanged" for an article listed in search results,
+        None if the article is in the corpus but listed without version"""
+        if article.id not in self.versions:
+            return "new"
+        if article.version is None:
+            return None
+        return "unchanged" if article.version==self.versions[article.id] else "changed"
+
+    def get_page_validators(self, id):
+        """Returns the page_validators of the corpus article id, None if it has none
+
+        Reads the article's last line through the corpus' JsonlIndex, built if it doesn't exist yet."""
+        if id not in self.versions:
+            return None
+        with self._lock:
+            if self._index is None:
+                self._index = JsonlIndex(self.jsonl_filepath)
+        for i, line in self._index.iterate_lines(self._index.get_line_numbers(id)[-1:]):
+            return json_codec.loads(line).get("page_validators")
+        return None
+
+    def check_modified(self, article):
+        """Returns the status of an article listed without version through a conditional request of its page
+
+        If the page was modified, the response sets the article's page: it isn't downloaded a second time."""
+        validators = self.get_page_validators(article.id)
+        if not validators:
+            return "unknown"
+        response = fetching.get_conditional(article.url, validators)
+        if response.status_code==304:
+            return "unchanged"
+        article.set_page_from_response(response)
+        return "changed"
+
+    def is_new_or_changed(self, article):
+        """Whether an article listed in search results must be downloaded, counted in self.statistics"""
+        status = self.get_status(article)
+        if status is None:
+            status = self.check_modified(article)
+        with self._lock:
+            self.statistics[status] += 1
+        return status!="unchanged"
+
+    def print_statistics(self):
+        print(f"CorpusVersions of {self.jsonl_filepath}: "+", ".join(f"{self.statistics[s]} {s}" for s in ["new", "changed", "unchanged", "unknown"]))
+
+
+def merge_delta(corpus_jsonl_filepath, delta_jsonl_filepath, output_jsonl_filepath=None):
+    """Merges the articles of a delta jsonl (from an incremental scrape) into a corpus jsonl, returns (nb replaced, nb added)
+
+    Each corpus article having an article with the same id in the delta is replaced by it at its position (by the
+    last one if the id has several lines in the delta), the other delta articles are appended in delta order.
+    Lines are copied as they are, without decoding the articles.
+    output_jsonl_filepath: by default the corpus jsonl itself, replaced once the merge is complete. An existing
+    JsonlIndex of the output is rebuilt."""
+    if output_jsonl_filepath is None:
+        output_jsonl_filepath = corpus_jsonl_filepath
+    delta_lines = dict() # id -> line
+    for line in iterate_jsonl_lines(delta_jsonl_filepath):
+        if not line.isspace():
+            delta_lines[article_jsonl_id_regex.search(line).group(1)] = line.rstrip("\n")
+    replaced_ids = set()
+    def iterate_merged_lines():
+        if path.isfile(corpus_jsonl_filepath):
+            for line in iterate_jsonl_lines(corpus_jsonl_filepath):
+                if line.isspace():
+                    continue
+                id = article_jsonl_id_regex.search(line).group(1)
+                if id in delta_lines:
+                    if id in replaced_ids:
+                        # former duplicate line of a replaced article
+                        continue
+                    replaced_ids.add(id)
+                    yield JsonLine(id, delta_lines[id])
+                else:
+                    yield JsonLine(id, line.rstrip("\n"))
+        for id, line in delta_lines.items():
+            if id not in replaced_ids:
+                yield JsonLine(id, line)
+    # written to a temporary file next to the output, with the same extension for the same compression
+    tmp_filepath = path.join(path.dirname(output_jsonl_filepath), ".merging."+path.basename(output_jsonl_filepath))
+    if path.exists(tmp_filepath):
+        os.remove(tmp_filepath)
+    stream_to_jsonl(tmp_filepath, iterate_merged_lines(), update_index=False)
+    os.replace(tmp_filepath, output_jsonl_filepath)
+    if JsonlIndex.exists(output_jsonl_filepath):
+        os.remove(JsonlIndex.get_index_filepath(output_jsonl_filepath))
+        JsonlIndex(output_jsonl_filepath)
+    nb_replaced = len(replaced_ids)
+    return nb_replaced, len(delta_lines)-nb_replaced
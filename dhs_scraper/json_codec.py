@@ -0,0 +1,44 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+JSON_BACKENDS = ["orjson", "json"]
+JSON_BACKEND = "orjson" if orjson is not None else "json"
+
+
+def set_json_backend(backend):
+    """Sets the json library used to (de)serialize DhsArticle, one of JSON_BACKENDS
+
+    "orjson" (default if installed) is much faster, "json" is python's standard library.
+    Both produce compatible json, orjson's being more compact (no space after separators)."""
+    global JSON_BACKEND
+    if backend not in JSON_BACKENDS:
+        raise Exception(f"dhs_scraper.json_codec.set_json_backend(): unknown backend {backend}, must be one of {JSON_BACKENDS}")
+    if backend=="orjson" and orjson is None:
+        raise Exception("dhs_scraper.json_codec.set_json_backend(): orjson backend requires the orjson package (pip install orjson)")
+    JSON_BACKEND = backend
+
+def get_json_backend():
+    return JSON_BACKEND
+
+def dumps(obj, *args, ensure_ascii=True, **kwargs):
+    """Serializes obj to a json str, same arguments as json.dumps()
+
+    Uses orjson when it is the backend and no option it lacks is asked (ensure_ascii=True, indent, etc...)."""
+    if JSON_BACKEND=="orjson" and not ensure_ascii and len(args)==0 and len(kwargs)==0:
+        try:
+            return orjson.dumps(obj).decode()
+        except TypeError:
+            # types orjson doesn't handle: fall back to json
+            pass
+    return json.dumps(obj, *args, ensure_ascii=ensure_ascii, **kwargs)
+
+def loads(s):
+    """Deserializes a json str or bytes"""
+    if JSON_BACKEND=="orjson":
+        return orjson.loads(s)
+    return json.loads(s)
@@ -0,0 +1,146 @@
+from array import array
+import mmap
+from os import path
+import re
+
+from .compressed_jsonl import get_compression, decompress_block, iterate_blocks
+
+
+# id of the record on a jsonl line, as written by DhsArticle.to_json()
+jsonl_line_id_regex = re.compile(rb'^.+?"id": ?"([^"]+)"')
+
+
+class JsonlIndex:
+    """Sidecar index of a jsonl file, mapping each line number and record id to its byte offset and length
+
+    Stored next to the jsonl in jsonl_filepath+".idx", one tab-separated "line_number id offset length" row per line.
+    For block-compressed jsonl (see compressed_jsonl.py), rows are "line_number id offset length block_offset block_length":
+    the line is at offset in the decompressed block of block_length bytes starting at block_offset in the jsonl.
+    Built once with a full scan of the jsonl, then kept up-to-date by stream_to_jsonl() and by update(),
+    which indexes lines appended since the last update.
+    """
+    def __init__(self, jsonl_filepath):
+        self.jsonl_filepath = jsonl_filepath
+        self.index_filepath = JsonlIndex.get_index_filepath(jsonl_filepath)
+        self.compression = get_compression(jsonl_filepath)
+        self.ids = []
+        self.offsets = array("Q")
+        self.lengths = array("Q")
+        self.block_offsets = array("Q")
+        self.block_lengths = array("Q")
+        self._line_numbers_by_id = dict()
+        if path.isfile(self.index_filepath):
+            self._load()
+        self.update()
+
+    @staticmethod
+    def get_index_filepath(jsonl_filepath):
+        return jsonl_filepath+".idx"
+
+    @staticmethod
+    def exists(jsonl_filepath):
+        return path.isfile(JsonlIndex.get_index_filepath(jsonl_filepath))
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def indexed_size(self):
+        """nb of bytes of the jsonl covered by the index"""
+        if len(self.ids)==0:
+            return 0
+        if self.compression is not None:
+            return self.block_offsets[-1]+self.block_lengths[-1]
+        return self.offsets[-1]+self.lengths[-1]+1
+
+    def _load(self):
+        with open(self.index_filepath, "r") as index_file:
+            for row in index_file:
+                line_number, id, *offsets_lengths = row.rstrip("\n").split("\t")
+                if int(line_number)!=len(self.ids) or len(offsets_lengths)!=(2 if self.compression is None else 4):
+                    # corrupted index: rebuild
+                    self._reset()
+                    return
+                self._add(id, *(int(ol) for ol in offsets_lengths))
+
+    def _reset(self):
+        self.ids = []
+        self.offsets = array("Q")
+        self.lengths = array("Q")
+        self.block_offsets = array("Q")
+        self.block_lengths = array("Q")
+        self._line_numbers_by_id = dict()
+        open(self.index_filepath, "w").close()
+
+    def _add(self, id, offset, length, block_offset=None, block_length=None):
+        self._line_numbers_by_id.setdefault(id, []).append(len(self.ids))
+        self.ids.append(id)
+        self.offsets.append(offset)
+        self.lengths.append(length)
+        if self.compression is not None:
+            self.block_offsets.append(block_offset)
+            self.block_lengths.append(block_length)
+
+    def add_lines(self, ids_offsets_lengths):
+        """Indexes lines just appended to the jsonl, given as (id, offset, length) with length excluding the newline
+
+        For compressed jsonl: (id, offset, length, block_offset, block_length), offset being in the decompressed block"""
+        with open(self.index_filepath, "a") as index_file:
+            for id, *offsets_lengths in ids_offsets_lengths:
+                index_file.write("\t".join([str(len(self.ids)), id]+[str(ol) for ol in offsets_lengths])+"\n")
+                self._add(id, *offsets_lengths)
+
+    def update(self):
+        """Indexes the lines appended to the jsonl since the last update, rebuilds the index if the jsonl shrank"""
+        jsonl_size = path.getsize(self.jsonl_filepath) if path.isfile(self.jsonl_filepath) else 0
+        if jsonl_size<self.indexed_size:
+            self._reset()
+        if jsonl_size==self.indexed_size:
+            return
+        new_lines = []
+        if self.compression is not None:
+            with open(self.jsonl_filepath, "rb") as jsonl_file:
+                for block_offset, block_length, block in iterate_blocks(jsonl_file, self.compression, self.indexed_size):
+                    offset = 0
+                    for line in block.split(b"\n")[:-1]:
+                        id_match = jsonl_line_id_regex.search(line)
+                        new_lines.append((id_match.group(1).decode() if id_match else "", offset, len(line), block_offset, block_length))
+                        offset += len(line)+1
+            self.add_lines(new_lines)
+            return
+        with open(self.jsonl_filepath, "rb") as jsonl_file:
+            offset = self.indexed_size
+            jsonl_file.seek(offset)
+            for line in jsonl_file:
+                if not line.endswith(b"\n"):
+                    # line being written, will be indexed at next update
+                    break
+                id_match = jsonl_line_id_regex.search(line)
+                new_lines.append((id_match.group(1).decode() if id_match else "", offset, len(line)-1))
+                offset += len(line)
+        self.add_lines(new_lines)
+
+    def get_line_numbers(self, id):
+        return self._line_numbers_by_id.get(id, [])
+
+    def iterate_lines(self, line_numbers):
+        """yields (line_number, line) for the given line numbers, in increasing line number order, reading through a memory map"""
+        line_numbers = sorted(set(ln for ln in line_numbers if 0<=ln<len(self.ids)))
+        if len(line_numbers)==0:
+            return
+        if self.compression is not None:
+            with open(self.jsonl_filepath, "rb") as jsonl_file:
+                block_offset = None
+                for line_number in line_numbers:
+                    if self.block_offsets[line_number]!=block_offset:
+                        # lines are sorted: each needed block is decompressed once
+                        block_offset = self.block_offsets[line_number]
+                        jsonl_file.seek(block_offset)
+                        block = decompress_block(jsonl_file.read(self.block_lengths[line_number]), self.compression)
+                    offset = self.offsets[line_number]
+                    yield line_number, block[offset:(offset+self.lengths[line_number])].decode()
+            return
+        with open(self.jsonl_filepath, "rb") as jsonl_file, mmap.mmap(jsonl_file.fileno(), 0, access=mmap.ACCESS_READ) as jsonl_map:
+            for line_number in line_numbers:
+                offset = self.offsets[line_number]
+                yield line_number, jsonl_map[offset:(offset+self.lengths[line_number])].decode()
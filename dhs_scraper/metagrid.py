@@ -0,0 +1,134 @@
+"""Metagrid links of DHS articles: links from https://metagrid.ch/ to the same entity in other databases
+
+DhsArticle.parse_metagrid() reads the article's metagrid id from its page and by default fetches its links
+right away. With DhsArticle.parse_article(metagrid="defer"), only the metagrid id is parsed: add_metagrid_links()
+then fetches the links of a stream of articles concurrently, under its own rate limit (metagrid is another server
+than the DHS), each distinct metagrid id being fetched once and the results cached in the page cache.
+"""
+import json
+from sys import stderr
+from traceback import print_exc
+
+from . import fetching
+from .page_cache import get_page_cache
+from .utils import map_concurrently
+
+
+METAGRID_BASE_URL = "https://api.metagrid.ch/widget/dhs/person/<article_id>.json?lang=<language>&include=true"
+DEFAULT_METAGRID_NB_WORKERS = 8
+METAGRID_BATCH_SIZE = 100 # nb of articles per batch of add_metagrid_links()
+
+# cap on requests per second to the metagrid api, independent from the DHS one (fetching.RATE_LIMITER)
+METAGRID_RATE_LIMITER = fetching.RateLimiter(10)
+
+
+def set_metagrid_max_requests_per_second(max_requests_per_second, burst=1):
+    """Sets the cap on requests per second to the metagrid api, None for no cap"""
+    METAGRID_RATE_LIMITER.max_requests_per_second = max_requests_per_second
+    METAGRID_RATE_LIMITER.burst = burst
+
+def get_metagrid_language(dhs_article):
+    return dhs_article.language if dhs_article.language else "de"
+
+def get_metagrid_url(metagrid_id, language):
+    return METAGRID_BASE_URL.replace("<article_id>", metagrid_id).replace("<language>", language)
+
+def fetch_metagrid_links(metagrid_id, language, rate_limiter=None):
+    """Downloads the metagrid links of metagrid_id, returns (links, json str), (None, None) if the api doesn't answer 200"""
+    metagrid_url = get_metagrid_url(metagrid_id, language)
+    metagrid_resp = fetching.get(metagrid_url, rate_limiter if rate_limiter is not None else METAGRID_RATE_LIMITER)
+    if metagrid_resp.status_code==200:
+        return metagrid_resp.json(), metagrid_resp.content.decode()
+    print(f"dhs_scraper.metagrid.fetch_metagrid_links() failure to get metagrid links for metagrid id {metagrid_id} with metagrid url: {metagrid_url}")
+    return None, None
+
+def get_cached_metagrid_links(dhs_article):
+    """Returns the metagrid links of dhs_article from the page cache, None if not cached"""
+    page_cache = get_page_cache()
+    cached_metagrid = page_cache.get("metagrid", dhs_article.language, dhs_article.id, dhs_article.version) if page_cache is not None else None
+    return json.loads(cached_metagrid) if cached_metagrid is not None else None
+
+def cache_metagrid_links(dhs_article, metagrid_json):
+    page_cache = get_page_cache()
+    if page_cache is not None:
+        page_cache.put("metagrid", dhs_article.language, dhs_article.id, dhs_article.version, metagrid_json)
+
+def get_metagrid_links(dhs_article, rate_limiter=None):
+    """Returns the metagrid links of dhs_article (having its metagrid_id), from the page cache or downloaded (and cached)
+
+    Returns [] if the metagrid api fails, raises an Exception if the page cache is offline and hasn't the links"""
+    metagrid_links = get_cached_metagrid_links(dhs_article)
+    if metagrid_links is not None:
+        return metagrid_links
+    page_cache = get_page_cache()
+    if page_cache is not None and page_cache.offline:
+        raise Exception(f"dhs_scraper.metagrid.get_metagrid_links(): page cache is offline and has no metagrid links for article {(dhs_article.language, dhs_article.id, dhs_article.version)}")
+    metagrid_links, metagrid_json = fetch_metagrid_links(dhs_article.metagrid_id, get_metagrid_language(dhs_article), rate_limiter)
+    if metagrid_links is None:
+        return []
+    cache_metagrid_links(dhs_article, metagrid_json)
+    return metagrid_links
+
+def needs_metagrid_links(dhs_article):
+    """Whether dhs_article has a metagrid id but no metagrid links yet (parsed with parse_article(metagrid="defer"))"""
+    return "metagrid_id" in dhs_article.__dict__ and dhs_article.metagrid_id is not None and "metagrid_links" not in dhs_article.__dict__
+
+def add_metagrid_links(dhs_articles, nb_workers=DEFAULT_METAGRID_NB_WORKERS, batch_size=METAGRID_BATCH_SIZE, rate_limiter=None):
+    """yields the DhsArticle of iterable dhs_articles with their metagrid_links set, fetched concurrently
+
+    Only articles having a metagrid_id and no metagrid_links (see needs_metagrid_links()) are completed, others
+    are yielded unchanged, in the same order. Works on batch_size articles at a time: their links are taken
+    from the page cache, or fetched by nb_workers threads under rate_limiter (default METAGRID_RATE_LIMITER),
+    each distinct (metagrid id, language) being fetched once for the whole stream.
+    An article whose links couldn't be fetched (network error, offline page cache) is yielded without metagrid_links.
+    Streaming: can be used between a crawl (or DhsArticle.load_articles_from_jsonl()) and stream_to_jsonl()."""
+    fetching.get_session(nb_workers)
+    fetched_by_key = dict() # (metagrid_id, language) -> (links, json str), (None, None) if the api failed
+    def fetch(key):
+        try:
+            return key, fetch_metagrid_links(*key, rate_limiter=rate_limiter)
+        except Exception as e:
+            print(f"ERROR FETCHING METAGRID LINKS OF METAGRID ID: {key[0]}", file=stderr)
+            print_exc(file=stderr)
+            return key, None
+    def set_fetched_links(dhs_article, metagrid_links, metagrid_json):
+        if metagrid_links is None:
+            dhs_article.metagrid_links = []
+        else:
+            dhs_article.metagrid_links = metagrid_links
+            cache_metagrid_links(dhs_article, metagrid_json)
+    def add_links(batch):
+        page_cache = get_page_cache()
+        articles_to_fetch = dict() # (metagrid_id, language) -> articles
+        for a in batch:
+            if not needs_metagrid_links(a):
+                continue
+            key = (a.metagrid_id, get_metagrid_language(a))
+            metagrid_links = get_cached_metagrid_links(a)
+            if metagrid_links is not None:
+                a.metagrid_links = metagrid_links
+            elif key in fetched_by_key:
+                set_fetched_links(a, *fetched_by_key[key])
+            else:
+                articles_to_fetch.setdefault(key, []).append(a)
+        if len(articles_to_fetch)==0:
+            return
+        if page_cache is not None and page_cache.offline:
+            print(f"dhs_scraper.metagrid.add_metagrid_links(): page cache is offline, not fetching the metagrid links of {len(articles_to_fetch)} metagrid ids", file=stderr)
+            return
+        for key, fetched in map_concurrently(fetch, articles_to_fetch.keys(), nb_workers, keep_order=False):
+            if fetched is None:
+                continue
+            fetched_by_key[key] = fetched
+            for a in articles_to_fetch[key]:
+                set_fetched_links(a, *fetched)
+    batch = []
+    for dhs_article in dhs_articles:
+        batch.append(dhs_article)
+        if len(batch)>=batch_size:
+            add_links(batch)
+            yield from batch
+            batch = []
+    if len(batch)>0:
+        add_links(batch)
+        yield from batch
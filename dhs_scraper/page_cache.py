@@ -0,0 +1,117 @@
+import gzip
+from hashlib import sha1
+import os
+from os import path
+from threading import Lock, get_ident
+from time import time
+
+
+# once over max_size_bytes, the cache is evicted down to this fraction of it, not to scan it again at each put()
+EVICTION_LOW_WATER_MARK = 0.9
+
+class PageCache:
+    """On-disk cache of downloaded DHS content (article pages, metagrid json)
+
+    Entries are keyed by (kind, language, id, version), kind being "page" or "metagrid",
+    and stored gzip-compressed in a file named after the sha1 of their key.
+
+    max_size_bytes: if not None, oldest entries are evicted when the cache grows over this size
+    max_age_seconds: if not None, entries older than this are considered missing and evicted
+    offline: if True, DhsArticle downloads are served only from the cache, a missing entry raises an Exception
+    """
+    def __init__(self, cache_folder, max_size_bytes=None, max_age_seconds=None, offline=False, compression_level=6):
+        self.cache_folder = cache_folder
+        self.max_size_bytes = max_size_bytes
+        self.max_age_seconds = max_age_seconds
+        self.offline = offline
+        self.compression_level = compression_level
+        self._lock = Lock()
+        os.makedirs(cache_folder, exist_ok=True)
+        self._size_bytes = sum(size for _, _, size in self._iterate_entries())
+
+    def get_path(self, kind, language, id, version):
+        key = "/".join([kind, str(language), str(id), str(version)])
+        key_hash = sha1(key.encode()).hexdigest()
+        # sub-folders by hash prefix to avoid huge folders
+        return path.join(self.cache_folder, key_hash[0:2], key_hash+".gz")
+
+    def _is_expired(self, mtime):
+        return self.max_age_seconds is not None and (time()-mtime)>self.max_age_seconds
+
+    def get(self, kind, language, id, version):
+        """returns the cached str content, None if not (or no more) in cache"""
+        entry_path = self.get_path(kind, language, id, version)
+        try:
+            if self._is_expired(path.getmtime(entry_path)):
+                self._remove(entry_path)
+                return None
+            with open(entry_path, "rb") as f:
+                return gzip.decompress(f.read()).decode()
+        except FileNotFoundError:
+            return None
+
+    def put(self, kind, language, id, version, content):
+        """stores str content in the cache"""
+        entry_path = self.get_path(kind, language, id, version)
+        compressed = gzip.compress(content.encode(), self.compression_level)
+        os.makedirs(path.dirname(entry_path), exist_ok=True)
+        # write-then-rename so that concurrent readers never see a partial entry
+        tmp_path = f"{entry_path}.{os.getpid()}.{get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(compressed)
+        previous_size = path.getsize(entry_path) if path.exists(entry_path) else 0
+        os.replace(tmp_path, entry_path)
+        with self._lock:
+            self._size_bytes += len(compressed)-previous_size
+        if self.max_size_bytes is not None and self._size_bytes>self.max_size_bytes:
+            self.evict()
+
+    def _remove(self, entry_path):
+        try:
+            size = path.getsize(entry_path)
+            os.remove(entry_path)
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._size_bytes -= size
+
+    def _iterate_entries(self):
+        """yields (path, mtime, size) for all cache entries"""
+        for sub_folder in os.scandir(self.cache_folder):
+            if sub_folder.is_dir():
+                for entry in os.scandir(sub_folder.path):
+                    if entry.name.endswith(".gz"):
+                        stat = entry.stat()
+                        yield entry.path, stat.st_mtime, stat.st_size
+
+    def evict(self):
+        """Removes expired entries, then if the cache is over max_size_bytes, the oldest ones until it is under
+        EVICTION_LOW_WATER_MARK*max_size_bytes"""
+        target_size = None
+        if self.max_size_bytes is not None and self._size_bytes>self.max_size_bytes:
+            target_size = EVICTION_LOW_WATER_MARK*self.max_size_bytes
+        entries = sorted(self._iterate_entries(), key=lambda e: e[1])
+        for entry_path, mtime, size in entries:
+            over_size = target_size is not None and self._size_bytes>target_size
+            if not (over_size or self._is_expired(mtime)):
+                break
+            self._remove(entry_path)
+
+    def clear(self):
+        for entry_path, _, _ in list(self._iterate_entries()):
+            self._remove(entry_path)
+
+    @property
+    def size_bytes(self):
+        return self._size_bytes
+
+
+PAGE_CACHE = None
+
+def set_page_cache(page_cache):
+    """Sets the PageCache used by all DhsArticle downloads, None to disable caching"""
+    global PAGE_CACHE
+    PAGE_CACHE = page_cache
+
+def get_page_cache():
+    return PAGE_CACHE
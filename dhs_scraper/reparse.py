@@ -0,0 +1,152 @@
+"""Offline re-parse of a corpus of DhsArticle across processes
+
+A jsonl of articles saved with their page_content (default of stream_to_jsonl()) holds all the raw html of the
+corpus: reparse_jsonl() runs DhsArticle.parse_article() again on each page, for example after a parser change,
+without any network access. Parsing (lxml) is CPU-bound: chunks of json lines are spread over a pool of
+processes, results being streamed to a new jsonl in the input order.
+Articles saved without their page_content get it from a page cache folder (see page_cache.py), read offline.
+"""
+import os
+from sys import stderr
+from time import perf_counter
+from traceback import print_exc
+
+from . import json_codec
+from .compressed_jsonl import iterate_jsonl_lines
+from .DhsArticle import DhsArticle
+from .page_cache import PageCache, get_page_cache, set_page_cache
+from .utils import JsonLine, intern_str, map_concurrently, stream_to_jsonl
+
+
+REPARSE_CHUNK_SIZE = 50 # nb of articles sent at once to a worker process
+
+# properties produced by DhsArticle.parse_article(): never copied from the input line, a property that the current
+# parser doesn't produce (anymore) mustn't survive re-parsing
+PARSED_PROPERTIES = {
+    "title", "given_name", "family_name", "authors_translators", "text_blocks", "_text", "text", "text_links",
+    "sources", "notice_links", "bref", "birth_date", "death_date", "tags"
+}
+# properties of parse_metagrid() parsed again, by metagrid argument
+METAGRID_PROPERTIES = {True: {"metagrid_id", "metagrid_links"}, "defer": {"metagrid_id"}, False: set()}
+# identifiers and properties set by DhsArticle itself, and properties derived from parsed ones (recomputed on demand)
+NOT_COPIED_PROPERTIES = {
+    "search_result_name", "name", "language", "id", "version", "url", "page_content", "scraper_version",
+    "added_wikidata_wikipedia_to_text_links", "_initial"
+}
+
+# worker process settings, set by init_reparse_worker()
+WORKER_METAGRID = "defer"
+WORKER_TO_JSON_KWARGS = dict()
+
+
+def init_reparse_worker(page_cache_folder, metagrid, to_json_kwargs):
+    """Sets a worker process' settings, the page cache being offline: workers never access the network"""
+    global WORKER_METAGRID, WORKER_TO_JSON_KWARGS
+    set_page_cache(PageCache(page_cache_folder, offline=True) if page_cache_folder is not None else None)
+    WORKER_METAGRID = metagrid
+    WORKER_TO_JSON_KWARGS = to_json_kwargs
+
+def get_unparsed_properties(json_dict, metagrid="defer"):
+    """Returns the properties of an article's json dict that re-parsing with metagrid doesn't produce
+    (page_validators, wiki_links, wikidata_url, metagrid_links unless metagrid is True, etc...)"""
+    parsed_properties = PARSED_PROPERTIES | METAGRID_PROPERTIES[metagrid]
+    return {k: v for k, v in json_dict.items() if k not in parsed_properties and k not in NOT_COPIED_PROPERTIES}
+
+def reparse_json_line(json_line):
+    """Returns (id, json line, success) of the article of json_line re-parsed from its page_content
+
+    The article is created anew from its identifiers and page: all parsed properties come from the current
+    parser, the other properties of json_line are copied (see get_unparsed_properties()).
+    If parsing fails, json_line is returned unchanged."""
+    json_dict = json_codec.loads(json_line)
+    article = DhsArticle(
+        intern_str(json_dict["language"]), json_dict["id"], intern_str(json_dict["version"]),
+        json_dict.get("search_result_name", json_dict.get("name"))
+    )
+    article.page_content = json_dict.get("page_content")
+    try:
+        if not article.page_content and not article.load_page_from_cache():
+            raise Exception(f"dhs_scraper.reparse.reparse_json_line(): no page_content nor cached page for article {(article.language, article.id, article.version)}")
+        article.parse_article(WORKER_METAGRID)
+    except Exception as e:
+        print(f"ERROR PARSING ARTICLE WITH DHS-ID: {article.id}", file=stderr)
+        print_exc(file=stderr)
+        return article.id, json_line.rstrip("\n"), False
+    for property, value in get_unparsed_properties(json_dict, WORKER_METAGRID).items():
+        article.__dict__.setdefault(property, value)
+    return article.id, article.to_json(ensure_ascii=False, **WORKER_TO_JSON_KWARGS), True
+
+def reparse_chunk(json_lines):
+    """Re-parses a chunk of json lines in a worker process, returns (pid, seconds, [(id, json line, success)])"""
+    start = perf_counter()
+    results = [reparse_json_line(json_line) for json_line in json_lines]
+    return os.getpid(), perf_counter()-start, results
+
+def iterate_chunks(json_lines, chunk_size):
+    chunk = []
+    for json_line in json_lines:
+        if json_line.isspace():
+            continue
+        chunk.append(json_line)
+        if len(chunk)>=chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk)>0:
+        yield chunk
+
+def reparse_json_lines(json_lines, nb_workers=None, chunk_size=REPARSE_CHUNK_SIZE, page_cache_folder=None,
+                    metagrid="defer", drop_page_content=False, workers_statistics=None):
+    """yields the JsonLine of the articles of iterable json_lines re-parsed in nb_workers processes, in order
+
+    nb_workers: nb of processes, default os.cpu_count()
+    chunk_size: nb of articles sent at once to a process
+    page_cache_folder: folder of a PageCache (read offline) for articles without page_content
+    metagrid: metagrid argument of DhsArticle.parse_article(), "defer" (default) only parses the metagrid id
+    and False skips it, True reads the links from the page cache only
+    drop_page_content: to_json() argument for the re-parsed articles
+    workers_statistics: if given, a dict filled with pid -> {"nb_articles", "nb_failed", "seconds"} of each process
+    """
+    if metagrid not in [True, False, "defer"]:
+        raise Exception(f"dhs_scraper.reparse.reparse_json_lines(): metagrid must be True, False or \"defer\", not {metagrid}")
+    if metagrid is True and page_cache_folder is None:
+        raise Exception("dhs_scraper.reparse.reparse_json_lines(): metagrid=True requires a page_cache_folder, re-parsing never accesses the network")
+    # imported here: multiprocessing stays out of import dhs_scraper
+    from concurrent.futures import ProcessPoolExecutor
+    nb_workers = nb_workers if nb_workers is not None else os.cpu_count()
+    executor = ProcessPoolExecutor(
+        nb_workers, initializer=init_reparse_worker,
+        initargs=(page_cache_folder, metagrid, {"drop_page_content": drop_page_content})
+    )
+    for pid, seconds, results in map_concurrently(reparse_chunk, iterate_chunks(json_lines, chunk_size), nb_workers, executor=executor):
+        if workers_statistics is not None:
+            statistics = workers_statistics.setdefault(pid, {"nb_articles": 0, "nb_failed": 0, "seconds": 0.0})
+            statistics["nb_articles"] += len(results)
+            statistics["nb_failed"] += sum(1 for _, _, success in results if not success)
+            statistics["seconds"] += seconds
+        for id, json_line, success in results:
+            yield JsonLine(id, json_line)
+
+def reparse_jsonl(jsonl_filepath, output_jsonl_filepath, nb_workers=None, chunk_size=REPARSE_CHUNK_SIZE,
+                    page_cache_folder=None, metagrid="defer", drop_page_content=False, verbose=True):
+    """Re-parses all the articles of jsonl_filepath from their page_content in nb_workers processes, see reparse_json_lines()
+
+    Articles are appended to output_jsonl_filepath (compressed if it ends with .zst or .gz, see stream_to_jsonl())
+    in the order of jsonl_filepath. Articles which fail to parse are written unchanged.
+    page_cache_folder: by default the folder of the page cache set with set_page_cache(), if any
+    verbose: if True, prints the throughput of each worker process
+    Returns the workers statistics: dict pid -> {"nb_articles", "nb_failed", "seconds"}"""
+    if page_cache_folder is None and get_page_cache() is not None:
+        page_cache_folder = get_page_cache().cache_folder
+    workers_statistics = dict()
+    start = perf_counter()
+    stream_to_jsonl(output_jsonl_filepath, reparse_json_lines(
+        iterate_jsonl_lines(jsonl_filepath), nb_workers, chunk_size, page_cache_folder, metagrid, drop_page_content, workers_statistics
+    ))
+    elapsed = perf_counter()-start
+    if verbose:
+        for pid, s in workers_statistics.items():
+            print(f"worker {pid}: {s['nb_articles']} articles in {s['seconds']:.2f}s ({s['nb_articles']/max(s['seconds'], 1e-9):.1f} articles/s), {s['nb_failed']} failures")
+        nb_articles = sum(s["nb_articles"] for s in workers_statistics.values())
+        nb_failed = sum(s["nb_failed"] for s in workers_statistics.values())
+        print(f"dhs_scraper.reparse.reparse_jsonl(): {nb_articles-nb_failed} articles re-parsed in {elapsed:.2f}s ({nb_articles/max(elapsed, 1e-9):.1f} articles/s) by {len(workers_statistics)} workers, {nb_failed} failures written unchanged")
+    return workers_statistics
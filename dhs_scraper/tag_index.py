@@ -0,0 +1,168 @@
+from array import array
+
+from . import json_codec
+from .DhsTag import DhsTag
+
+
+def get_tag_path(tag):
+    """Returns the normalized path of a tag or of a tag prefix: a DhsTag or a str like "Entités politiques/Commune" """
+    tag = tag.tag if isinstance(tag, DhsTag) else tag
+    return " / ".join(l.strip() for l in tag.split("/"))
+
+
+class TagIndex:
+    """Inverted index of the tags of a list of DhsArticle, built in one pass over the articles
+
+    Articles are numbered by their position in the list, each tag and each tag path prefix (all the levels of a tag
+    up to a given level, for example "Entités politiques" for "Entités politiques / Commune") being mapped to the
+    sorted array of the numbers of the articles having it, facet prefixes ("006800") being mapped to tag path prefixes.
+    Queries (get_article_numbers(), union(), intersection(), difference()) return arrays of article numbers,
+    turned to articles with get_articles().
+    Saved to/loaded from a json file with save() and load(), which don't store the articles themselves but their ids.
+    """
+    def __init__(self, articles=None):
+        self.articles = None
+        self.article_ids = []
+        self.tags = dict() # tag -> DhsTag
+        self._article_numbers_by_tag = dict()
+        self._article_numbers_by_path = dict()
+        self._tags_by_path = dict() # normalized path -> tags having it, differing only in spaces around "/"
+        self._paths_by_facet = dict()
+        self._tag_prefixes = dict() # tag -> its path prefixes
+        if articles is not None:
+            self.add_articles(articles)
+
+    def __len__(self):
+        return len(self.article_ids)
+
+    def add_articles(self, articles):
+        """Indexes the tags of articles, numbered after the already indexed ones"""
+        if self.articles is None:
+            if len(self.article_ids)>0:
+                raise Exception("TagIndex.add_articles(): cannot add articles to an index loaded without its articles")
+            self.articles = []
+        for article in articles:
+            self.articles.append(article)
+            self._add_article(article.id, article.tags if "tags" in article.__dict__ else [])
+
+    def _add_article(self, article_id, tags):
+        article_number = len(self.article_ids)
+        self.article_ids.append(article_id)
+        for t in tags:
+            if t.tag not in self.tags:
+                self._add_tag(t)
+            article_numbers = self._article_numbers_by_tag[t.tag]
+            if len(article_numbers)==0 or article_numbers[-1]!=article_number:
+                article_numbers.append(article_number)
+            for path in self._tag_prefixes[t.tag]:
+                article_numbers = self._article_numbers_by_path[path]
+                # articles are added in increasing number order, an article having 2 tags under path is added once
+                if len(article_numbers)==0 or article_numbers[-1]!=article_number:
+                    article_numbers.append(article_number)
+
+    def _add_tag(self, dhs_tag):
+        self.tags[dhs_tag.tag] = dhs_tag
+        self._article_numbers_by_tag[dhs_tag.tag] = array("I")
+        levels = dhs_tag.get_levels()
+        self._tags_by_path.setdefault(" / ".join(levels), []).append(dhs_tag.tag)
+        facet_levels = dhs_tag.get_facet_levels() if dhs_tag.facet else None
+        prefixes = []
+        for i in range(len(levels)):
+            path = " / ".join(levels[0:(i+1)])
+            prefixes.append(path)
+            self._article_numbers_by_path.setdefault(path, array("I"))
+            if facet_levels is not None and i<len(facet_levels):
+                self._paths_by_facet.setdefault(".".join(facet_levels[0:(i+1)]), path)
+        self._tag_prefixes[dhs_tag.tag] = prefixes
+
+    def get_article_numbers(self, tag, descendants=True):
+        """Returns the sorted array of the numbers of the articles having tag
+
+        tag: a DhsTag, a tag path (prefix) like "Entités politiques" or "Entités politiques / Commune", or a facet (prefix)
+        like "006800.009500" as in tag_tree nodes "facet"
+        descendants: if True, articles having a tag under tag (tag being a prefix of their tag) are included,
+        otherwise only articles having exactly tag. Tags are compared by normalized path (see get_tag_path())."""
+        path = self._paths_by_facet.get(tag.strip("."), None) if isinstance(tag, str) and tag.replace(".", "").isdigit() else get_tag_path(tag)
+        if path is None:
+            return array("I")
+        if descendants:
+            return self._article_numbers_by_path.get(path, array("I"))
+        tags = self._tags_by_path.get(path, [])
+        if len(tags)<=1:
+            return self._article_numbers_by_tag[tags[0]] if len(tags)==1 else array("I")
+        return array("I", sorted(set().union(*(self._article_numbers_by_tag[t] for t in tags))))
+
+    def _get_article_numbers_sets(self, tags, descendants):
+        return [
+            set(t) if isinstance(t, array) else set(self.get_article_numbers(t, descendants))
+            for t in tags
+        ]
+
+    def union(self, *tags, descendants=True):
+        """Returns the sorted array of the numbers of the articles having any of tags (DhsTag, paths, facets, or arrays of article numbers)"""
+        return array("I", sorted(set().union(*self._get_article_numbers_sets(tags, descendants))))
+
+    def intersection(self, *tags, descendants=True):
+        """Returns the sorted array of the numbers of the articles having all tags"""
+        if len(tags)==0:
+            return array("I")
+        article_numbers_sets = sorted(self._get_article_numbers_sets(tags, descendants), key=len)
+        return array("I", sorted(article_numbers_sets[0].intersection(*article_numbers_sets[1:])))
+
+    def difference(self, tag, *other_tags, descendants=True):
+        """Returns the sorted array of the numbers of the articles having tag but none of other_tags"""
+        article_numbers_sets = self._get_article_numbers_sets((tag,)+other_tags, descendants)
+        return array("I", sorted(article_numbers_sets[0].difference(*article_numbers_sets[1:])))
+
+    def get_articles(self, article_numbers):
+        """Returns the articles of article_numbers, their ids if the index was loaded without its articles"""
+        if self.articles is None:
+            return [self.article_ids[n] for n in article_numbers]
+        return [self.articles[n] for n in article_numbers]
+
+    def get_articles_per_tag(self):
+        """Returns a list of (DhsTag, articles having the tag), as DhsTag.get_articles_per_tag()"""
+        return [
+            (self.tags[tag], self.get_articles(article_numbers))
+            for tag, article_numbers in self._article_numbers_by_tag.items()
+        ]
+
+    def save(self, filepath):
+        """Saves the index as json to filepath, articles being identified by their id"""
+        json_dict = {
+            "article_ids": self.article_ids,
+            "tags": [
+                dict(self.tags[tag].to_json(as_dict=True), article_numbers=article_numbers.tolist())
+                for tag, article_numbers in self._article_numbers_by_tag.items()
+            ]
+        }
+        with open(filepath, "w") as index_file:
+            index_file.write(json_codec.dumps(json_dict, ensure_ascii=False))
+
+    @staticmethod
+    def load(filepath, articles=None):
+        """Loads a TagIndex saved with save()
+
+        articles: optional, the list of indexed articles in the same order (as returned by get_articles()),
+        otherwise get_articles() returns article ids."""
+        with open(filepath, "r") as index_file:
+            json_dict = json_codec.loads(index_file.read())
+        tag_index = TagIndex()
+        if articles is not None:
+            articles = list(articles)
+            if [a.id for a in articles]!=json_dict["article_ids"]:
+                raise Exception(f"TagIndex.load(): the given articles aren't the ones indexed in {filepath}")
+            tag_index.articles = articles
+        tag_index.article_ids = json_dict["article_ids"]
+        for json_tag in json_dict["tags"]:
+            dhs_tag = DhsTag.from_json(json_tag)
+            tag_index._add_tag(dhs_tag)
+            tag_index._article_numbers_by_tag[dhs_tag.tag] = array("I", json_tag["article_numbers"])
+        # path prefixes arrays: merge of their tags arrays
+        article_numbers_sets_by_path = dict()
+        for tag, article_numbers in tag_index._article_numbers_by_tag.items():
+            for path in tag_index._tag_prefixes[tag]:
+                article_numbers_sets_by_path.setdefault(path, set()).update(article_numbers)
+        for path, article_numbers_set in article_numbers_sets_by_path.items():
+            tag_index._article_numbers_by_path[path] = array("I", sorted(article_numbers_set))
+        return tag_index
@@ -0,0 +1,127 @@
+from itertools import chain
+
+import numpy as np
+
+
+def get_sorted_unique(keys):
+    """Returns the sorted unique values of 1d int array keys (sorts keys in place), faster than np.unique() for int64"""
+    keys.sort()
+    return keys[np.r_[True, keys[1:]!=keys[:-1]]] if len(keys)>0 else keys
+
+
+class CategoryStatistics:
+    """Per-category statistics of the articles of a tag tree, computed on sparse arrays of (node, article) pairs
+
+    Equivalent to tag_tree.compute_nodes_statistics() with stats_articles_by_category_proportions_curry() and
+    stats_aggregator_articles_by_category_proportions(), without holding a set of articles per node and category.
+    Each article of the tree gets a dense index (self.articles[i], one per article id), each node (pre-order
+    numbering, self.nodes[n]) the sorted indices of its articles: own_article_indices[own_offsets[n]:own_offsets[n+1]]
+    for node["articles"], total_article_indices[total_offsets[n]:total_offsets[n+1]] with its descendants'.
+    The total pairs are the own pairs repeated for each ancestor of their node, deduplicated: an article tagged
+    with a node and one of its descendants counts once, as in the sets union. Counts are bincounts of the pairs
+    weighted by category_bools (category x article).
+    Requires tag_tree.add_articles_to_tag_tree() to have set node["articles"].
+    """
+    def __init__(self, tag_tree_root, article_ids_by_category, categories=None):
+        self.categories = list(categories) if categories is not None else list(article_ids_by_category.keys())
+        self.nodes = []
+        parent_numbers = []
+        stack = [(tag_tree_root, -1)]
+        while len(stack)>0:
+            node, parent_number = stack.pop()
+            self.nodes.append(node)
+            parent_numbers.append(parent_number)
+            node_number = len(self.nodes)-1
+            stack.extend((c, node_number) for c in reversed(node.get("children", [])))
+        self.parent_numbers = np.array(parent_numbers, dtype=np.int64)
+        self._node_numbers = {id(node): n for n, node in enumerate(self.nodes)}
+        nb_nodes = len(self.nodes)
+
+        # dense articles indices, by article id: the article of an id is its first occurrence in pre-order
+        nodes_articles = [node.get("articles", []) for node in self.nodes]
+        tree_articles = list(chain.from_iterable(nodes_articles))
+        tree_ids = [a.id for a in tree_articles]
+        article_indices = dict.fromkeys(tree_ids)
+        article_indices = dict(zip(article_indices, range(len(article_indices))))
+        own_article_indices = np.fromiter(map(article_indices.__getitem__, tree_ids), dtype=np.int64, count=len(tree_ids))
+        # indices are given in order of first occurrence: an id occurs first where its index exceeds all the previous ones
+        is_first = own_article_indices>np.r_[-1, np.maximum.accumulate(own_article_indices)[:-1]]
+        self.articles = list(map(tree_articles.__getitem__, np.flatnonzero(is_first).tolist()))
+        node_numbers = np.repeat(np.arange(nb_nodes, dtype=np.int64), [len(articles) for articles in nodes_articles])
+        del nodes_articles, tree_articles, tree_ids, is_first
+        nb_articles = max(len(self.articles), 1)
+        self.category_bools = np.zeros((len(self.categories), len(self.articles)), dtype=bool)
+        for c_index, c in enumerate(self.categories):
+            category_indices = list(map(article_indices.__getitem__, article_indices.keys() & article_ids_by_category[c]))
+            self.category_bools[c_index, category_indices] = True
+        del article_indices
+
+        # own pairs, deduplicated and sorted by node then article as keys node*nb_articles+article
+        own_keys = get_sorted_unique(node_numbers*nb_articles+own_article_indices)
+        del node_numbers, own_article_indices
+        self.own_offsets, self.own_article_indices = self._get_csr(own_keys, nb_nodes, nb_articles)
+
+        # total pairs: each own pair repeated for all the ancestors of its node, one tree level up at a time,
+        # deduplicated at each level (an article of several siblings goes up once)
+        keys = own_keys
+        total_keys = [own_keys]
+        while len(keys)>0:
+            pair_nodes = self.parent_numbers[keys//nb_articles]
+            is_in_tree = pair_nodes>=0
+            keys = get_sorted_unique(pair_nodes[is_in_tree]*nb_articles+keys[is_in_tree]%nb_articles)
+            total_keys.append(keys)
+        del keys
+        self.total_offsets, self.total_article_indices = self._get_csr(get_sorted_unique(np.concatenate(total_keys)), nb_nodes, nb_articles)
+
+        self.own_counts = self._get_counts(self.own_offsets, self.own_article_indices)
+        self.total_counts = self._get_counts(self.total_offsets, self.total_article_indices)
+
+    @staticmethod
+    def _get_csr(keys, nb_nodes, nb_articles):
+        """Returns (offsets, article indices) of sorted keys node*nb_articles+article"""
+        offsets = np.r_[0, np.cumsum(np.bincount(keys//nb_articles, minlength=nb_nodes))].astype(np.int64)
+        return offsets, keys%nb_articles
+
+    def _get_counts(self, offsets, article_indices):
+        """Returns the (node x category) counts of the articles article_indices[offsets[n]:offsets[n+1]] of each node n"""
+        node_numbers = np.repeat(np.arange(len(self.nodes)), np.diff(offsets))
+        counts = np.zeros((len(self.nodes), len(self.categories)), dtype=np.int64)
+        for c_index in range(len(self.categories)):
+            counts[:, c_index] = np.bincount(
+                node_numbers, weights=self.category_bools[c_index][article_indices], minlength=len(self.nodes)
+            ).astype(np.int64)
+        return counts
+
+    def get_node_number(self, node):
+        return self._node_numbers[id(node)]
+
+    def get_counts(self, node, total=True):
+        """Returns a dict category -> nb of articles of node (with its descendants' if total) in category"""
+        counts = (self.total_counts if total else self.own_counts)[self.get_node_number(node)]
+        return dict(zip(self.categories, counts.tolist()))
+
+    def get_articles(self, node, category, total=True):
+        """Returns the set of articles of node (with its descendants' if total) in category"""
+        node_number = self.get_node_number(node)
+        c_index = self.categories.index(category)
+        offsets, article_indices = (self.total_offsets, self.total_article_indices) if total else (self.own_offsets, self.own_article_indices)
+        article_indices = article_indices[offsets[node_number]:offsets[node_number+1]]
+        article_indices = article_indices[self.category_bools[c_index][article_indices]]
+        return set(self.articles[i] for i in article_indices)
+
+    def get_articles_sets(self, node, total=True):
+        """Returns a dict category -> set of articles, as stats_articles_by_category_proportions"""
+        return {c: self.get_articles(node, c, total) for c in self.categories}
+
+    def set_nodes_statistics(self, as_sets=False):
+        """Sets node "statistics", "children_statistics" and "total_statistics" as tag_tree.compute_nodes_statistics()
+
+        Values are dict category -> count, or dict category -> set of articles if as_sets (same as computed
+        with stats_articles_by_category_proportions_curry()). Returns the root total statistics."""
+        get_statistics = self.get_articles_sets if as_sets else self.get_counts
+        total_statistics = [get_statistics(node) for node in self.nodes]
+        for node_number, node in enumerate(self.nodes):
+            node["statistics"] = get_statistics(node, total=False)
+            node["total_statistics"] = total_statistics[node_number]
+            node["children_statistics"] = [total_statistics[self.get_node_number(c)] for c in node.get("children", [])]
+        return total_statistics[0]
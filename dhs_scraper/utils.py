@@ -1,6 +1,10 @@
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from sys import intern
 
-from lxml.etree import iselement
+from .compressed_jsonl import get_compression, compress_block
+from .jsonl_index import JsonlIndex
 
 def lxml_depth_first_iterator(element, iteration_criterion):
     """iterate depth-first over an lxml element, yielding elements according to iteration_criterion()
@@ -10,6 +14,7 @@ def lxml_depth_first_iterator(element, iteration_criterion):
     yields:
     - all descendants d of element for which iteration_criterion(d) returns True
     """
+    from lxml.etree import iselement
     for node in element.xpath("child::node()"):
         if iteration_criterion(node):
             yield node
@@ -18,12 +23,62 @@ def lxml_depth_first_iterator(element, iteration_criterion):
                 yield n
 
 
+def get_text_and_links(element, link_tag="a"):
+    """Returns (text, links) of an lxml element in a single non-recursive pass over its subtree
+
+    text is equal to element.text_content()
+    links is a list of (start, end, link_element) for each outermost link_tag descendant of element,
+    start and end being the offsets of link_element.text_content() in text.
+    Same results as iterating over lxml_depth_first_iterator(element, is_text_or_link) but without
+    recursion nor one XPath call per node.
+    """
+    texts = []
+    length = 0
+    links = []
+    link = None # (link element, start) of the link being walked through
+    if element.text:
+        texts.append(element.text)
+        length += len(element.text)
+    stack = [(element, iter(element))]
+    while len(stack)>0:
+        node, children = stack[-1]
+        child = next(children, None)
+        if child is None:
+            # end of node
+            stack.pop()
+            if link is not None and link[0] is node:
+                links.append((link[1], length, node))
+                link = None
+            if node is not element and node.tail:
+                texts.append(node.tail)
+                length += len(node.tail)
+        elif isinstance(child.tag, str):
+            # start of child
+            if link is None and child.tag==link_tag:
+                link = (child, length)
+            if child.text:
+                texts.append(child.text)
+                length += len(child.text)
+            stack.append((child, iter(child)))
+        elif child.tail:
+            # comments and processing instructions: only their tail is part of the text
+            texts.append(child.tail)
+            length += len(child.tail)
+    return "".join(texts), links
+
+
 def is_text_or_link(node):
+    from lxml.etree import iselement
     if (not iselement(node)) or (node.tag=="a"):
         return True
     return False
 
 
+def intern_str(s):
+    """Returns the interned s if s is a str, s otherwise: equal interned strings share one object"""
+    return intern(s) if type(s) is str else s
+
+
 def get_attributes_string(class_name, object_dict):
     """Unimportant utility function to format __str__() and __repr()"""
     return f"""{class_name}({', '.join([
@@ -32,19 +87,98 @@ def get_attributes_string(class_name, object_dict):
     ])})"""
 
 
-def stream_to_jsonl(jsonl_filepath, jsonable_iterable, buffer_size=100, **to_json_kwargs):
+def map_concurrently(func, iterable, nb_workers, keep_order=True, max_pending=None, executor=None):
+    """Applies func to each item of iterable in a pool of nb_workers threads, yields the results
+
+    At most max_pending items (default: 2*nb_workers) are submitted ahead of the consumer,
+    so that iterable is consumed lazily.
+    keep_order: if True, results are yielded in the order of iterable, otherwise as soon as they are ready
+    executor: if given, used instead of a pool of threads (for example a ProcessPoolExecutor of nb_workers processes),
+    it is shut down at the end as the thread pool would be
+    """
+    if max_pending is None:
+        max_pending = 2*nb_workers
+    if executor is None:
+        executor = ThreadPoolExecutor(nb_workers)
+    pending = deque() if keep_order else set()
+    def pop_results():
+        if keep_order:
+            yield pending.popleft().result()
+        else:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                yield future.result()
+    try:
+        for item in iterable:
+            future = executor.submit(func, item)
+            if keep_order:
+                pending.append(future)
+            else:
+                pending.add(future)
+            while len(pending)>=max_pending:
+                yield from pop_results()
+        while len(pending)>0:
+            yield from pop_results()
+    finally:
+        # if the consumer stops early, do not run the items still waiting
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+class JsonLine:
+    """An already serialized json line with its id, written as is by stream_to_jsonl()"""
+    __slots__ = ("id", "line")
+    def __init__(self, id, line):
+        self.id = id
+        self.line = line
+    def to_json(self, *args, **kwargs):
+        return self.line
+
+
+def stream_to_jsonl(jsonl_filepath, jsonable_iterable, buffer_size=100, journal=None, update_index=True, **to_json_kwargs):
     """Saves jsonables to a jsonl file from an iterable/generator
     
     A jsonable is an object with a to_json() method
     Useful to stream scraped articles to a jsonl on-the-fly and not keep them in memory.
-    Uses a buffer to avoid disk usage"""
+    Uses a buffer to avoid disk usage
+    If journal (a CrawlJournal) is given, the ids of the jsonables are marked done in it once written to the file
+    If update_index and the jsonl has a JsonlIndex, the index is kept up-to-date with the appended lines
+    If jsonl_filepath ends with .zst or .gz, each buffer is written as an independently compressed block (see compressed_jsonl.py)"""
     buffer = [None]*buffer_size
-    with open(jsonl_filepath, "a") as jsonl_file:
+    ids_buffer = [None]*buffer_size
+    compression = get_compression(jsonl_filepath)
+    index = JsonlIndex(jsonl_filepath) if update_index and JsonlIndex.exists(jsonl_filepath) else None
+    def write(nb_items):
+        lines = [line.encode() for line in buffer[0:nb_items]]
+        data = b"\n".join(lines)+b"\n"
+        block_offset = jsonl_file.tell()
+        if compression is not None:
+            data = compress_block(data, compression)
+        jsonl_file.write(data)
+        if journal is not None or index is not None:
+            jsonl_file.flush()
+        if index is not None:
+            ids_offsets_lengths = []
+            offset = 0 if compression is not None else block_offset
+            for id, line in zip(ids_buffer, lines):
+                if compression is not None:
+                    ids_offsets_lengths.append((id, offset, len(line), block_offset, len(data)))
+                else:
+                    ids_offsets_lengths.append((id, offset, len(line)))
+                offset += len(line)+1
+            index.add_lines(ids_offsets_lengths)
+        if journal is not None:
+            journal.mark_done(ids_buffer[0:nb_items])
+    with open(jsonl_filepath, "ab") as jsonl_file:
         empty=True
         for i, a in enumerate(jsonable_iterable):
             empty=False
             if i!=0 and i%buffer_size==0:
-                jsonl_file.write("\n".join(buffer)+"\n")
+                write(buffer_size)
             buffer[i%buffer_size]= a.to_json(ensure_ascii=False, **to_json_kwargs)
+            # "" for jsonables without id, as JsonlIndex.update() does for lines without id
+            ids_buffer[i%buffer_size]= getattr(a, "id", None) or ""
         if not empty:
-            jsonl_file.write("\n".join(buffer[0:((i%buffer_size)+1)])+"\n")
\ No newline at end of file
+            write((i%buffer_size)+1)
@@ -1,6 +1,9 @@
 from __future__ import annotations
 from csv import DictReader
+import json
+import os
 from os import path
+import sqlite3
 from typing import TYPE_CHECKING
 from warnings import warn
 
@@ -17,6 +20,13 @@ LOADED_WIKIDATA_LINKS_CSVS = set()
 WIKIDATA_LINKS = dict()
 
 WIKIDATA_URL_KEY = "item"
+WIKIPEDIA_LANGUAGES = ["fr", "de", "it", "en"] # languages of the wikipedia page titles in the csv ("name"+language columns)
+
+WIKIDATA_INDEX_QUERY_BATCH_SIZE = 500 # nb of dhsids per sqlite query, below sqlite's limit of query parameters
+WIKIDATA_ENRICHMENT_BATCH_SIZE = 1000 # nb of articles per batch of add_wikidata_wikipedia_to_articles()
+
+# wikidata links file -> (pid, WikidataLinksIndex or None if no usable index), see get_wikidata_links_index()
+OPEN_WIKIDATA_LINKS_INDEXES = dict()
 
 SPARQL_DOWNLOAD_DISCLAIMER = \
     f"A prerequisite is to have manually downloaded the result of the sparql query in file '{WIKIDATA_QUERY_FILE}' at 'https://query.wikidata.org/' " + \
@@ -42,6 +52,9 @@ def load_wikidata_links(wikidata_links_file = DEFAULT_WIKIDATA_LINKS_FILE):
     return WIKIDATA_LINKS
 
 def get_wikidata_links_from_dhs_id(dhs_id, wikidata_links_file = DEFAULT_WIKIDATA_LINKS_FILE):
+    wikidata_links_index = get_wikidata_links_index(wikidata_links_file)
+    if wikidata_links_index is not None:
+        return wikidata_links_index.get_wiki_links(dhs_id)
     load_wikidata_links(wikidata_links_file)
     wiki_links = WIKIDATA_LINKS.get(dhs_id)
     if wiki_links is not None:
@@ -49,9 +62,10 @@ def get_wikidata_links_from_dhs_id(dhs_id, wikidata_links_file = DEFAULT_WIKIDAT
     else:
         return []
 
-def get_wikidata_main_link_from_dhs_id(dhs_id, language:str, wikidata_links_file = DEFAULT_WIKIDATA_LINKS_FILE):
-    load_wikidata_links(wikidata_links_file)
-    wiki_links = get_wikidata_links_from_dhs_id(dhs_id)
+def get_main_link(wiki_links, language:str):
+    """Returns (wikidata url, wikipedia page title) of the first of wiki_links having a wikipedia page title in language
+
+    (wikidata url of the last of wiki_links, None) if none has one, (None, None) if wiki_links is empty"""
     wikipedia_page_title_key = "name"+language
     wd_url_wk_title = (None,None)
     for l in wiki_links:
@@ -62,25 +76,230 @@ def get_wikidata_main_link_from_dhs_id(dhs_id, language:str, wikidata_links_file
             wd_url_wk_title = (l[WIKIDATA_URL_KEY], None)
     return wd_url_wk_title
 
+def get_wikidata_main_link_from_dhs_id(dhs_id, language:str, wikidata_links_file = DEFAULT_WIKIDATA_LINKS_FILE):
+    wikidata_links_index = get_wikidata_links_index(wikidata_links_file)
+    if wikidata_links_index is not None:
+        return wikidata_links_index.get_main_link(dhs_id, language)
+    return get_main_link(get_wikidata_links_from_dhs_id(dhs_id, wikidata_links_file), language)
+
+
+# =========================== COMPILED INDEX ===========================
+
+def get_wikidata_links_index_filepath(wikidata_links_file = DEFAULT_WIKIDATA_LINKS_FILE):
+    return wikidata_links_file+".sqlite"
+
+def get_csv_signature(wikidata_links_file):
+    """Returns "size:mtime" of the csv, None if it doesn't exist"""
+    if not path.exists(wikidata_links_file):
+        return None
+    stat = os.stat(wikidata_links_file)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+def compile_wikidata_links(wikidata_links_file = DEFAULT_WIKIDATA_LINKS_FILE, index_filepath = None):
+    """Compiles the wikidata links csv into a sqlite index, returns the index filepath (default wikidata_links_file+".sqlite")
+
+    The index stores the csv rows of each dhsid and precomputed (wikidata url, wikipedia page title) main link
+    per (dhsid, language). Once compiled, get_wikidata_links_from_dhs_id() and get_wikidata_main_link_from_dhs_id()
+    use it instead of loading the csv, as long as the csv doesn't change (recompile after downloading a new csv).
+    Processes query the same file (shared through the OS page cache) without loading it.\n\n""" + SPARQL_DOWNLOAD_DISCLAIMER
+    if not path.exists(wikidata_links_file):
+        raise Exception(
+            f"dhs_scraper.wikidata.compile_wikidata_links() wikidata_links_file at location '{wikidata_links_file}' not found.\n"+
+            SPARQL_DOWNLOAD_DISCLAIMER
+        )
+    index_filepath = index_filepath if index_filepath is not None else get_wikidata_links_index_filepath(wikidata_links_file)
+    csv_signature = get_csv_signature(wikidata_links_file)
+    wiki_links_by_dhsid = dict()
+    with open(wikidata_links_file) as f:
+        reader = DictReader(f)
+        for r in reader:
+            wiki_links_by_dhsid.setdefault(r["dhsid"], []).append(r)
+        columns = reader.fieldnames
+    # written to a temporary file then renamed: processes never open a partial index
+    tmp_filepath = f"{index_filepath}.{os.getpid()}.tmp"
+    if path.exists(tmp_filepath):
+        os.remove(tmp_filepath)
+    connection = sqlite3.connect(tmp_filepath)
+    try:
+        connection.execute("CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT)")
+        connection.execute("CREATE TABLE wiki_links (dhsid TEXT PRIMARY KEY, rows TEXT)")
+        connection.execute("CREATE TABLE main_links (dhsid TEXT, language TEXT, wikidata_url TEXT, wikipedia_page_title TEXT, PRIMARY KEY (dhsid, language)) WITHOUT ROWID")
+        connection.executemany("INSERT INTO metadata VALUES (?, ?)", [
+            ("csv_signature", csv_signature), ("columns", json.dumps(columns, ensure_ascii=False))
+        ])
+        # rows as json lists of values, in columns order
+        connection.executemany("INSERT INTO wiki_links VALUES (?, ?)", (
+            (dhsid, json.dumps([[r[c] for c in columns] for r in wiki_links], ensure_ascii=False, separators=(",", ":")))
+            for dhsid, wiki_links in wiki_links_by_dhsid.items()
+        ))
+        connection.executemany("INSERT INTO main_links VALUES (?, ?, ?, ?)", (
+            (dhsid, language)+get_main_link(wiki_links, language)
+            for dhsid, wiki_links in wiki_links_by_dhsid.items() for language in WIKIPEDIA_LANGUAGES
+        ))
+        connection.commit()
+    finally:
+        connection.close()
+    os.replace(tmp_filepath, index_filepath)
+    OPEN_WIKIDATA_LINKS_INDEXES.pop(wikidata_links_file, None)
+    return index_filepath
+
+
+class WikidataLinksIndex:
+    """Read-only access to a wikidata links index compiled by compile_wikidata_links()"""
+    def __init__(self, index_filepath):
+        self.index_filepath = index_filepath
+        # read-only, usable from several threads: sqlite connections are serialized
+        self.connection = sqlite3.connect(f"file:{index_filepath}?mode=ro", uri=True, check_same_thread=False)
+        metadata = dict(self.connection.execute("SELECT key, value FROM metadata"))
+        self.csv_signature = metadata["csv_signature"]
+        self.columns = json.loads(metadata["columns"])
+
+    def get_wiki_links(self, dhs_id):
+        """Returns the list of csv rows (dicts) of dhs_id, as get_wikidata_links_from_dhs_id()"""
+        row = self.connection.execute("SELECT rows FROM wiki_links WHERE dhsid=?", (dhs_id,)).fetchone()
+        return [dict(zip(self.columns, values)) for values in json.loads(row[0])] if row is not None else []
+
+    def get_wiki_links_batch(self, dhs_ids):
+        """Returns a dict dhs_id -> list of csv rows for the given dhs_ids, queried WIKIDATA_INDEX_QUERY_BATCH_SIZE at a time"""
+        dhs_ids = list(dict.fromkeys(dhs_ids))
+        wiki_links_by_dhsid = {dhs_id: [] for dhs_id in dhs_ids}
+        for start in range(0, len(dhs_ids), WIKIDATA_INDEX_QUERY_BATCH_SIZE):
+            batch = dhs_ids[start:(start+WIKIDATA_INDEX_QUERY_BATCH_SIZE)]
+            rows = self.connection.execute(f"SELECT dhsid, rows FROM wiki_links WHERE dhsid IN ({','.join('?'*len(batch))})", batch)
+            for dhs_id, json_rows in rows:
+                wiki_links_by_dhsid[dhs_id] = [dict(zip(self.columns, values)) for values in json.loads(json_rows)]
+        return wiki_links_by_dhsid
+
+    def get_main_link(self, dhs_id, language:str):
+        """Returns (wikidata url, wikipedia page title) of dhs_id in language, as get_wikidata_main_link_from_dhs_id()"""
+        if language not in WIKIPEDIA_LANGUAGES:
+            return get_main_link(self.get_wiki_links(dhs_id), language)
+        row = self.connection.execute(
+            "SELECT wikidata_url, wikipedia_page_title FROM main_links WHERE dhsid=? AND language=?", (dhs_id, language)
+        ).fetchone()
+        return tuple(row) if row is not None else (None, None)
+
+    def close(self):
+        self.connection.close()
+
+def get_wikidata_links_index(wikidata_links_file = DEFAULT_WIKIDATA_LINKS_FILE):
+    """Returns the WikidataLinksIndex compiled from wikidata_links_file, None if not compiled or the csv changed since
+
+    The index is opened once per process (connections aren't shared with forked processes)."""
+    pid, wikidata_links_index = OPEN_WIKIDATA_LINKS_INDEXES.get(wikidata_links_file, (None, None))
+    if pid==os.getpid():
+        return wikidata_links_index
+    wikidata_links_index = None
+    index_filepath = get_wikidata_links_index_filepath(wikidata_links_file)
+    if path.exists(index_filepath):
+        wikidata_links_index = WikidataLinksIndex(index_filepath)
+        csv_signature = get_csv_signature(wikidata_links_file)
+        if csv_signature is not None and csv_signature!=wikidata_links_index.csv_signature:
+            warn(f"dhs_scraper.wikidata.get_wikidata_links_index() '{wikidata_links_file}' changed since it was compiled, "+
+                "not using its index: recompile it with compile_wikidata_links()")
+            wikidata_links_index.close()
+            wikidata_links_index = None
+    OPEN_WIKIDATA_LINKS_INDEXES[wikidata_links_file] = (os.getpid(), wikidata_links_index)
+    return wikidata_links_index
+
 def add_wikidata_wikipedia_to_text_links(dhs_article:DhsArticle, wikidata_links_file = DEFAULT_WIKIDATA_LINKS_FILE):
     """adds "wiki_links" attribute to dhs_article.text_links, also adds one as main "wikidata_url" and "wikipedia_page_title".
     
     Adds all the wikidata entities that have a wikidata P902 property pointing to the given dhs_id to "wiki_links".
     For the "wikidata_url" and "wikipedia_page_title" attributes, takes the first entries that has a wikipedia_page_title in given language.
+    To enrich many articles, use add_wikidata_wikipedia_to_articles() which resolves each linked dhsid once.
     """
-    load_wikidata_links(wikidata_links_file)
     if "text_links" in dhs_article.__dict__:
-        for block_links in dhs_article.text_links:
-            for link in block_links:
-                lng, dhsid, v = dhs_article.get_language_id_version_from_url(link["href"])
-                wiki_links = get_wikidata_links_from_dhs_id(dhsid)
-                link["wiki_links"] = wiki_links
-                wikidata_url, wikipedia_page_title = get_wikidata_main_link_from_dhs_id(dhsid, dhs_article.language)
-                link["wikidata_url"] = wikidata_url
-                link["wikipedia_page_title"] = wikipedia_page_title
-
+        WikidataLinksResolver(wikidata_links_file).add_to_text_links([dhs_article])
     else:
         warn("dhs_scraper.wikidata.dhs_article_add_wikidata_wikipedia_links() trying to add links to a DhsArticle having no text_links: skipping.")
     return dhs_article
 
 
+class WikidataLinksResolver:
+    """Resolves and memoizes the wikidata links of the articles linked from text_links, see add_wikidata_wikipedia_to_articles()
+
+    Each distinct link href is parsed once, the wiki links of each distinct dhsid are loaded once (in batched queries
+    if the wikidata links csv is compiled, see compile_wikidata_links()) and its main link computed once per language."""
+    def __init__(self, wikidata_links_file = DEFAULT_WIKIDATA_LINKS_FILE):
+        self.wikidata_links_file = wikidata_links_file
+        self.dhsid_by_href = dict()
+        self.wiki_links_by_dhsid = dict()
+        self.main_link_by_dhsid_language = dict()
+
+    def resolve_wiki_links(self, dhs_ids):
+        """Loads the wiki links of the not yet resolved dhs_ids"""
+        missing_dhs_ids = [dhs_id for dhs_id in set(dhs_ids) if dhs_id not in self.wiki_links_by_dhsid]
+        if len(missing_dhs_ids)==0:
+            return
+        wikidata_links_index = get_wikidata_links_index(self.wikidata_links_file)
+        if wikidata_links_index is not None:
+            self.wiki_links_by_dhsid.update(wikidata_links_index.get_wiki_links_batch(d for d in missing_dhs_ids if d is not None))
+        else:
+            wikidata_links = load_wikidata_links(self.wikidata_links_file)
+            self.wiki_links_by_dhsid.update((d, wikidata_links.get(d, [])) for d in missing_dhs_ids)
+        self.wiki_links_by_dhsid.setdefault(None, [])
+
+    def get_main_link(self, dhs_id, language:str):
+        main_link = self.main_link_by_dhsid_language.get((dhs_id, language))
+        if main_link is None:
+            main_link = get_main_link(self.wiki_links_by_dhsid[dhs_id], language)
+            self.main_link_by_dhsid_language[(dhs_id, language)] = main_link
+        return main_link
+
+    def add_to_text_links(self, dhs_articles):
+        """Adds "wiki_links", "wikidata_url" and "wikipedia_page_title" to the text_links of dhs_articles (having text_links)"""
+        links_dhsids = []
+        for dhs_article in dhs_articles:
+            for block_links in dhs_article.text_links:
+                for link in block_links:
+                    href = link["href"]
+                    if href not in self.dhsid_by_href:
+                        self.dhsid_by_href[href] = dhs_article.get_language_id_version_from_url(href)[1]
+                    links_dhsids.append(self.dhsid_by_href[href])
+        self.resolve_wiki_links(links_dhsids)
+        for dhs_article in dhs_articles:
+            for block_links in dhs_article.text_links:
+                for link in block_links:
+                    dhsid = self.dhsid_by_href[link["href"]]
+                    link["wiki_links"] = self.wiki_links_by_dhsid[dhsid]
+                    link["wikidata_url"], link["wikipedia_page_title"] = self.get_main_link(dhsid, dhs_article.language)
+
+    def add_to_articles(self, dhs_articles):
+        """Adds wiki_links, wikidata_url and wikipedia_page_title of dhs_articles themselves"""
+        self.resolve_wiki_links(dhs_article.id for dhs_article in dhs_articles)
+        for dhs_article in dhs_articles:
+            dhs_article.wiki_links = self.wiki_links_by_dhsid[dhs_article.id]
+            dhs_article.wikidata_url, dhs_article.wikipedia_page_title = self.get_main_link(dhs_article.id, dhs_article.language)
+
+def add_wikidata_wikipedia_to_articles(dhs_articles, wikidata_links_file = DEFAULT_WIKIDATA_LINKS_FILE,
+    add_articles_links=False, batch_size=WIKIDATA_ENRICHMENT_BATCH_SIZE):
+    """yields the DhsArticle of iterable dhs_articles with wikidata and wikipedia links added to their text_links
+
+    Same result as DhsArticle.add_wikidata_wikipedia_to_text_links() on each article, but resolves the linked articles
+    of batch_size articles at a time, each distinct linked dhsid being resolved once for the whole corpus.
+    Streaming: can be used between DhsArticle.load_articles_from_jsonl() and stream_to_jsonl(), for example:
+    stream_to_jsonl("enriched.jsonl", add_wikidata_wikipedia_to_articles(DhsArticle.load_articles_from_jsonl("articles.jsonl")))
+    add_articles_links: if True, also adds the articles' own links (DhsArticle.add_wikidata_url_wikipedia_page_title())
+    Articles without text_links or whose text_links are already enriched are yielded unchanged.\n\n""" + SPARQL_DOWNLOAD_DISCLAIMER
+    resolver = WikidataLinksResolver(wikidata_links_file)
+    def enrich(batch):
+        to_enrich = [
+            a for a in batch
+            if "text_links" in a.__dict__ and not ("added_wikidata_wikipedia_to_text_links" in a.__dict__ and a.added_wikidata_wikipedia_to_text_links)
+        ]
+        resolver.add_to_text_links(to_enrich)
+        for a in to_enrich:
+            a.added_wikidata_wikipedia_to_text_links = True
+        if add_articles_links:
+            resolver.add_to_articles(batch)
+    batch = []
+    for dhs_article in dhs_articles:
+        batch.append(dhs_article)
+        if len(batch)>=batch_size:
+            enrich(batch)
+            yield from batch
+            batch = []
+    if len(batch)>0:
+        enrich(batch)
+        yield from batch
@@ -58,6 +58,14 @@ if georges.is_person():
 
 # %%
 
+# Keep downloaded pages and metagrid links in a compressed on-disk cache (here at most 2GB, kept 30 days):
+# parsing an article again later doesn't download it again.
+# With offline=True, pages are only read from the cache and a missing page raises an Exception.
+from dhs_scraper import PageCache, set_page_cache
+set_page_cache(PageCache("dhs_page_cache", max_size_bytes=2*1024**3, max_age_seconds=30*24*3600))
+
+# %%
+
 # Do a naïve search in the DHS, here for "bronschhofen".
 # You can give a single string or a list of strings
 bronschhofen_articles_search = list(DhsArticle.search_for_articles(
@@ -75,6 +83,29 @@ ecclesiastic_entries = list(DhsArticle.scrape_articles_from_search_url(
 
 # %%
 
+# Downloading and parsing articles concurrently: 8 threads share a pool of kept-alive connections
+# and never send more than 5 requests per second in total
+ecclesiastic_entries_parsed = list(DhsArticle.scrape_articles_from_search_url(
+    "https://hls-dhs-dss.ch/fr/search/category?text=*&sort=score&sortOrder=desc&collapsed=true&r=1&rows=20&f_hls.lexicofacet_string=1%2F006800.009500.&firstIndex=",
+    parse_articles=True,
+    nb_workers=8,
+    max_requests_per_second=5
+))
+
+# %%
+
+# Metagrid links come from another server (api.metagrid.ch): parse articles without waiting for them
+# (metagrid="defer") and fetch them afterwards concurrently, each metagrid id once, at most 10 requests per second
+from dhs_scraper import add_metagrid_links, set_metagrid_max_requests_per_second
+set_metagrid_max_requests_per_second(10)
+ecclesiastic_entries_parsed = list(add_metagrid_links(DhsArticle.scrape_articles_from_search_url(
+    "https://hls-dhs-dss.ch/fr/search/category?text=*&sort=score&sortOrder=desc&collapsed=true&r=1&rows=20&f_hls.lexicofacet_string=1%2F006800.009500.&firstIndex=",
+    parse_articles=True,
+    metagrid="defer"
+)))
+
+# %%
+
 # Download and parse all the article's elements for the bronschhofen articles
 for a in bronschhofen_articles_search:
     a.parse_article() 
@@ -91,12 +122,30 @@ instruments_craftsmen = stream_to_jsonl(instruments_craftsmen_file,DhsArticle.sc
 # Load articles back from a jsonl file
 jazzpeople_file = "jazzpeople.jsonl"
 jazzpeople = DhsArticle.load_articles_from_jsonl(jazzpeople_file)
+# lazy=True only decodes the properties of articles when accessed: faster to go through a large jsonl
+jazzpeople_ids = [a.id for a in DhsArticle.load_articles_from_jsonl(jazzpeople_file, lazy=True)]
+
+# %%
+
+# Re-parse a jsonl saved with the pages' content (for example after a parser update), without network,
+# spread over all cores, to a new jsonl in the same order.
+# Articles need their page_content: parsed articles keep it and stream_to_jsonl() saves it by default.
+if False:
+    from dhs_scraper import reparse_jsonl
+    instruments_craftsmen_pages_file = "instruments_craftsmen_pages.jsonl"
+    stream_to_jsonl(instruments_craftsmen_pages_file, DhsArticle.scrape_articles_from_search_url(
+        "https://hls-dhs-dss.ch/fr/search/category?text=*&sort=score&sortOrder=desc&collapsed=true&r=1&rows=20&f_hls.lexicofacet_string=3%2F000100.132500.134600.135000.&firstIndex=",
+        parse_articles=True
+    ))
+    reparse_jsonl(instruments_craftsmen_pages_file, "instruments_craftsmen_reparsed.jsonl")
 
 # %%
 
 # Scrape the whole french DHS and stream the articles on-the-fly to a jsonl file
 # If the output jsonl file already contains some articles, makes sure no duplicates are taken
 # The `jsonl_articles_content_file` file must already exist.
+# Name it f"dhs_all_articles_{language}.jsonl.zst" (requires zstandard) or ".jsonl.gz" to write it block-compressed,
+# all the jsonl functions read compressed jsonl transparently.
 if False:
     language="fr"
     jsonl_articles_content_file = f"dhs_all_articles_{language}.jsonl"
@@ -113,3 +162,64 @@ if False:
         buffer_size=100
     )
 
+
+# %%
+
+# Same as above, resumable: the journal next to the jsonl records the articles written and the completed search pages.
+# Relaunched after an interruption, the crawl restarts at the right search page without re-reading the jsonl.
+if False:
+    from dhs_scraper import CrawlJournal
+    journal = CrawlJournal.for_jsonl(jsonl_articles_content_file)
+    stream_to_jsonl(
+        jsonl_articles_content_file,
+        DhsArticle.scrape_all_articles(language=language, force_language=language, journal=journal),
+        buffer_size=100,
+        journal=journal
+    )
+    # articles whose parsing failed can be retried later
+    stream_to_jsonl(jsonl_articles_content_file, DhsArticle.retry_failed_articles(journal), journal=journal)
+
+# %%
+
+# Same as above but crawling all alphabet letters concurrently, sharing one client capped at 10 requests per second.
+# crawl_all_articles() is the async generator version (to be used with "async for")
+if False:
+    from dhs_scraper import crawl_all_articles_sync
+    stream_to_jsonl(
+        jsonl_articles_content_file,
+        crawl_all_articles_sync(
+            language=language,
+            force_language = language,
+            already_visited_ids = already_visited_ids_content,
+            max_requests_per_second=10
+        ),
+        buffer_size=100
+    )
+
+# %%
+
+# Update the scraped corpus later: only the articles new or whose version changed since are downloaded,
+# to a delta jsonl which is then merged into the corpus (changed articles replaced in place, new ones appended)
+if False:
+    from dhs_scraper import CorpusVersions, merge_delta
+    corpus_versions = CorpusVersions(jsonl_articles_content_file)
+    delta_file = f"dhs_all_articles_{language}_delta.jsonl"
+    stream_to_jsonl(
+        delta_file,
+        DhsArticle.scrape_all_articles(language=language, force_language=language, parse_articles=True, corpus_versions=corpus_versions)
+    )
+    corpus_versions.print_statistics()
+    merge_delta(jsonl_articles_content_file, delta_file)
+
+# %%
+
+# Convert the scraped corpus to parquet (requires pyarrow) to load only some properties of articles,
+# without decoding their text nor page content. ids/languages/versions filters skip non-matching row groups
+if False:
+    from dhs_scraper import jsonl_to_parquet, load_articles_from_parquet, load_parquet_table
+    parquet_articles_content_file = jsonl_articles_content_file.replace(".jsonl", ".parquet")
+    jsonl_to_parquet(jsonl_articles_content_file, parquet_articles_content_file)
+    # is_person() reads bref, which must be among the loaded columns
+    people = [a for a in load_articles_from_parquet(parquet_articles_content_file, columns=["title", "tags", "birth_date", "bref"]) if a.is_person()]
+    # or directly as a pandas DataFrame
+    df = load_parquet_table(parquet_articles_content_file, columns=["id", "title", "birth_date"], ids=["020594", "011940"]).to_pandas()
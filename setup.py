@@ -11,8 +11,14 @@ setup(
     install_requires=[
         'requests>=2.22.0',
         'lxml>=4.5.0',
-        'pandas>=1.3.3'
+        'numpy>=1.17.0'
     ],
+    extras_require={
+        'zstd': ['zstandard'], # .zst compressed jsonl
+        'orjson': ['orjson'], # faster json codec
+        'parquet': ['pyarrow'], # columnar storage
+        'pandas': ['pandas>=1.3.3'] # parquet tables .to_pandas(), legacy benchmarks
+    },
     setup_requires=['wheel'],
     classifiers=[
         'Intended Audience :: Science/Research',